@@ -17,6 +17,8 @@
 # Email mccrea.engineering@gmail.com for questions, comments, or to report bugs.
 
 
+from functools import lru_cache
+
 color_table = {
     "snow": (255, 250, 250),
     "ghost white": (248, 248, 255),
@@ -775,6 +777,18 @@ color_table = {
 
 class ColorPalette:
 
+    @classmethod
+    @lru_cache(maxsize=None)
+    def rgba(cls, color_string, alpha):
+        """
+        Resolves a color to its RGBA components, which are cached, so that every color is only looked up once
+        :param color_string: String specifying the color
+        :param alpha: The alpha value of the color, the color is opaque if it is not specified
+        :return: Tuple of the red, green, blue and alpha components between 0 and 1
+        """
+        red, green, blue = [c / 255.0 for c in color_table[color_string]]
+        return red, green, blue, alpha if alpha else 1.0
+
     @classmethod
     def dab(cls, cairo_context, color_string, alpha):
         """
@@ -17,13 +17,56 @@
 # Email mccrea.engineering@gmail.com for questions, comments, or to report bugs.
 
 
+import numpy as np
+
+from gui.ColorPalette import ColorPalette
+
+# Types of the primitives of a frame
+POLYGONS = 0
+LINES = 1
+CIRCLES = 2
+ELLIPSES = 3
+# Type of the entries of a display list that hold a traverse path
+TRAVERSE_PATH = 4
+
+
 class Frame:
 
-    def __init__(self):
+    def __init__(self, viewport):
+        """
+        Initializes a Frame object with an empty display list and without a static layer
+        :param viewport: Copy of the viewport that the frame is drawn for, which is not changed afterwards
+        """
+        self.viewport = viewport
+        # The display list holds the entries of the frame in the order in which they are drawn. Every entry consists
+        # of a style, i.e. the type, RGBA color and line width of its content, and either a batch of primitives or a
+        # traverse path together with its number of committed vertices when it was added. Consecutive primitives of the same style are joined into a single batch, which is drawn as a
+        # single path. Polygons and lines are stored as arrays of their vertices, circles and ellipses as tuples of
+        # their parameters.
+        self.display_list = []
+        # A frame holding the content that does not change between simulation cycles, drawn below this frame
+        self.static_layer = None
+
+    def set_static_layer(self, static_layer):
+        """
+        Sets the layer of static content, which is rendered once and reused until it is replaced by another layer.
+        The static layer must not be modified once it has been drawn.
+        :param static_layer: Frame holding the static content
+        """
+        self.static_layer = static_layer
+
+    def add_traverse_path(self, traverse_path):
         """
-        Initializes a Frame object with an empty list of objects to be drawn
+        Adds a traverse path to the objects to be drawn. Its committed segments are drawn incrementally, only its most
+        recent segment is drawn as a line of the frame. Vertices that are committed after the path was added are not
+        drawn with this frame, even if the path is extended by the simulation while the frame is drawn.
+        :param traverse_path: The traverse path
         """
-        self.draw_list = []
+        style = (TRAVERSE_PATH, ColorPalette.rgba(traverse_path.color, traverse_path.alpha), traverse_path.linewidth)
+        self.display_list.append((style, (traverse_path, traverse_path.count)))
+        tail = traverse_path.tail()
+        if tail is not None:
+            self.add_lines([tail], traverse_path.linewidth, traverse_path.color, traverse_path.alpha)
 
     def add_circle(self,
                    pos, radius,
@@ -35,13 +78,7 @@ class Frame:
         :param color: Color of the circle
         :param alpha: Alpha value of the color of the circle
         """
-        self.draw_list.append({
-            'type': 'circle',
-            'pos': pos,
-            'radius': radius,
-            'color': color,
-            'alpha': alpha
-        })
+        self.__batch(CIRCLES, color, alpha).append((pos[0], pos[1], radius))
 
     def add_polygons(self,
                      polygons,
@@ -52,12 +89,7 @@ class Frame:
         :param color: Color of the polygon
         :param alpha: Alpha value of the color of the polygon
         """
-        self.draw_list.append({
-            'type': 'polygons',
-            'polygons': polygons,
-            'color': color,
-            'alpha': alpha
-        })
+        self.__batch(POLYGONS, color, alpha).extend(self.__vertex_arrays(polygons))
 
     def add_lines(self,
                   lines, linewidth,
@@ -69,13 +101,7 @@ class Frame:
         :param color: Color of the lines
         :param alpha: Alpha value of the color of the lines
         """
-        self.draw_list.append({
-            'type': 'lines',
-            'lines': lines,
-            'linewidth': linewidth,
-            'color': color,
-            'alpha': alpha
-        })
+        self.__batch(LINES, color, alpha, linewidth).extend(self.__vertex_arrays(lines))
 
     def add_ellipse(self,
                     pos, angle,
@@ -90,12 +116,80 @@ class Frame:
         :param color: Color of the ellipse
         :param alpha: Alpha value of the color of the ellipse
         """
-        self.draw_list.append({
-            'type': 'ellipse',
-            'pos': pos,
-            'angle': angle,
-            'radius_x': radius_x,
-            'radius_y': radius_y,
-            'color': color,
-            'alpha': alpha
-        })
+        self.__batch(ELLIPSES, color, alpha).append((pos[0], pos[1], angle, radius_x, radius_y))
+
+    def add_ellipses(self,
+                     positions, angles,
+                     radii_x, radii_y,
+                     color, alpha=None):
+        """
+        Adds multiple ellipses of the same color to the list of objects to be drawn
+        :param positions: Array of shape (n, 2) holding the positions of the centers of the ellipses
+        :param angles: Array of the angles of the x sides
+        :param radii_x: Array of the "radii" of one side of the ellipses
+        :param radii_y: Array of the "radii" of the other side of the ellipses, perpendicular to the radii_x
+        :param color: Color of the ellipses
+        :param alpha: Alpha value of the color of the ellipses
+        """
+        positions = np.asarray(positions, dtype=float).reshape(-1, 2)
+        self.__batch(ELLIPSES, color, alpha).extend(zip(positions[:, 0].tolist(), positions[:, 1].tolist(),
+                                                        np.asarray(angles, dtype=float).tolist(),
+                                                        np.asarray(radii_x, dtype=float).tolist(),
+                                                        np.asarray(radii_y, dtype=float).tolist()))
+
+    def same_content(self, other):
+        """
+        Checks whether another frame draws exactly the same picture, so that redrawing it can be skipped
+        :param other: The frame to be compared, may be None
+        :return: Boolean value specifying whether both frames have the same content
+        """
+        if other is None or self.static_layer is not other.static_layer or \
+                self.viewport.key() != other.viewport.key() or len(self.display_list) != len(other.display_list):
+            return False
+        for (style, batch), (other_style, other_batch) in zip(self.display_list, other.display_list):
+            if style != other_style:
+                return False
+            if style[0] == TRAVERSE_PATH:
+                if batch[0] is not other_batch[0] or batch[1] != other_batch[1]:
+                    return False
+            elif len(batch) != len(other_batch):
+                return False
+            elif style[0] in (CIRCLES, ELLIPSES):
+                if batch != other_batch:
+                    return False
+            elif len(batch) > 0:
+                # The vertices of all polygons or lines of a batch are compared at once
+                if [len(shape) for shape in batch] != [len(shape) for shape in other_batch] or \
+                        not np.array_equal(np.concatenate(batch), np.concatenate(other_batch)):
+                    return False
+        return True
+
+    def __batch(self, primitive, color, alpha, linewidth=None):
+        """
+        Returns the batch that primitives of a style are added to. This is the last entry of the display list if it has
+        the same style, so that the primitives are drawn in the order in which they were added.
+        :param primitive: The type of the primitives
+        :param color: Color of the primitives
+        :param alpha: Alpha value of the color of the primitives
+        :param linewidth: The width of the lines, None for filled primitives
+        :return: List of the primitives of the style
+        """
+        style = (primitive, ColorPalette.rgba(color, alpha), linewidth)
+        if len(self.display_list) > 0 and self.display_list[-1][0] == style:
+            return self.display_list[-1][1]
+        batch = []
+        self.display_list.append((style, batch))
+        return batch
+
+    @staticmethod
+    def __vertex_arrays(shapes):
+        """
+        Copies the vertices of polygons or lines into arrays
+        :param shapes: List of the vertices of every polygon or line, or array of shape (n, k, 2) if all have k vertices
+        :return: List of arrays of shape (k, 2) holding the vertices of every polygon or line
+        """
+        try:
+            # The vertices of shapes with the same number of vertices are converted at once
+            return list(np.array(shapes, dtype=float).reshape(len(shapes), -1, 2))
+        except ValueError:
+            return [np.array(shape, dtype=float).reshape(-1, 2) for shape in shapes]
@@ -0,0 +1,138 @@
+"""
+Offscreen recording of the frames of the simulation.
+The frames are rendered onto a cairo image surface in a background thread, so that no display is required
+and the simulation only pays for copying the draw lists of the recorded frames.
+"""
+
+import os
+import queue
+import threading
+
+import cairo
+import yaml
+
+from gui.Frame import Frame, LINES, TRAVERSE_PATH
+from gui.Painter import Painter
+
+
+class FrameRecorder:
+
+    def __init__(self, recording_cfg, viewport, num_frames):
+        """
+        Initializes a FrameRecorder object and starts its rendering thread
+        :param recording_cfg: The configuration of the recording
+        :param viewport: The viewport specifying the size of a single frame
+        :param num_frames: The number of frames, which are placed side by side in every recorded image
+        """
+        self.decimation = recording_cfg["decimation"]
+        self.directory = recording_cfg["directory"]
+        self.format = recording_cfg["format"]
+        self.width_pixels = viewport.width_pixels
+        self.height_pixels = viewport.height_pixels
+        self.num_frames = num_frames
+        self.painter = Painter()
+        # The most recently recorded cycle, frames that are drawn again within the same cycle are not recorded
+        self.last_cycle = None
+        # The recorded frames that wait to be rendered. If the rendering falls behind, recording blocks the simulation,
+        # so that the memory is bounded and no frame is lost
+        self.pending = queue.Queue(maxsize=recording_cfg["queue_size"])
+        self.num_recorded = 0
+        os.makedirs(self.directory, exist_ok=True)
+        self.thread = threading.Thread(target=self.__run, daemon=True)
+        self.thread.start()
+
+    def wants(self, cycle):
+        """
+        Checks whether the frames of a simulation cycle are recorded, so that they are drawn even if they are not shown
+        :param cycle: The number of the simulation cycle
+        :return: Boolean value specifying whether the cycle is recorded
+        """
+        return cycle % self.decimation == 0 and cycle != self.last_cycle
+
+    def record(self, frames, cycle):
+        """
+        Records the frames of a simulation cycle, if the cycle is not skipped by the decimation
+        :param frames: The frames of the simulation cycle
+        :param cycle: The number of the simulation cycle
+        """
+        if not self.wants(cycle):
+            return
+        self.last_cycle = cycle
+        # The frames may be modified after the cycle, e.g. by a redraw of the viewer, so the rendered state is copied
+        self.pending.put((cycle, [self.__snapshot(frame) for frame in frames]))
+
+    def close(self):
+        """
+        Renders all pending frames and stops the rendering thread
+        """
+        self.pending.put(None)
+        self.thread.join()
+
+    def __run(self):
+        """
+        Renders the recorded frames until the recorder is closed
+        """
+        surface = cairo.ImageSurface(cairo.FORMAT_RGB24, self.width_pixels * self.num_frames, self.height_pixels)
+        stream = None
+        if self.format == "raw":
+            stream = open(os.path.join(self.directory, "frames.raw"), 'wb')
+        while True:
+            item = self.pending.get()
+            if item is None:
+                break
+            cycle, frames = item
+            for i, frame in enumerate(frames):
+                # Every frame is painted onto its own part of the surface
+                context = cairo.Context(surface)
+                context.rectangle(i * self.width_pixels, 0, self.width_pixels, self.height_pixels)
+                context.clip()
+                context.translate(i * self.width_pixels, 0)
+                self.painter.paint_frame(frame, context, self.width_pixels, self.height_pixels)
+            surface.flush()
+            if stream is None:
+                surface.write_to_png(os.path.join(self.directory, "frame_%06d.png" % cycle))
+            else:
+                stream.write(surface.get_data())
+            self.num_recorded += 1
+        if stream is not None:
+            stream.close()
+            self.__write_stream_description(surface)
+
+    def __write_stream_description(self, surface):
+        """
+        Writes the information required to decode the raw frame stream to a yaml file
+        :param surface: The surface that the frames were rendered onto
+        """
+        description = {
+            "width": surface.get_width(),
+            "height": surface.get_height(),
+            "stride": surface.get_stride(),
+            # 32 bits per pixel in native byte order, which is blue, green, red and an unused byte on little endian
+            "pixel_format": "bgr0",
+            "num_frames": self.num_recorded,
+            "decimation": self.decimation
+        }
+        with open(os.path.join(self.directory, "frames.yaml"), 'w') as file:
+            yaml.safe_dump(description, file, sort_keys=False)
+
+    @staticmethod
+    def __snapshot(frame):
+        """
+        Copies the display list of a frame
+        :param frame: The frame to be copied
+        :return: The copied frame
+        """
+        # Static layers are not modified once they are drawn and viewports not once they are copied into a frame,
+        # so both can be shared
+        snapshot = Frame(frame.viewport)
+        snapshot.set_static_layer(frame.static_layer)
+        # The primitives are copied when they are added to a frame, so only the batches are copied.
+        # The traverse paths keep growing, so the vertices they had when they were added are copied as lines in their
+        # place.
+        for style, batch in frame.display_list:
+            if style[0] == TRAVERSE_PATH:
+                traverse_path, count = batch
+                snapshot.display_list.append(((LINES,) + style[1:], [traverse_path.committed_vertices(0, count)]))
+            else:
+                snapshot.display_list.append((style, list(batch)))
+        return snapshot
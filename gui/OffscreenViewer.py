@@ -0,0 +1,61 @@
+"""
+Viewer for running the simulation without a display.
+It provides the same frames and settings to the plotters as the Viewer, but has no window and no control panel.
+"""
+
+from gui.Frame import Frame
+from gui.Viewport import Viewport
+
+
+class OffscreenViewer:
+
+    def __init__(self, viewer_config, num_frames, draw_invisibles=False):
+        """
+        Initializes an OffscreenViewer object
+        :param viewer_config: The configuration of the Viewer
+        :param num_frames: Number of frames, determined by which algorithms are activated
+        :param draw_invisibles: Boolean value specifying whether invisible world elements are drawn
+        """
+        self.cfg = viewer_config
+        self.num_frames = num_frames
+        self.view_width_pixels = viewer_config["pixels_width"]
+        self.view_height_pixels = viewer_config["pixels_height"]
+        self.viewport = Viewport(self.view_width_pixels, self.view_height_pixels, viewer_config["zoom"])
+        self.draw_invisibles = draw_invisibles
+        self.current_frames = [Frame(self.viewport.copy()) for _ in range(self.num_frames)]
+
+    def new_frame(self, viewport):
+        """
+        Initializes empty frames
+        :param viewport: Copy of the viewport that the frames are drawn for
+        """
+        self.current_frames = [Frame(viewport) for _ in range(self.num_frames)]
+
+    def draw_frame(self):
+        """
+        The frames are not displayed, they are only rendered if they are recorded
+        """
+        pass
+
+    def is_visible(self):
+        """
+        The frames are never shown, so they are only drawn if they are recorded
+        :return: False
+        """
+        return False
+
+    def control_panel_state_init(self):
+        pass
+
+    def control_panel_state_playing(self):
+        pass
+
+    def control_panel_state_paused(self):
+        pass
+
+    def control_panel_state_finished(self, alert_text):
+        """
+        Reports why the simulation ended
+        :param alert_text: Text to be displayed to the user
+        """
+        print(alert_text)
@@ -18,18 +18,27 @@
 
 
 from math import *
+import weakref
+
+import cairo
+import numpy as np
 
 from gui.ColorPalette import *
+from gui.Frame import POLYGONS, LINES, CIRCLES, ELLIPSES, TRAVERSE_PATH
 
 
 class Painter:
 
-    def __init__(self, pixels_per_meter):
+    def __init__(self):
         """
-        Initializes a Painter object
-        :param pixels_per_meter: Specifies the amount of pixels contained in one meter
+        Initializes a Painter object. Every frame is painted for the viewport that it was drawn for.
         """
-        self.pixels_per_meter = pixels_per_meter
+        # Maps every static layer to the key of its rendering and the surface it was rendered onto. Layers that are
+        # no longer used, e.g. those of a previous map, are dropped automatically.
+        self.static_surfaces = weakref.WeakKeyDictionary()
+        # Maps every traverse path to the key of its rendering, the surface it is drawn onto and the number of its
+        # vertices that have been drawn
+        self.path_surfaces = weakref.WeakKeyDictionary()
 
     def draw_frame(self, frame, widget, context):
         """
@@ -38,123 +47,131 @@ class Painter:
         :param widget: The widget onto which the frame is drawn
         :param context: The cairo context to be used
         """
-        width_pixels = widget.get_allocated_width()
-        height_pixels = widget.get_allocated_height()
-
-        # transform the the view to metric coordinates
-        context.translate(width_pixels / 2.0, height_pixels / 2.0)  # move origin to center of window
-        context.scale(self.pixels_per_meter,
-                      -self.pixels_per_meter)  # pull view to edges of window ( also flips y-axis )
+        self.paint_frame(frame, context, widget.get_allocated_width(), widget.get_allocated_height())
 
-        # draw the background in white
-        self.set_color(context, 'white', 1.0)
+    def paint_frame(self, frame, context, width_pixels, height_pixels):
+        """
+        Draws a frame onto a cairo context, independent of whether it belongs to a widget or an offscreen surface
+        :param frame: The frame objects that will be drawn
+        :param context: The cairo context to be used
+        :param width_pixels: The width of the drawn area in pixels
+        :param height_pixels: The height of the drawn area in pixels
+        """
+        # draw the background, either the cached static layer or plain white
+        if frame.static_layer is not None:
+            context.set_source_surface(self.__static_surface(frame.static_layer, context, width_pixels, height_pixels))
+        else:
+            self.set_color(context, 'white', 1.0)
         context.paint()
 
-        draw_list = frame.draw_list
-        for component in draw_list:
-            if component['type'] == 'ellipse':
-                self.draw_ellipse(context,
-                                  component['pos'],
-                                  component['angle'],
-                                  component['radius_x'],
-                                  component['radius_y'],
-                                  component['color'],
-                                  component['alpha'])
-
-            if component['type'] == 'circle':
-                self.draw_circle(context,
-                                 component['pos'],
-                                 component['radius'],
-                                 component['color'],
-                                 component['alpha'])
-
-            elif component['type'] == 'polygons':
-                self.draw_polygons(context,
-                                   component['polygons'],
-                                   component['color'],
-                                   component['alpha'])
-
-            elif component['type'] == 'lines':
-                self.draw_lines(context,
-                                component['lines'],
-                                component['linewidth'],
-                                component['color'],
-                                component['alpha'])
-
-    def draw_ellipse(self, context,
-                     pos, angle,
-                     radius_x, radius_y,
-                     color, alpha):
-        """
-        Draws an ellipse
+        device_matrix = context.get_matrix()
+        frame.viewport.transform(context, width_pixels, height_pixels)
+
+        # every batch of primitives of the same style is drawn as a single path
+        for (primitive, rgba, linewidth), batch in frame.display_list:
+            if primitive == TRAVERSE_PATH:
+                # the traverse paths are drawn incrementally onto their own surfaces in device coordinates
+                context.save()
+                context.set_matrix(device_matrix)
+                traverse_path, count = batch
+                context.set_source_surface(self.__path_surface(traverse_path, count, frame.viewport, context,
+                                                               width_pixels, height_pixels))
+                context.paint_with_alpha(rgba[3])
+                context.restore()
+                continue
+            if len(batch) == 0:
+                continue
+            context.set_source_rgba(*rgba)
+            if primitive == POLYGONS:
+                self.draw_polygons(context, batch)
+            elif primitive == LINES:
+                self.draw_lines(context, batch, linewidth)
+            elif primitive == CIRCLES:
+                self.draw_circles(context, batch)
+            elif primitive == ELLIPSES:
+                self.draw_ellipses(context, batch)
+
+    def draw_ellipses(self, context, ellipses):
+        """
+        Draws a batch of filled ellipses of the color of the context
         :param context: The cairo context to be used
-        :param pos: The position of the center of the ellipse
-        :param angle: Angle of the x side
-        :param radius_x: "Radius" of one ellipse side
-        :param radius_y: "Radius" of the other ellipse side, perpendicular to the radius_x
-        :param color: Color of the ellipse
-        :param alpha: Alpha value of the color of the ellipse
-        """
-        if radius_x > 0 and radius_y > 0:
-            self.set_color(context, color, alpha)
-            context.translate(pos[0], pos[1])
-            context.rotate(angle)
-            context.scale(radius_x, radius_y)
-            context.arc(0, 0, 1, 0, 2.0 * pi)
-            context.fill()
+        :param ellipses: List of tuples of the position of the center, the angle of the x side and the "radii" along
+                         the x and y side of every ellipse
+        """
+        context.new_path()
+        for x, y, angle, radius_x, radius_y in ellipses:
+            if radius_x > 0 and radius_y > 0:
+                # The path is stored in device coordinates, so the transformation of every ellipse can be reverted
+                context.save()
+                context.translate(x, y)
+                context.rotate(angle)
+                context.scale(radius_x, radius_y)
+                context.new_sub_path()
+                context.arc(0, 0, 1, 0, 2.0 * pi)
+                context.restore()
+        context.fill()
 
-    def draw_circle(self, context,
-                    pos, radius,
-                    color, alpha):
+    def draw_circles(self, context, circles):
         """
-        Draws a circle
+        Draws a batch of filled circles of the color of the context
         :param context: The cairo context to be used
-        :param pos: The position of the center of the circle
-        :param radius: The radius of the circle
-        :param color: Color of the circle
-        :param alpha: Alphave value of the color of the circle
+        :param circles: List of tuples of the position of the center and the radius of every circle
         """
-        self.set_color(context, color, alpha)
-        context.arc(pos[0], pos[1], radius, 0, 2.0 * pi)
+        context.new_path()
+        for x, y, radius in circles:
+            context.new_sub_path()
+            context.arc(x, y, radius, 0, 2.0 * pi)
         context.fill()
 
-    def draw_polygons(self, context,
-                      polygons,
-                      color, alpha):
+    def draw_polygons(self, context, polygons):
         """
-        Draws a filled out polygon
+        Draws a batch of filled out polygons of the color of the context.
+        The polygons are oriented counterclockwise, so that overlapping polygons do not cancel each other out.
         :param context: The cairo context to be used
-        :param polygons: List of polygon vertices
-        :param color: Color of the polygon
-        :param alpha: Alpha value of the color of the polygon
-        """
-        self.set_color(context, color, alpha)
-        for polygon in polygons:
-            context.new_path()
-            context.move_to(*polygon[0])
-            for point in polygon[1:]:
-                context.line_to(*point)
+        :param polygons: List of arrays of shape (n, 2) holding the vertices of every polygon
+        """
+        context.new_path()
+        polygons = [polygon for polygon in polygons if len(polygon) > 0]
+        if len(polygons) == 0:
+            return
+        if len(polygons) == 1:
+            # A single polygon can not cancel out another one
+            self.__add_polygon_path(context, polygons[0].tolist())
             context.fill()
+            return
+        vertices = np.concatenate(polygons)
+        lengths = np.array([len(polygon) for polygon in polygons])
+        starts = np.cumsum(lengths) - lengths
+        # Signed areas of all polygons by the shoelace formula, every vertex is followed by the next one of its polygon
+        successors = np.arange(1, len(vertices) + 1)
+        successors[starts + lengths - 1] = starts
+        cross = vertices[:, 0] * vertices[successors, 1] - vertices[successors, 0] * vertices[:, 1]
+        clockwise = np.add.reduceat(cross, starts) < 0
+        points = vertices.tolist()
+        for start, length, reverse in zip(starts.tolist(), lengths.tolist(), clockwise.tolist()):
+            polygon = points[start:start + length]
+            if reverse:
+                polygon.reverse()
+            self.__add_polygon_path(context, polygon)
+        context.fill()
 
-    def draw_lines(self, context,
-                   lines, linewidth,
-                   color, alpha):
+    def draw_lines(self, context, lines, linewidth):
         """
-        Draws lines
+        Draws a batch of lines of the color of the context
         :param context: The cairo context to be used
-        :param lines: List of line vertices
+        :param lines: List of arrays of shape (n, 2) holding the vertices of every line
         :param linewidth: Width of the lines
-        :param color: Color of the lines
-        :param alpha: Alpha value of the color of the lines
         """
-        self.set_color(context, color, alpha)
         context.set_line_width(linewidth)
+        context.new_path()
         for line in lines:
-            context.new_path()
-            context.move_to(*line[0])
-            for point in line[1:]:
+            if len(line) == 0:
+                continue
+            points = line.tolist()
+            context.move_to(*points[0])
+            for point in points[1:]:
                 context.line_to(*point)
-            context.stroke()
+        context.stroke()
 
     def set_color(self, cairo_context, color_string, alpha):
         """
@@ -164,3 +181,86 @@ class Painter:
         :param alpha: Alpha value of the color
         """
         ColorPalette.dab(cairo_context, color_string, alpha)
+
+    def __static_surface(self, static_layer, context, width_pixels, height_pixels):
+        """
+        Returns the rendering of a static layer, which is only rendered again if the view changed
+        :param static_layer: Frame holding the static content
+        :param context: The cairo context that the rendering will be drawn onto
+        :param width_pixels: The width of the drawn area in pixels
+        :param height_pixels: The height of the drawn area in pixels
+        :return: Cairo surface holding the rendered static layer
+        """
+        key = (width_pixels, height_pixels) + static_layer.viewport.key()
+        cached = self.static_surfaces.get(static_layer)
+        if cached is None or cached[0] != key:
+            surface = context.get_target().create_similar(cairo.CONTENT_COLOR, width_pixels, height_pixels)
+            self.paint_frame(static_layer, cairo.Context(surface), width_pixels, height_pixels)
+            cached = (key, surface)
+            self.static_surfaces[static_layer] = cached
+        return cached[1]
+
+    def __path_surface(self, traverse_path, count, viewport, context, width_pixels, height_pixels):
+        """
+        Returns the surface that a traverse path is drawn onto. Only the segments committed since the last call are
+        drawn, unless the view changed, the last drawn vertex is no longer stored or the surface already shows later
+        vertices. When the whole path is drawn, vertices closer than a pixel to their predecessor are skipped.
+        The path is drawn opaque, its alpha value is applied when the surface is composited.
+        :param traverse_path: The traverse path
+        :param count: The number of committed vertices of the path when it was added to the frame
+        :param viewport: The viewport that the frame was drawn for
+        :param context: The cairo context that the surface will be drawn onto
+        :param width_pixels: The width of the drawn area in pixels
+        :param height_pixels: The height of the drawn area in pixels
+        :return: Cairo surface holding the drawn path
+        """
+        key = (width_pixels, height_pixels) + viewport.key()
+        cached = self.path_surfaces.get(traverse_path)
+        if cached is None or cached[0] != key or cached[2] <= count - traverse_path.capacity or cached[2] > count:
+            surface = context.get_target().create_similar(cairo.CONTENT_COLOR_ALPHA, width_pixels, height_pixels)
+            num_drawn = 0
+        else:
+            _, surface, num_drawn = cached
+        # The first new segment starts at the last drawn vertex
+        vertices = traverse_path.committed_vertices(num_drawn - 1, count)
+        if num_drawn == 0:
+            vertices = self.__decimate(vertices, viewport.pixels_per_meter)
+        if len(vertices) > 1:
+            path_context = cairo.Context(surface)
+            viewport.transform(path_context, width_pixels, height_pixels)
+            # Round caps and joins let the separately drawn segments connect seamlessly
+            path_context.set_line_cap(cairo.LINE_CAP_ROUND)
+            path_context.set_line_join(cairo.LINE_JOIN_ROUND)
+            path_context.set_source_rgb(*ColorPalette.rgba(traverse_path.color, None)[:3])
+            self.draw_lines(path_context, [vertices], traverse_path.linewidth)
+        self.path_surfaces[traverse_path] = (key, surface, count)
+        return surface
+
+    @staticmethod
+    def __decimate(vertices, pixels_per_meter):
+        """
+        Decimates the vertices of a line to the resolution of the view, by skipping every vertex that lies in the same
+        pixel as its predecessor. The last vertex is always kept.
+        :param vertices: Array of shape (n, 2) holding the vertices of the line
+        :param pixels_per_meter: The scale of the view
+        :return: Array holding the remaining vertices
+        """
+        if len(vertices) < 3:
+            return vertices
+        pixels = np.floor(vertices * pixels_per_meter)
+        keep = np.ones(len(vertices), dtype=bool)
+        keep[1:] = np.any(pixels[1:] != pixels[:-1], axis=1)
+        keep[-1] = True
+        return vertices[keep]
+
+    @staticmethod
+    def __add_polygon_path(context, polygon):
+        """
+        Adds a closed polygon as a sub path to the current path of the context
+        :param context: The cairo context to be used
+        :param polygon: List of the vertices of the polygon
+        """
+        context.move_to(*polygon[0])
+        for point in polygon[1:]:
+            context.line_to(*point)
+        context.close_path()
@@ -0,0 +1,117 @@
+"""
+Traverse path of a robot that is drawn incrementally.
+The positions are simplified online and only the resulting vertices are stored, in a ring buffer of bounded capacity.
+The Painter draws every committed segment of the path only once onto a persistent surface, so drawing the path does
+not become slower the longer the simulation runs.
+"""
+
+import numpy as np
+
+
+class TraversePath:
+
+    def __init__(self, path_cfg, color, linewidth, alpha=None):
+        """
+        Initializes an empty TraversePath object
+        :param path_cfg: The configuration of the traverse paths
+        :param color: Color of the path
+        :param linewidth: Width of the path
+        :param alpha: Alpha value of the color of the path
+        """
+        self.color = color
+        self.linewidth = linewidth
+        self.alpha = alpha
+        self.capacity = path_cfg["capacity"]
+        self.tolerance = path_cfg["tolerance"]
+        # Ring buffer of the committed vertices, the vertex number i is stored at index i % capacity
+        self.vertices = np.zeros((self.capacity, 2))
+        # Number of vertices that were ever committed
+        self.count = 0
+        # Cone of the directions from the last committed vertex that pass within the tolerance of all positions since
+        # that vertex, as the angle of its reference direction and the relative angles of its bounds
+        self.cone = None
+        # The most recent position, which is not committed yet, and its distance from the last committed vertex
+        self.last_point = None
+        self.last_distance = 0.0
+
+    def append(self, position):
+        """
+        Appends a position to the path. The positions are simplified by the cone intersection algorithm: the previous
+        position is only committed as a vertex once the segment from the last committed vertex to the new position
+        would deviate more than the tolerance from one of the positions in between.
+        :param position: The position
+        """
+        point = np.array(position[:2], dtype=float)
+        if self.count == 0:
+            self.__commit(point)
+        elif not self.__extend_segment(point):
+            self.__commit(self.last_point)
+            self.__extend_segment(point)
+        self.last_point = point
+
+    def anchor(self):
+        """
+        Returns the most recently committed vertex
+        :return: Array holding the x and y coordinates of the vertex
+        """
+        return self.vertices[(self.count - 1) % self.capacity]
+
+    def committed_vertices(self, start=0, end=None):
+        """
+        Returns the committed vertices that are still stored
+        :param start: The number of the first vertex to be returned, older vertices that are no longer stored
+                      are omitted
+        :param end: The number of vertices that were committed when the path was drawn, later vertices are omitted.
+                    None returns all committed vertices.
+        :return: Array of shape (n, 2) holding the vertices in the order in which they were committed
+        """
+        end = self.count if end is None else end
+        start = max(start, end - self.capacity, 0)
+        indices = np.arange(start, end) % self.capacity
+        return self.vertices[indices]
+
+    def tail(self):
+        """
+        Returns the segment between the most recently committed vertex and the most recent position, which may still
+        be replaced by a longer segment
+        :return: List of the start and end point of the segment, or None if the path is empty
+        """
+        if self.count == 0:
+            return None
+        return [self.anchor(), self.last_point]
+
+    def __extend_segment(self, point):
+        """
+        Tries to extend the segment starting at the last committed vertex to a position
+        :param point: The position
+        :return: Boolean value specifying whether the segment could be extended
+        """
+        offset = point - self.anchor()
+        distance = np.hypot(offset[0], offset[1])
+        if distance <= self.tolerance:
+            # The position is close to the vertex for any direction of the segment
+            return True
+        angle = np.arctan2(offset[1], offset[0])
+        half_width = np.arcsin(self.tolerance / distance)
+        if self.cone is None:
+            self.cone = (angle, -half_width, half_width)
+            self.last_distance = distance
+            return True
+        reference, low, high = self.cone
+        relative = (angle - reference + np.pi) % (2 * np.pi) - np.pi
+        # The robot must keep moving away from the vertex, otherwise the segment would pass over the path twice
+        if not low <= relative <= high or distance < self.last_distance:
+            return False
+        self.cone = (reference, max(low, relative - half_width), min(high, relative + half_width))
+        self.last_distance = distance
+        return True
+
+    def __commit(self, point):
+        """
+        Commits a vertex of the path, overwriting the oldest vertex if the capacity is exhausted
+        :param point: The vertex
+        """
+        self.vertices[self.count % self.capacity] = point
+        self.count += 1
+        self.cone = None
+        self.last_distance = 0.0
@@ -20,19 +20,27 @@
 import gi
 
 gi.require_version('Gtk', '3.0')
+gi.require_version('Gdk', '3.0')
+from gi.repository import Gdk as gdk
+from gi.repository import GLib
 from gi.repository import Gtk as gtk
 
 from gui.Frame import Frame
 from gui.Painter import Painter
+from gui.Viewport import Viewport
 
 # user response codes for file chooser dialog buttons
 LS_DIALOG_RESPONSE_CANCEL = 1
 LS_DIALOG_RESPONSE_ACCEPT = 2
 
+# factor by which a single step of the mouse wheel zooms the view
+ZOOM_STEP = 1.25
+
 
 class Viewer:
 
-    def __init__(self, simulator, viewer_config, num_frames, ekf_enabled=True, use_slam_evaluation=True):
+    def __init__(self, simulator, viewer_config, num_frames, ekf_enabled=True, use_slam_evaluation=True,
+                 threaded=False):
         """
         Initializes a Viewer object
         :param simulator: The underlying simulator
@@ -40,9 +48,11 @@ class Viewer:
         :param num_frames: Number of frame of the GUI, determined by which algorithms are activated
         :param ekf_enabled: Boolean value specifying if EKF is enabled
         :param use_slam_evaluation: Boolean value specifying if the slam evaluation is enabled
+        :param threaded: Boolean value specifying if the frames are drawn by a simulation thread
         """
         # bind the simulator
         self.simulator = simulator
+        self.threaded = threaded
 
         self.cfg = viewer_config
         self.ekf_enabled = ekf_enabled
@@ -52,16 +62,26 @@ class Viewer:
         self.num_frames = num_frames
         self.view_width_pixels = viewer_config["pixels_width"]
         self.view_height_pixels = viewer_config["pixels_height"]
-        self.pixels_per_meter = viewer_config["zoom"]
-
-        # initialize frames
-        self.current_frames = [Frame() for _ in range(self.num_frames)]
+        self.viewport = Viewport(self.view_width_pixels, self.view_height_pixels, viewer_config["zoom"])
+        # the last position of the mouse while the view is dragged
+        self.drag_position = None
+
+        # initialize frames. The plotters draw onto the current frames, the shown frames are the latest completed
+        # ones. Completed frames are never modified, so they can be handed over from the simulation thread.
+        self.current_frames = [Frame(self.viewport.copy()) for _ in range(self.num_frames)]
+        self.shown_frames = self.current_frames
+        # the frames that the drawing areas were last redrawn for, frames whose content and view did not change since
+        # then are not redrawn
+        self.drawn_frames = [None] * self.num_frames
+        # nothing is drawn while the window is minimized or hidden
+        self.visible = True
 
         # initialize the window
         self.window = gtk.Window()
         self.window.set_title('Sobot Rimulator')
         self.window.set_resizable(False)
         self.window.connect('delete_event', self.on_delete)
+        self.window.connect('window-state-event', self.on_window_state)
 
         # Define labels of the drawing areas
         if self.ekf_enabled:
@@ -83,10 +103,18 @@ class Viewer:
             drawing_area = gtk.DrawingArea()
             drawing_area.set_size_request(self.view_width_pixels, self.view_height_pixels)
             drawing_area.connect('draw', on_expose)
+            # all frames share the same view, which can be zoomed with the mouse wheel and moved by dragging
+            drawing_area.add_events(gdk.EventMask.SCROLL_MASK | gdk.EventMask.SMOOTH_SCROLL_MASK |
+                                    gdk.EventMask.BUTTON_PRESS_MASK | gdk.EventMask.BUTTON_RELEASE_MASK |
+                                    gdk.EventMask.BUTTON1_MOTION_MASK)
+            drawing_area.connect('scroll-event', self.on_scroll)
+            drawing_area.connect('button-press-event', self.on_button_press)
+            drawing_area.connect('button-release-event', self.on_button_release)
+            drawing_area.connect('motion-notify-event', self.on_motion)
             self.drawing_areas.append(drawing_area)
 
         # initialize the painter
-        self.painter = Painter(self.pixels_per_meter)
+        self.painter = Painter()
 
     # == initialize the buttons
 
@@ -225,18 +253,41 @@ class Viewer:
         # show the simulator window
         self.window.show_all()
 
-    def new_frame(self):
+    def new_frame(self, viewport):
         """
         Initialiues empty frames
+        :param viewport: Copy of the viewport that the frames are drawn for
         """
-        self.current_frames = [Frame() for _ in range(self.num_frames)]
+        self.current_frames = [Frame(viewport) for _ in range(self.num_frames)]
 
     def draw_frame(self):
         """
-        Draws the frames
+        Draws the completed current frames. If they were drawn by the simulation thread, they are handed over to the
+        GTK main loop, which shows them on its next iteration.
         """
-        for drawing_area in self.drawing_areas:
+        if self.threaded:
+            GLib.idle_add(self.__show_frames, self.current_frames)
+        else:
+            self.__show_frames(self.current_frames)
+
+    def __show_frames(self, frames):
+        """
+        Shows completed frames, skipping those whose content and view did not change since they were last drawn
+        :param frames: The completed frames
+        """
+        self.shown_frames = frames
+        for i, drawing_area in enumerate(self.drawing_areas):
+            if frames[i].same_content(self.drawn_frames[i]):
+                continue
             drawing_area.queue_draw_area(0, 0, self.view_width_pixels, self.view_height_pixels)
+        self.drawn_frames = list(frames)
+
+    def is_visible(self):
+        """
+        Checks whether the frames can be seen, which is not the case while the window is minimized or hidden
+        :return: Boolean value specifying whether the window is visible
+        """
+        return self.visible
 
     def control_panel_state_init(self):
         """
@@ -275,6 +326,19 @@ class Viewer:
         self.button_step.set_sensitive(False)
 
     # EVENT HANDLERS:
+    def on_window_state(self, widget, event):
+        """
+        Callback function that handles the window being minimized, hidden or shown again
+        :param widget: The corresponding widget
+        :param event: The window state event
+        """
+        visible = not event.new_window_state & (gdk.WindowState.ICONIFIED | gdk.WindowState.WITHDRAWN)
+        if visible and not self.visible:
+            self.visible = True
+            # show the changes that were not drawn while the window was hidden
+            self.simulator.redraw_world()
+        self.visible = visible
+
     def on_play(self, widget):
         """
         Callback function that handles a click on the "Play" button
@@ -368,24 +432,72 @@ class Viewer:
             self._decorate_draw_invisibles_button_active()
         else:
             self._decorate_draw_invisibles_button_inactive()
-        self.simulator.draw_world()
+        self.simulator.redraw_world()
 
     def on_slam_evaluation(self, widget):
         """
         Callback function that handles a click on the "Slam evaluation" button
         :param widget: The corresponding widget
         """
-        if self.simulator.ekfslam_evaluation is not None:
-            self.simulator.ekfslam_evaluation.plot()
-        if self.simulator.fastslam_evaluation is not None:
-            self.simulator.fastslam_evaluation.plot()
+        self.simulator.plot_slam_evaluations()
 
     def on_plot_covariances(self, widget):
         """
         Callback function that handles a click on the "Plot covariances" button
         :param widget: The corresponding widget
         """
-        self.simulator.ekfslam_plotter.plot_covariances()
+        self.simulator.plot_covariances()
+
+    def on_scroll(self, widget, event):
+        """
+        Callback function that zooms the view around the mouse position when the mouse wheel is turned
+        :param widget: The corresponding widget
+        :param event: The scroll event
+        """
+        if event.direction == gdk.ScrollDirection.UP:
+            steps = -1.0
+        elif event.direction == gdk.ScrollDirection.DOWN:
+            steps = 1.0
+        elif event.direction == gdk.ScrollDirection.SMOOTH:
+            steps = event.get_scroll_deltas()[2]
+        else:
+            return False
+        self.simulator.change_view(self.viewport.zoom, ZOOM_STEP ** -steps, event.x, event.y)
+        return True
+
+    def on_button_press(self, widget, event):
+        """
+        Callback function that starts dragging the view with the left mouse button, a double click resets the view
+        :param widget: The corresponding widget
+        :param event: The button event
+        """
+        if event.button != 1:
+            return False
+        if event.type == gdk.EventType._2BUTTON_PRESS:
+            self.simulator.change_view(self.viewport.reset)
+        self.drag_position = (event.x, event.y)
+        return True
+
+    def on_button_release(self, widget, event):
+        """
+        Callback function that stops dragging the view
+        :param widget: The corresponding widget
+        :param event: The button event
+        """
+        self.drag_position = None
+        return True
+
+    def on_motion(self, widget, event):
+        """
+        Callback function that moves the view while it is dragged
+        :param widget: The corresponding widget
+        :param event: The motion event
+        """
+        if self.drag_position is None:
+            return False
+        self.simulator.change_view(self.viewport.pan, event.x - self.drag_position[0], event.y - self.drag_position[1])
+        self.drag_position = (event.x, event.y)
+        return True
 
     def on_expose1(self, widget, context):
         """
@@ -393,7 +505,7 @@ class Viewer:
         :param widget: The corresponding widget
         :param context: The cairo context to be used
         """
-        self.painter.draw_frame(self.current_frames[0], widget, context)
+        self.painter.draw_frame(self.shown_frames[0], widget, context)
 
     def on_expose2(self, widget, context):
         """
@@ -401,7 +513,7 @@ class Viewer:
         :param widget: The corresponding widget
         :param context: The cairo context to be used
         """
-        self.painter.draw_frame(self.current_frames[1], widget, context)
+        self.painter.draw_frame(self.shown_frames[1], widget, context)
 
     def on_expose3(self, widget, context):
         """
@@ -409,7 +521,7 @@ class Viewer:
         :param widget: The corresponding widget
         :param context: The cairo context to be used
         """
-        self.painter.draw_frame(self.current_frames[2], widget, context)
+        self.painter.draw_frame(self.shown_frames[2], widget, context)
 
     def on_delete(self, widget, event):
         """
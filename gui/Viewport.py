@@ -0,0 +1,102 @@
+"""
+The part of the world that is shown in a frame, determined by the center of the view and the zoom.
+"""
+
+import numpy as np
+
+# The zoom can be changed by at most this factor from the configured zoom in both directions
+ZOOM_RANGE = 20.0
+
+
+class Viewport:
+
+    def __init__(self, width_pixels, height_pixels, pixels_per_meter, center=(0.0, 0.0)):
+        """
+        Initializes a Viewport object
+        :param width_pixels: The width of a frame in pixels
+        :param height_pixels: The height of a frame in pixels
+        :param pixels_per_meter: Specifies the amount of pixels contained in one meter
+        :param center: The position in meters that is shown in the center of a frame
+        """
+        self.width_pixels = width_pixels
+        self.height_pixels = height_pixels
+        self.pixels_per_meter = pixels_per_meter
+        self.center = np.array(center, dtype=float)
+        self.initial_pixels_per_meter = pixels_per_meter
+        self.initial_center = self.center.copy()
+
+    def copy(self):
+        """
+        Returns a copy of the viewport, which is not affected by later changes of the view
+        :return: The copied viewport
+        """
+        viewport = Viewport(self.width_pixels, self.height_pixels, self.pixels_per_meter, self.center)
+        viewport.initial_pixels_per_meter = self.initial_pixels_per_meter
+        viewport.initial_center = self.initial_center
+        return viewport
+
+    def key(self):
+        """
+        Returns a key identifying the view, which changes whenever the shown part of the world changes
+        :return: Tuple of the size, zoom and center of the view
+        """
+        return self.width_pixels, self.height_pixels, self.pixels_per_meter, self.center[0], self.center[1]
+
+    def bounds(self, margin=0.0):
+        """
+        Returns the bounding box of the shown part of the world
+        :param margin: Distance in meters by which the bounding box is enlarged on every side
+        :return: Arrays holding the lower left and upper right corner of the bounding box in meters
+        """
+        half_size = np.array([self.width_pixels, self.height_pixels]) / (2.0 * self.pixels_per_meter) + margin
+        return self.center - half_size, self.center + half_size
+
+    def to_world(self, x_pixels, y_pixels):
+        """
+        Converts a position in a frame to world coordinates
+        :param x_pixels: The horizontal position in pixels, from the left border of the frame
+        :param y_pixels: The vertical position in pixels, from the upper border of the frame
+        :return: Array holding the position in meters
+        """
+        return self.center + np.array([x_pixels - self.width_pixels / 2.0,
+                                       self.height_pixels / 2.0 - y_pixels]) / self.pixels_per_meter
+
+    def zoom(self, factor, x_pixels, y_pixels):
+        """
+        Zooms the view, keeping the world position at the specified position of the frame fixed
+        :param factor: The factor by which the zoom is multiplied
+        :param x_pixels: The horizontal position in pixels, from the left border of the frame
+        :param y_pixels: The vertical position in pixels, from the upper border of the frame
+        """
+        fixed = self.to_world(x_pixels, y_pixels)
+        self.pixels_per_meter = float(np.clip(self.pixels_per_meter * factor,
+                                              self.initial_pixels_per_meter / ZOOM_RANGE,
+                                              self.initial_pixels_per_meter * ZOOM_RANGE))
+        self.center += fixed - self.to_world(x_pixels, y_pixels)
+
+    def pan(self, dx_pixels, dy_pixels):
+        """
+        Moves the view along with a drag of the mouse
+        :param dx_pixels: The horizontal distance of the drag in pixels
+        :param dy_pixels: The vertical distance of the drag in pixels
+        """
+        self.center -= np.array([dx_pixels, -dy_pixels]) / self.pixels_per_meter
+
+    def reset(self):
+        """
+        Restores the configured zoom and center of the view
+        """
+        self.pixels_per_meter = self.initial_pixels_per_meter
+        self.center = self.initial_center.copy()
+
+    def transform(self, context, width_pixels, height_pixels):
+        """
+        Transforms the view of a cairo context to world coordinates
+        :param context: The cairo context to be transformed
+        :param width_pixels: The width of the drawn area in pixels
+        :param height_pixels: The height of the drawn area in pixels
+        """
+        context.translate(width_pixels / 2.0, height_pixels / 2.0)  # move origin to center of window
+        context.scale(self.pixels_per_meter,
+                      -self.pixels_per_meter)  # pull view to edges of window ( also flips y-axis )
+        context.translate(-self.center[0], -self.center[1])  # move the center of the view to the origin
@@ -0,0 +1,49 @@
+# Sobot Rimulator - A Robot Programming Tool
+# Copyright (C) 2013-2014 Nicholas S. D. McCrea
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# 
+# Email mccrea.engineering@gmail.com for questions, comments, or to report bugs.
+import numpy as np
+
+# Unit square whose lower left corner lies at the origin, drawn for every occupied cell
+UNIT_CELL = np.array([[0, 0], [1, 0], [1, 1], [0, 1]])
+# Number of distinct transparencies of the occupied cells, every one is drawn as a single batch
+OCCUPANCY_LEVELS = 4
+
+
+class OccupancyGridPlotter:
+
+    def __init__(self, color):
+        """
+        Initializes an OccupancyGridPlotter object
+        :param color: Color in which the occupied cells shall be drawn
+        """
+        self.color = color
+
+    def draw_occupancy_grid_to_frame(self, frame, grid):
+        """
+        Draws the cells of an occupancy grid that are more likely occupied than free to the frame.
+        The more likely a cell is occupied, the more opaque it is drawn.
+        :param frame: The frame to be used
+        :param grid: The occupancy grid
+        """
+        cells, probabilities = grid.occupied_cells()
+        # The probabilities of the occupied cells lie between 0.5 and 1
+        levels = np.ceil((probabilities - 0.5) * 2 * OCCUPANCY_LEVELS)
+        for level in range(1, OCCUPANCY_LEVELS + 1):
+            corners = cells[levels == level] * grid.resolution
+            if len(corners) > 0:
+                frame.add_polygons(corners[:, np.newaxis, :] + UNIT_CELL * grid.resolution,
+                                   color=self.color, alpha=0.8 * level / OCCUPANCY_LEVELS)
@@ -17,29 +17,39 @@
 # Email mccrea.engineering@gmail.com for questions, comments, or to report bugs.
 
 
+from gui.TraversePath import TraversePath
 from plotters.ProximitySensorPlotter import *
 from plotters.SupervisorPlotter import *
 
 
 class RobotPlotter:
 
-    def __init__(self, robot):
+    def __init__(self, robot, traverse_path_cfg):
         """
         Initializes a RobotPlotter object
         :param robot: The underlying robot
+        :param traverse_path_cfg: The configuration of the traverse paths
         """
         self.robot = robot
         self.robot_shape = robot.robot_cfg["top_plate"]
 
         # add the supervisor plotter for this robot
-        self.supervisor_plotter = SupervisorPlotter(robot.supervisor, robot.geometry)
+        self.supervisor_plotter = SupervisorPlotter(robot.supervisor, robot.geometry, traverse_path_cfg)
 
         # add the IR sensor views for this robot
         self.ir_sensor_plotters = []
         for ir_sensor in robot.ir_sensors:
             self.ir_sensor_plotters.append(ProximitySensorPlotter(ir_sensor, radians(robot.robot_cfg["sensor"]["cone_angle"])))
 
-        self.traverse_path = []  # this robot's traverse path
+        self.traverse_path = TraversePath(traverse_path_cfg, "black", 0.01)  # this robot's traverse path
+
+    def update_traverse_paths(self):
+        """
+        Appends the current real and estimated positions of the robot to its traverse paths. This happens in every
+        simulation cycle, independent of whether the cycle is drawn.
+        """
+        self.traverse_path.append(self.robot.pose.vposition())
+        self.supervisor_plotter.update_traverse_path()
 
     def draw_robot_to_frame(self, frame, draw_invisibles=False):
         """
@@ -47,10 +57,6 @@ class RobotPlotter:
         :param frame: The frame to be used
         :param draw_invisibles: Boolean value specifying whether invisibles shall be drawn
         """
-        # update the robot traverse path
-        position = self.robot.pose.vposition()
-        self.traverse_path.append(position)
-
         # draw the internal state ( supervisor ) to the frame
         self.supervisor_plotter.draw_supervisor_to_frame(frame, draw_invisibles)
 
@@ -80,6 +86,4 @@ class RobotPlotter:
         Draws the real traverse path of the robot to the frame
         :param frame: The frame to be used
         """
-        frame.add_lines([self.traverse_path],
-                        color="black",
-                        linewidth=0.01)
+        frame.add_traverse_path(self.traverse_path)
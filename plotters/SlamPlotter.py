@@ -15,15 +15,35 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 # 
 # Email mccrea.engineering@gmail.com for questions, comments, or to report bugs.
-from models.obstacles.OctagonObstacle import OctagonObstacle
-from models.Pose import Pose
-from plotters.ObstaclePlotter import *
 from plotters.RobotPlotter import *
 from matplotlib import pyplot as plt
 import numpy as np
 
 from supervisor.slam.EKFSlam import EKFSlam
 
+# Vertices of a regular octagon with a distance of 1 from the center to its corners, as the octagon obstacles
+UNIT_OCTAGON = np.array([[0, 1],
+                         [1 / 2 ** 0.5, 1 / 2 ** 0.5],
+                         [1, 0],
+                         [1 / 2 ** 0.5, -1 / 2 ** 0.5],
+                         [0, -1],
+                         [-1 / 2 ** 0.5, -1 / 2 ** 0.5],
+                         [-1, 0],
+                         [-1 / 2 ** 0.5, 1 / 2 ** 0.5]])
+# Vertices of a square with a distance of 1 from the center to its corners
+UNIT_DIAMOND = np.array([[0, 1], [1, 0], [0, -1], [-1, 0]])
+# Scales the standard deviations along the principal axes of a landmark covariance to its 95% confidence ellipse,
+# the square root of the 95% quantile of the chi-squared distribution with 2 degrees of freedom
+CONFIDENCE_SCALE = 5.991 ** 0.5
+# Arrow pointing along the x axis, drawn for every particle of a particle cloud
+UNIT_ARROW = np.array([[1, 0], [-0.6, 0.5], [-0.6, -0.5]])
+# Size of the arrows of a particle cloud on the screen, independent of the zoom
+PARTICLE_PIXELS = 5
+# Unit square whose lower left corner lies at the origin, drawn for every cell of a particle heatmap
+UNIT_CELL = np.array([[0, 0], [1, 0], [1, 1], [0, 1]])
+# Number of distinct transparencies of the cells of a particle heatmap, every one is drawn as a single batch
+HEATMAP_LEVELS = 4
+
 
 class SlamPlotter:
 
@@ -42,28 +62,44 @@ class SlamPlotter:
         self.robot_bottom_shape = robot_config["bottom_plate"]
         self.robot_top_shape = robot_config["top_plate"]
         self.radius = radius
+        self.landmark_template = UNIT_OCTAGON * radius
 
-    def draw_slam_to_frame(self):
+    def draw_slam_to_frame(self, viewport):
         """
         Draws a SLAM visualization to the frame
+        :param viewport: Copy of the viewport that the frame is drawn for
         """
         frame = self.viewer.current_frames[self.frame_number]
         self.__draw_robot_to_frame(frame, self.slam.get_estimated_pose())
 
-        # draw all the obstacles
-        for landmark in self.slam.get_landmarks():
-            obstacle = OctagonObstacle(self.radius, Pose(landmark[0], landmark[1], 0))
-            obstacle_plotter = ObstaclePlotter(obstacle)
-            obstacle_plotter.draw_obstacle_to_frame(frame, "black", alpha=0.6)
+        # draw all the obstacles within the view at once, by translating the octagon template to every landmark.
+        # If the landmarks are small on the screen, a simpler template is used.
+        landmarks = np.array(self.slam.get_landmarks(), dtype=float).reshape(-1, 2)
+        lower, upper = viewport.bounds(margin=self.radius)
+        visible = np.all((landmarks >= lower) & (landmarks <= upper), axis=1)
+        template = self.landmark_template
+        if self.radius * viewport.pixels_per_meter < self.viewer.cfg["lod_pixels"]:
+            template = UNIT_DIAMOND * self.radius
+        frame.add_polygons(landmarks[visible, np.newaxis, :] + template[np.newaxis, :, :],
+                           color="black", alpha=0.6)
 
-        if self.viewer.draw_invisibles and isinstance(self.slam, EKFSlam):
+        if self.viewer.draw_invisibles and issubclass(self.slam.get_algorithm_class(), EKFSlam):
             self.__draw_confidence_ellipse(frame)
+        if self.viewer.draw_invisibles and self.viewer.cfg["landmark_ellipses"]:
+            self.__draw_landmark_ellipses(frame, landmarks, visible)
+        if self.viewer.draw_invisibles and self.viewer.cfg["particle_cloud"]["enabled"]:
+            self.__draw_particle_cloud(frame, viewport)
 
-    def plot_covariances(self):
+    def plot_covariances(self, cov=None):
         """
         Plots the covariance matrix
+        :param cov: A copy of the covariance matrix, None to plot the current matrix
         """
-        cov = self.slam.get_covariances()
+        if cov is None:
+            cov = self.slam.get_covariances()
+        if cov is None:
+            print("The covariance matrix is not available from a SLAM algorithm running in a separate process")
+            return
         plt.matshow(cov)
         plt.show()
 
@@ -90,7 +126,7 @@ class SlamPlotter:
         Draws confidence ellipses based on the covariance matrix to the frame. Only supported for EKFSLAM.
         :param frame: The frame to be used
         """
-        cov = self.slam.get_covariances()[:2, :2]  # Get covariances of position arguments
+        cov = self.slam.get_pose_covariance()[:2, :2]  # Get covariances of position arguments
         eigvals, eigvecs = np.linalg.eig(cov)
         if eigvals[0] < eigvals[1]:
             eigvals = eigvals[::-1]  # Swap eigenvalues as well as eigenvectors
@@ -100,3 +136,95 @@ class SlamPlotter:
         frame.add_ellipse(self.slam.get_estimated_pose().sunpack(),
                           angle, eigvals[0], eigvals[1],
                           color="red", alpha=0.5)
+
+    def __draw_landmark_ellipses(self, frame, landmarks, visible):
+        """
+        Draws the 95% confidence ellipses of all landmarks to the frame, if the algorithm provides the covariances of
+        the landmarks. The eigen decompositions of all 2x2 covariance matrices are computed at once in closed form.
+        :param frame: The frame to be used
+        :param landmarks: Array of shape (n, 2) holding the estimated landmark positions
+        :param visible: Boolean array specifying which landmarks lie within the view
+        """
+        covariances = self.slam.get_landmark_covariances()
+        if covariances is None or len(covariances) != len(landmarks):
+            return
+        landmarks = landmarks[visible]
+        covariances = covariances[visible]
+        a, b, c = covariances[:, 0, 0], covariances[:, 0, 1], covariances[:, 1, 1]
+        mean = (a + c) / 2
+        deviation = np.hypot((a - c) / 2, b)
+        # The eigenvalues are the variances along the principal axes, the major axis has the angle of the eigenvector
+        # of the larger eigenvalue
+        major = np.sqrt(np.maximum(mean + deviation, 0))
+        minor = np.sqrt(np.maximum(mean - deviation, 0))
+        angles = np.arctan2(2 * b, a - c) / 2
+        frame.add_ellipses(landmarks, angles, CONFIDENCE_SCALE * major, CONFIDENCE_SCALE * minor,
+                           color="dark orange", alpha=0.4)
+
+    def __draw_particle_cloud(self, frame, viewport):
+        """
+        Draws the particles within the view to the frame, if the algorithm provides them. Every particle is drawn as
+        an arrow along its heading, all arrows as a single batch. If there are more particles than configured, they
+        are either sampled in proportion to their importance factors or their density is drawn as a heatmap.
+        :param frame: The frame to be used
+        :param viewport: Copy of the viewport that the frame is drawn for
+        """
+        particles = self.slam.get_particles()
+        if particles is None:
+            return
+        poses, weights = particles
+        cloud_cfg = self.viewer.cfg["particle_cloud"]
+        size = PARTICLE_PIXELS / viewport.pixels_per_meter
+        lower, upper = viewport.bounds(margin=size)
+        visible = np.all((poses[:, :2] >= lower) & (poses[:, :2] <= upper), axis=1)
+        poses, weights = poses[visible], weights[visible]
+        if len(poses) > cloud_cfg["max_particles"]:
+            if cloud_cfg["heatmap"]:
+                self.__draw_particle_heatmap(frame, poses[:, :2], weights,
+                                             cloud_cfg["heatmap_cell_pixels"] / viewport.pixels_per_meter)
+                return
+            poses = poses[self.__sample_by_weight(weights, cloud_cfg["max_particles"])]
+        c, s = np.cos(poses[:, 2:3]), np.sin(poses[:, 2:3])
+        x, y = UNIT_ARROW[:, 0] * size, UNIT_ARROW[:, 1] * size
+        arrows = np.stack([c * x - s * y, s * x + c * y], axis=2) + poses[:, np.newaxis, :2]
+        frame.add_polygons(arrows, color="purple", alpha=0.5)
+
+    def __draw_particle_heatmap(self, frame, positions, weights, cell_size):
+        """
+        Draws the density of the particles to the frame. The importance factors of the particles are summed up in
+        cells of a fixed size on the screen, and every cell is drawn with a transparency according to its share of
+        the densest cell.
+        :param frame: The frame to be used
+        :param positions: Array of shape (n, 2) holding the positions of the particles
+        :param weights: Array of the importance factors of the particles
+        :param cell_size: Width of a cell in meters
+        """
+        # Every cell is identified by a single number, which is much faster to group by than rows of indices
+        cell_indices = np.floor(positions / cell_size).astype(np.int64)
+        lowest = cell_indices.min(axis=0)
+        height = cell_indices[:, 1].max() - lowest[1] + 1
+        keys, indices = np.unique((cell_indices[:, 0] - lowest[0]) * height + cell_indices[:, 1] - lowest[1],
+                                  return_inverse=True)
+        cells = np.stack([keys // height, keys % height], axis=1) + lowest
+        density = np.bincount(indices, weights=weights, minlength=len(cells))
+        if density.max() <= 0:
+            density = np.bincount(indices, minlength=len(cells)).astype(float)
+        levels = np.ceil(density / density.max() * HEATMAP_LEVELS)
+        for level in range(1, HEATMAP_LEVELS + 1):
+            corners = cells[levels == level] * cell_size
+            if len(corners) > 0:
+                frame.add_polygons(corners[:, np.newaxis, :] + UNIT_CELL * cell_size,
+                                   color="purple", alpha=0.8 * level / HEATMAP_LEVELS)
+
+    @staticmethod
+    def __sample_by_weight(weights, count):
+        """
+        Samples particles in proportion to their importance factors by systematic sampling with a fixed offset, so
+        that the drawn particles do not flicker between frames
+        :param weights: Array of the importance factors of the particles
+        :param count: The number of samples
+        :return: Array of the indices of the sampled particles, every particle is included at most once
+        """
+        cumulative = np.cumsum(weights)
+        samples = (np.arange(count) + 0.5) / count * cumulative[-1]
+        return np.unique(np.minimum(np.searchsorted(cumulative, samples), len(weights) - 1))
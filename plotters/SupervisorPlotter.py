@@ -15,6 +15,8 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 # 
 # Email mccrea.engineering@gmail.com for questions, comments, or to report bugs.
+from gui.TraversePath import TraversePath
+from plotters.OccupancyGridPlotter import OccupancyGridPlotter
 from plotters.controllers.AvoidObstaclesControllerPlotter import *
 from plotters.controllers.FollowWallControllerPlotter import *
 from plotters.controllers.GoToGoalControllerPlotter import *
@@ -23,11 +25,12 @@ from plotters.controllers.GTGAndAOControllerPlotter import *
 
 class SupervisorPlotter:
 
-    def __init__(self, supervisor, robot_geometry):
+    def __init__(self, supervisor, robot_geometry, traverse_path_cfg):
         """
         Initializes a SupervisorPlotter object
         :param supervisor: The underlying supervisor
         :param robot_geometry: The robot geometry
+        :param traverse_path_cfg: The configuration of the traverse paths
         """
         self.supervisor = supervisor
         self.supervisor_state_machine = supervisor.state_machine
@@ -40,21 +43,30 @@ class SupervisorPlotter:
 
         # additional information for rendering
         self.robot_geometry = robot_geometry  # robot geometry
-        self.robot_estimated_traverse_path = []  # path taken by robot's internal image
+        # path taken by robot's internal image
+        self.robot_estimated_traverse_path = TraversePath(traverse_path_cfg, "red", 0.005, alpha=0.5)
+        # occupancy grids mapped by the supervisor and by the grid-based FastSLAM
+        self.occupancy_grid_plotter = OccupancyGridPlotter("dark slate gray")
+        self.grid_slam_plotter = OccupancyGridPlotter("dark orchid")
+
+    def update_traverse_path(self):
+        """
+        Appends the current estimated position of the robot to its traverse path. This happens in every simulation
+        cycle, independent of whether the cycle is drawn.
+        """
+        self.robot_estimated_traverse_path.append(self.supervisor.estimated_pose.vposition())
 
     def draw_supervisor_to_frame(self, frame, draw_invisibles=False):
         """ Draw a representation of the supervisor's internal state to the frame
         :param frame: The frame to be used
         :param draw_invisibles: Boolean value
         """
-        # update the estimated robot traverse path
-        self.robot_estimated_traverse_path.append(self.supervisor.estimated_pose.vposition())
-
         # draw the goal to frame
         self._draw_goal_to_frame(frame)
 
         # draw the supervisor-generated data to frame if indicated
         if draw_invisibles:
+            self._draw_occupancy_grid_to_frame(frame)
             self._draw_robot_state_estimate_to_frame(frame)
             self._draw_current_controller_to_frame(frame)
 
@@ -76,6 +88,18 @@ class SupervisorPlotter:
                          color="black",
                          alpha=0.5)
 
+    def _draw_occupancy_grid_to_frame(self, frame):
+        """
+        Draws the occupancy grid that is available to the controllers, if occupancy grid mapping is enabled, and the
+        occupancy grid of the best particle of the grid-based FastSLAM, if it is enabled
+        :param frame: The frame to be used
+        """
+        grid = self.supervisor.controller_interface.occupancy_grid()
+        if grid is not None:
+            self.occupancy_grid_plotter.draw_occupancy_grid_to_frame(frame, grid)
+        if self.supervisor.gridfastslam is not None:
+            self.grid_slam_plotter.draw_occupancy_grid_to_frame(frame, self.supervisor.gridfastslam.get_occupancy_grid())
+
     def _draw_robot_state_estimate_to_frame(self, frame):
         """
         Draws the current robot state estimate based on odometric information only
@@ -89,10 +113,7 @@ class SupervisorPlotter:
                         alpha=0.5)
 
         # draw the estimated traverse path of the robot
-        frame.add_lines([self.robot_estimated_traverse_path],
-                        linewidth=0.005,
-                        color="red",
-                        alpha=0.5)
+        frame.add_traverse_path(self.robot_estimated_traverse_path)
 
     def _draw_current_controller_to_frame(self, frame):
         """
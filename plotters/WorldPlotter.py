@@ -17,8 +17,17 @@
 # Email mccrea.engineering@gmail.com for questions, comments, or to report bugs.
 
 
+import numpy as np
+
+from gui.Frame import Frame
 from plotters.ObstaclePlotter import *
 from plotters.RobotPlotter import *
+from utils.grid_index_util import GridIndex
+
+# Vertices of a square with a distance of 1 from the center to its sides
+UNIT_SQUARE = np.array([[-1, -1], [1, -1], [1, 1], [-1, 1]])
+# Minor gridlines that would be closer than this many pixels are omitted
+MIN_GRIDLINE_SPACING_PIXELS = 4
 
 
 class WorldPlotter:
@@ -41,12 +50,25 @@ class WorldPlotter:
         for obstacle in world.obstacles:
             self.add_obstacle(obstacle)
 
+        # The obstacles are indexed by the centers of their bounding circles, so that only the obstacles within the
+        # view are drawn
+        bounding_circles = [obstacle.global_geometry.bounding_circle for obstacle in world.obstacles]
+        self.obstacle_centers = np.array([center for center, _ in bounding_circles], dtype=float).reshape(-1, 2)
+        self.obstacle_radii = np.array([radius for _, radius in bounding_circles], dtype=float)
+        self.obstacle_index = GridIndex(self.obstacle_centers)
+
+        # The grid and the obstacles do not move, so they are drawn onto static layers, which are only drawn and
+        # rendered again if the view changes. A new map creates a new WorldPlotter and thereby new layers.
+        self.view_key = None
+        self.grid_layer = None
+        self.map_layer = None
+
     def add_robot(self, robot):
         """
         Adds a robot plotter object
         :param robot: The underlying robot
         """
-        robot_plotter = RobotPlotter(robot)
+        robot_plotter = RobotPlotter(robot, self.viewer.cfg["traverse_path"])
         self.robot_plotters.append(robot_plotter)
 
     def add_obstacle(self, obstacle):
@@ -57,79 +79,89 @@ class WorldPlotter:
         obstacle_plotter = ObstaclePlotter(obstacle)
         self.obstacle_plotters.append(obstacle_plotter)
 
-    def draw_world_to_frame(self):
+    def update_traverse_paths(self):
+        """
+        Updates the traverse paths of all robots, which must not miss a simulation cycle that is not drawn
+        """
+        for robot_plotter in self.robot_plotters:
+            robot_plotter.update_traverse_paths()
+
+    def draw_world_to_frame(self, viewport):
         """
         Draw the world to the frame
+        :param viewport: Copy of the viewport that the frame is drawn for
         """
-        # draw the grid
-        self._draw_grid_to_frame()
+        # draw the grid and the obstacles, the SLAM frames only show the true obstacles as invisibles
+        if self.view_key != viewport.key():
+            self._draw_static_layers(viewport)
+        self.viewer.current_frames[0].set_static_layer(self.map_layer)
+        for frame in self.viewer.current_frames[1:]:
+            frame.set_static_layer(self.map_layer if self.viewer.draw_invisibles else self.grid_layer)
 
         # draw all the robots
         for robot_plotter in self.robot_plotters:
             robot_plotter.draw_robot_to_frame(self.viewer.current_frames[0], self.viewer.draw_invisibles)
 
-        # draw all the obstacles
-        for obstacle_plotter in self.obstacle_plotters:
-            obstacle_plotter.draw_obstacle_to_frame(self.viewer.current_frames[0])
-            if self.viewer.draw_invisibles:
-                for frame in self.viewer.current_frames[1:]:
-                    obstacle_plotter.draw_obstacle_to_frame(frame)
-
-    def _draw_grid_to_frame(self):
+    def _draw_static_layers(self, viewport):
         """
-        Draw the grid of the world
+        Draws the grid and the obstacles within the view onto the static layers.
+        Obstacles that are smaller on the screen than the level of detail threshold are drawn as boxes.
+        :param viewport: Copy of the viewport that the layers are drawn for
         """
-        # NOTE: THIS FORMULA ASSUMES THE FOLLOWING:
-        # - Window size never changes
-        # - Window is always centered at (0, 0)
-
-        major_gridline_interval = self.viewer.cfg["major_gridline_interval"]
+        self.view_key = viewport.key()
+        self.grid_layer = Frame(viewport)
+        self._draw_grid_to_frame(self.grid_layer, viewport)
+        self.map_layer = Frame(viewport)
+        self._draw_grid_to_frame(self.map_layer, viewport)
+
+        lower, upper = viewport.bounds(margin=np.max(self.obstacle_radii, initial=0.0))
+        visible = self.obstacle_index.within(lower, upper)
+        small = self.obstacle_radii[visible] * viewport.pixels_per_meter < self.viewer.cfg["lod_pixels"]
+        for i in visible[~small]:
+            self.obstacle_plotters[i].draw_obstacle_to_frame(self.map_layer)
+        boxes = self.obstacle_centers[visible[small], np.newaxis, :] + \
+            self.obstacle_radii[visible[small], np.newaxis, np.newaxis] * UNIT_SQUARE[np.newaxis, :, :]
+        self.map_layer.add_polygons(boxes, color="dark red", alpha=0.4)
+
+    def _draw_grid_to_frame(self, frame, viewport):
+        """
+        Draw the grid of the world within the view
+        :param frame: The frame to be used
+        :param viewport: Copy of the viewport that the frame is drawn for
+        """
+        major_gridline_subdivisions = self.viewer.cfg["major_gridline_subdivisions"]
         # calculate minor gridline interval
-        minor_gridline_interval = major_gridline_interval / self.viewer.cfg["major_gridline_subdivisions"]
-
-        # determine world space to draw grid upon
-        meters_per_pixel = 1.0 / self.viewer.pixels_per_meter
-        width = meters_per_pixel * self.viewer.view_width_pixels
-        height = meters_per_pixel * self.viewer.view_height_pixels
-        x_halfwidth = width * 0.5
-        y_halfwidth = height * 0.5
+        minor_gridline_interval = self.viewer.cfg["major_gridline_interval"] / major_gridline_subdivisions
+        meters_per_pixel = 1.0 / viewport.pixels_per_meter
 
-        x_max = int(x_halfwidth / minor_gridline_interval)
-        y_max = int(y_halfwidth / minor_gridline_interval)
+        # determine world space to draw grid upon, the gridlines are numbered by their multiple of the minor interval
+        lower, upper = viewport.bounds()
+        first = np.ceil(lower / minor_gridline_interval).astype(int)
+        last = np.floor(upper / minor_gridline_interval).astype(int)
 
         # build the gridlines
         major_lines_accum = []  # accumulator for major gridlines
         minor_lines_accum = []  # accumulator for minor gridlines
-
-        for i in range(x_max + 1):  # build the vertical gridlines
-            x = i * minor_gridline_interval
-
-            if x % major_gridline_interval == 0:  # sort major from minor
-                accum = major_lines_accum
-            else:
-                accum = minor_lines_accum
-
-            accum.append([[x, -y_halfwidth], [x, y_halfwidth]])  # positive-side gridline
-            accum.append([[-x, -y_halfwidth], [-x, y_halfwidth]])  # negative-side gridline
-
-        for j in range(y_max + 1):  # build the horizontal gridlines
-            y = j * minor_gridline_interval
-
-            if y % major_gridline_interval == 0:  # sort major from minor
-                accum = major_lines_accum
-            else:
-                accum = minor_lines_accum
-
-            accum.append([[-x_halfwidth, y], [x_halfwidth, y]])  # positive-side gridline
-            accum.append([[-x_halfwidth, -y], [x_halfwidth, -y]])  # negative-side gridline
+        for axis in range(2):
+            numbers = np.arange(first[axis], last[axis] + 1)
+            lines = np.empty((len(numbers), 2, 2))
+            lines[:, :, axis] = numbers[:, np.newaxis] * minor_gridline_interval
+            lines[:, 0, 1 - axis] = lower[1 - axis]
+            lines[:, 1, 1 - axis] = upper[1 - axis]
+            major = numbers % major_gridline_subdivisions == 0  # sort major from minor
+            major_lines_accum.extend(lines[major])
+            minor_lines_accum.extend(lines[~major])
+
+        # minor gridlines are omitted if they would be too dense to be distinguished
+        if minor_gridline_interval * viewport.pixels_per_meter < MIN_GRIDLINE_SPACING_PIXELS:
+            minor_lines_accum = []
 
         # draw the gridlines
-        for current_frame in self.viewer.current_frames:
-            current_frame.add_lines(major_lines_accum,  # draw major gridlines
-                                    linewidth=meters_per_pixel,  # roughly 1 pixel
-                                    color="black",
-                                    alpha=0.2)
-            current_frame.add_lines(minor_lines_accum,  # draw minor gridlines
-                                    linewidth=meters_per_pixel,  # roughly 1 pixel
-                                    color="black",
-                                    alpha=0.1)
+        frame.add_lines(major_lines_accum,  # draw major gridlines
+                        linewidth=meters_per_pixel,  # roughly 1 pixel
+                        color="black",
+                        alpha=0.2)
+        frame.add_lines(minor_lines_accum,  # draw minor gridlines
+                        linewidth=meters_per_pixel,  # roughly 1 pixel
+                        color="black",
+                        alpha=0.1)
@@ -19,6 +19,7 @@
 # Email mccrea.engineering@gmail.com for questions, comments, or to report bugs.
 
 import sys
+import time
 import yaml
 import gi
 from gi.repository import GLib
@@ -30,7 +31,10 @@ gi.require_version('Gtk', '3.0')
 from gi.repository import Gtk as gtk
 
 import gui.Frame
+import gui.FrameRecorder
+import gui.OffscreenViewer
 import gui.Viewer
+from simulation.SimulationThread import SimulationThread
 
 from simulation.MapManager import *
 from robot.Robot import *
@@ -48,13 +52,23 @@ class Simulator:
         Initializes a Simulator object
         :param cfg: The simulators configuration
         """
-        # create the GUI
+        # create the GUI, or only the frames if the simulation runs without a display
         self.num_frames = 1
         if cfg["slam"]["ekf_slam"]["enabled"]:
             self.num_frames += 1
         if cfg["slam"]["fast_slam"]["enabled"]:
             self.num_frames += 1
-        self.viewer = gui.Viewer.Viewer(self, cfg["viewer"], self.num_frames, cfg["slam"]["ekf_slam"]["enabled"], cfg["slam"]["evaluation"]["enabled"])
+        self.headless = cfg["recording"]["enabled"] and cfg["recording"]["headless"]
+        self.threaded = cfg["threaded"] and not self.headless
+        if self.headless:
+            self.viewer = gui.OffscreenViewer.OffscreenViewer(cfg["viewer"], self.num_frames,
+                                                              cfg["recording"]["draw_invisibles"])
+        else:
+            self.viewer = gui.Viewer.Viewer(self, cfg["viewer"], self.num_frames, cfg["slam"]["ekf_slam"]["enabled"], cfg["slam"]["evaluation"]["enabled"], self.threaded)
+        # create the recorder of the frames
+        self.recorder = None
+        if cfg["recording"]["enabled"]:
+            self.recorder = gui.FrameRecorder.FrameRecorder(cfg["recording"], self.viewer.viewport, self.num_frames)
         self.ekfslam_plotter = None
         self.fastslam_plotter = None
         self.ekfslam_evaluation = None
@@ -68,16 +82,43 @@ class Simulator:
         # timing control
         self.period = cfg["period"]
 
+        # frame pacing: the world is drawn at most at the maximum frame rate, independent of the simulation rate
+        max_fps = cfg["viewer"]["max_fps"]
+        self.frame_interval = 0.0 if max_fps is None else 1.0 / max_fps
+        self.last_draw_time = None
+        # whether the world changed since it was last drawn
+        self.dirty = False
+        # gtk event source of a pending draw, which shows the latest cycle once the frame interval has passed
+        self.draw_event_source = None
+
         # Counts the number of simulation cycles
         self.num_cycles = 0
 
         self.cfg = cfg
 
-        # gtk simulation event source - for simulation control
-        self.sim_event_source = GLib.idle_add(self.initialize_sim, True)  # we use this opportunity to initialize the sim
+        if self.headless:
+            self.running = False
+            self.initialize_sim(True)
+            self._run_headless()
+        elif self.threaded:
+            # the simulation thread owns the simulated world, the gtk main loop shows the latest frames on its own clock
+            self.sim_thread = SimulationThread(self._step_sim, self.period)
+            self.sim_thread.request(self.initialize_sim, True)
+            GLib.timeout_add(int((self.frame_interval or self.period) * 1000), self._request_threaded_draw)
+
+            # start gtk
+            gtk.main()
+            self.sim_thread.stop()
+        else:
+            # gtk simulation event source - for simulation control
+            self.sim_event_source = GLib.idle_add(self.initialize_sim, True)  # we use this opportunity to initialize the sim
 
-        # start gtk
-        gtk.main()
+            # start gtk
+            gtk.main()
+
+        # render the remaining recorded frames
+        if self.recorder is not None:
+            self.recorder.close()
 
     def initialize_sim(self, random=False):
         """
@@ -85,7 +126,15 @@ class Simulator:
         :param random: Boolean value specifying if a random map shall be generated
         """
         # reset the viewer
-        self.viewer.control_panel_state_init()
+        self._call_gui(self.viewer.control_panel_state_init)
+
+        # export the SLAM evaluations of the previous run
+        self._export_slam_evaluations()
+
+        # stop the SLAM algorithms of the previous world
+        if self.world is not None:
+            for supervisor in self.world.supervisors:
+                supervisor.stop_slam()
 
         # create the simulation world
         self.world = World(self.period)
@@ -118,22 +167,29 @@ class Simulator:
                 self.fastslam_evaluation = SlamEvaluation(self.world.supervisors[0].fastslam, self.cfg["slam"]["evaluation"])
 
         # render the initial world
+        self.world_plotter.update_traverse_paths()
         self.draw_world()
 
     def play_sim(self):
         """
         Start or continue the simulation
         """
-        GLib.source_remove(
-            self.sim_event_source)  # this ensures multiple calls to play_sim do not speed up the simulator
-        self._run_sim()
+        if self.threaded:
+            self.sim_thread.play()
+        else:
+            GLib.source_remove(
+                self.sim_event_source)  # this ensures multiple calls to play_sim do not speed up the simulator
+            self._run_sim()
         self.viewer.control_panel_state_playing()
 
     def pause_sim(self):
         """
         Pause the simulation
         """
-        GLib.source_remove(self.sim_event_source)
+        if self.threaded:
+            self.sim_thread.pause()
+        else:
+            GLib.source_remove(self.sim_event_source)
         self.viewer.control_panel_state_paused()
 
     def step_sim_once(self):
@@ -141,62 +197,190 @@ class Simulator:
         Progress the simulation by exactly one simulation cycle
         """
         self.pause_sim()
-        self._step_sim()
+        self._call_sim(self._step_sim)
 
     def end_sim(self, alert_text=''):
         """
         End the simulation
         :param alert_text: Test to be displayed to the user
         """
-        GLib.source_remove(self.sim_event_source)
-        self.viewer.control_panel_state_finished(alert_text)
+        if self.headless:
+            self.running = False
+        elif self.threaded:
+            self.sim_thread.pause()
+        else:
+            GLib.source_remove(self.sim_event_source)
+        self._call_gui(self.viewer.control_panel_state_finished, alert_text)
+        self._export_slam_evaluations()
 
     def reset_sim(self):
         """
         Reset the simulated world
         """
         self.pause_sim()
-        self.initialize_sim()
+        self._call_sim(self.initialize_sim)
 
     def save_map(self, filename):
         """
         Save the map
         :param filename: Filename under which the map shall be stored
         """
-        self.map_manager.save_map(filename)
+        self._call_sim(self.map_manager.save_map, filename)
 
     def load_map(self, filename):
         """
 
         :param filename:
         """
-        self.map_manager.load_map(filename)
+        self._call_sim(self.map_manager.load_map, filename)
         self.reset_sim()
 
     def random_map(self):
         self.pause_sim()
-        self.initialize_sim(random=True)
+        self._call_sim(self.initialize_sim, True)
 
     def draw_world(self):
-        self.viewer.new_frame()  # start a fresh frame
-        self.world_plotter.draw_world_to_frame()  # draw the world onto the frame
+        self.dirty = False
+        self.last_draw_time = time.perf_counter()
+        # All plotters draw for the same view, which is stored in the frames, so that they are painted for it as well
+        viewport = self.viewer.viewport.copy()
+        self.viewer.new_frame(viewport)  # start a fresh frame
+        self.world_plotter.draw_world_to_frame(viewport)  # draw the world onto the frame
         if self.ekfslam_plotter is not None:
-            self.ekfslam_plotter.draw_slam_to_frame()
+            self.ekfslam_plotter.draw_slam_to_frame(viewport)
         if self.fastslam_plotter is not None:
-            self.fastslam_plotter.draw_slam_to_frame()
+            self.fastslam_plotter.draw_slam_to_frame(viewport)
         self.viewer.draw_frame()  # render the frame
+        if self.recorder is not None:
+            self.recorder.record(self.viewer.current_frames, self.num_cycles)
+
+    def plot_slam_evaluations(self):
+        """
+        Plots the SLAM evaluations. The evaluations are copied in the thread that owns the world, while the blocking
+        plots are shown in the gtk main loop.
+        """
+        self._call_sim(self._copy_slam_evaluations)
+
+    def plot_covariances(self):
+        """
+        Plots the covariance matrix of the EKF SLAM, copied in the thread that owns the world
+        """
+        self._call_sim(self._copy_covariances)
+
+    def change_view(self, function, *args):
+        """
+        Changes the view and draws the world again. The view is changed in the thread that owns the world, so that it
+        does not change while the world is drawn.
+        :param function: The method of the viewport that changes the view
+        :param args: The arguments of the method
+        """
+        self._call_sim(self._change_view, function, args)
+
+    def _change_view(self, function, args):
+        function(*args)
+        self.draw_world()
+
+    def redraw_world(self):
+        """
+        Draws the world again, e.g. after the view or the displayed elements changed
+        """
+        self._call_sim(self.draw_world)
+
+    def draw_pending_world(self):
+        """
+        Draws the world if it changed since it was last drawn, e.g. while the window was hidden
+        """
+        if self.dirty:
+            self.draw_world()
+
+    def _request_draw(self):
+        # Draw the world now if it is recorded in this cycle or the frame interval has passed since the last drawing.
+        # Otherwise only the latest cycle is drawn once the interval has passed, and nothing is drawn while it is not
+        # visible. With a simulation thread, the gtk main loop requests the drawing on its own clock.
+        self.dirty = True
+        if self.recorder is not None and self.recorder.wants(self.num_cycles):
+            self.draw_world()
+        elif self.threaded or not self.viewer.is_visible() or self.draw_event_source is not None:
+            return
+        else:
+            remaining = self.frame_interval - (time.perf_counter() - self.last_draw_time)
+            if remaining <= 0:
+                self.draw_world()
+            else:
+                self.draw_event_source = GLib.timeout_add(max(int(remaining * 1000), 1), self._draw_scheduled)
+
+    def _draw_scheduled(self):
+        # Draws the latest cycle that was held back by the frame rate limit
+        self.draw_event_source = None
+        if self.viewer.is_visible():
+            self.draw_pending_world()
+        return False  # the event source is removed
+
+    def _request_threaded_draw(self):
+        # Runs on the clock of the gtk main loop and lets the simulation thread draw the latest cycle between two
+        # simulation cycles, if it changed and is visible
+        if self.dirty and self.viewer.is_visible():
+            self.sim_thread.request(self.draw_pending_world)
+        return True  # the event source is kept
+
+    def _copy_slam_evaluations(self):
+        # Copies the data of the SLAM evaluations and hands them to the gtk main loop for plotting
+        evaluations = [(evaluation, evaluation.get_plot_data())
+                       for evaluation in [self.ekfslam_evaluation, self.fastslam_evaluation] if evaluation is not None]
+        self._call_gui(self._plot_slam_evaluations, evaluations)
+
+    def _plot_slam_evaluations(self, evaluations):
+        # Plots the copied data of the SLAM evaluations
+        for evaluation, plot_data in evaluations:
+            evaluation.plot(plot_data)
+
+    def _copy_covariances(self):
+        # Copies the covariance matrix of the EKF SLAM and hands it to the gtk main loop for plotting
+        plotter = self.ekfslam_plotter
+        self._call_gui(plotter.plot_covariances, plotter.slam.get_covariances())
+
+    def _call_sim(self, function, *args):
+        # Executes a function that accesses the simulated world in the thread that owns the world
+        if self.threaded:
+            self.sim_thread.request(function, *args)
+        else:
+            function(*args)
+
+    def _call_gui(self, function, *args):
+        # Executes a function that accesses the gtk widgets in the gtk main loop
+        if self.threaded:
+            GLib.idle_add(function, *args)
+        else:
+            function(*args)
 
     def _run_sim(self):
         self.sim_event_source = GLib.timeout_add(int(self.period * 1000), self._run_sim)
         self._step_sim()
 
+    def _run_headless(self):
+        # Step the simulation as fast as possible until it ends or the configured number of cycles is reached
+        self.running = True
+        while self.running and self.num_cycles < self.cfg["recording"]["max_cycles"]:
+            self._step_sim()
+        if self.running:
+            self.end_sim("Maximum number of cycles reached")
+        for supervisor in self.world.supervisors:
+            supervisor.stop_slam()
+
+    def _export_slam_evaluations(self):
+        # Write the summaries of the trajectory errors of the current run to files
+        if self.ekfslam_evaluation is not None:
+            self.ekfslam_evaluation.export()
+        if self.fastslam_evaluation is not None:
+            self.fastslam_evaluation.export()
+
     def _update_slam_accuracies(self):
         # Only perform the SLAM evaluation on specific simulation cycles. The period is configurable.
         if self.num_cycles % self.cfg["slam"]["evaluation"]["interval"] == 0:
             if self.ekfslam_evaluation is not None:
-                self.ekfslam_evaluation.evaluate(self.world.obstacles)
+                self.ekfslam_evaluation.evaluate(self.world.obstacles, self.world.robots[0].pose)
             if self.fastslam_evaluation is not None:
-                self.fastslam_evaluation.evaluate(self.world.obstacles)
+                self.fastslam_evaluation.evaluate(self.world.obstacles, self.world.robots[0].pose)
 
     def _step_sim(self):
         self.num_cycles += 1
@@ -215,8 +399,9 @@ class Simulator:
         # Evaluate accuracies of slam
         self._update_slam_accuracies()
 
-        # draw the resulting world
-        self.draw_world()
+        # record the traverse paths and draw the resulting world, if it is shown or recorded
+        self.world_plotter.update_traverse_paths()
+        self._request_draw()
 
 
 if __name__ == "__main__":
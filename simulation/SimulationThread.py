@@ -0,0 +1,93 @@
+"""
+Execution of the simulation in a dedicated thread.
+The simulation is stepped at its own rate, independent of the GUI, so that slow drawing or a blocking plot in the
+GUI does not stall the simulation and vice versa. Requests of the GUI, e.g. pausing or resetting the simulation,
+are executed in the simulation thread between two simulation cycles, so that the simulated world is only ever
+accessed by this thread.
+"""
+
+import queue
+import threading
+import time
+
+
+class SimulationThread:
+
+    def __init__(self, step, period):
+        """
+        Creates a SimulationThread object and starts its thread, initially without stepping the simulation
+        :param step: Function that executes a single simulation cycle
+        :param period: The time in seconds between the starts of two simulation cycles
+        """
+        self.step = step
+        self.period = period
+        # Pending requests, each consisting of a function and its arguments, or None to stop the thread
+        self.requests = queue.Queue()
+        # The following attributes are only accessed by the simulation thread
+        self.running = False
+        self.next_step_time = None
+
+        self.thread = threading.Thread(target=self.__run, daemon=True)
+        self.thread.start()
+
+    def request(self, function, *args):
+        """
+        Requests a function to be executed by the simulation thread before the next simulation cycle
+        :param function: The function to be executed
+        :param args: The arguments of the function
+        """
+        self.requests.put((function, args))
+
+    def play(self):
+        """
+        Requests the simulation to be stepped periodically
+        """
+        self.request(self.__set_running, True)
+
+    def pause(self):
+        """
+        Requests the simulation to stop being stepped
+        """
+        self.request(self.__set_running, False)
+
+    def stop(self):
+        """
+        Executes the pending requests and stops the simulation thread
+        """
+        self.requests.put(None)
+        self.thread.join()
+
+    def __run(self):
+        """
+        Executes the requests and steps the simulation while it is running, until the thread is stopped
+        """
+        while True:
+            try:
+                request = self.requests.get(timeout=self.__time_to_next_step())
+            except queue.Empty:
+                self.step()
+                # A cycle that took longer than the period delays the following cycles instead of being caught up
+                self.next_step_time = max(self.next_step_time + self.period, time.perf_counter())
+                continue
+            if request is None:
+                break
+            function, args = request
+            function(*args)
+
+    def __time_to_next_step(self):
+        """
+        Returns how long to wait for requests before the next simulation cycle
+        :return: The time in seconds, or None if the simulation is not running
+        """
+        if not self.running:
+            return None
+        return max(self.next_step_time - time.perf_counter(), 0.0)
+
+    def __set_running(self, running):
+        """
+        Starts or stops stepping the simulation, the first cycle is executed immediately
+        :param running: Boolean value specifying whether the simulation is stepped
+        """
+        if running and not self.running:
+            self.next_step_time = time.perf_counter()
+        self.running = running
@@ -16,6 +16,10 @@
 # 
 # Email mccrea.engineering@gmail.com for questions, comments, or to report bugs.
 from supervisor.slam.FastSlam import FastSlam
+from supervisor.slam.GridFastSlam import GridFastSlam
+from supervisor.slam.OccupancyGridMapper import OccupancyGridMapper
+from supervisor.slam.SlamProcess import SlamProcess, SlamProcessInterface
+from supervisor.slam.SlamWorker import SlamWorker
 from supervisor.controllers.GTGAndAOController import *
 from supervisor.controllers.FollowWallController import *
 from supervisor.controllers.GoToAngleController import *
@@ -69,6 +73,7 @@ class Supervisor:
 
         # controllers
         controller_interface = SupervisorControllerInterface(self)
+        self.controller_interface = controller_interface
         self.go_to_angle_controller = GoToAngleController(controller_interface)
         self.go_to_goal_controller = GoToGoalController(controller_interface)
         self.avoid_obstacles_controller = AvoidObstaclesController(controller_interface)
@@ -78,12 +83,20 @@ class Supervisor:
         # slam
         self.ekfslam = None
         self.fastslam = None
+        self.gridfastslam = None
         if cfg["slam"]["ekf_slam"]["enabled"]:
             print("Using EKF SLAM")
-            self.ekfslam = EKFSlam(controller_interface, cfg["slam"], step_time=cfg["period"])
+            self.ekfslam = self._create_slam(EKFSlam, controller_interface, cfg)
         if cfg["slam"]["fast_slam"]["enabled"]:
             print("Using FastSLAM")
-            self.fastslam = FastSlam(controller_interface, cfg["slam"], step_time=cfg["period"])
+            self.fastslam = self._create_slam(FastSlam, controller_interface, cfg)
+        if cfg["slam"]["grid_fast_slam"]["enabled"]:
+            print("Using grid-based FastSLAM")
+            self.gridfastslam = self._create_slam(GridFastSlam, controller_interface, cfg)
+        self.occupancy_grid_mapper = None
+        if cfg["slam"]["occupancy_grid"]["enabled"]:
+            self.occupancy_grid_mapper = OccupancyGridMapper(controller_interface, cfg["slam"]["occupancy_grid"])
+            self.occupancy_grid_pose = cfg["slam"]["occupancy_grid"]["pose"]
 
         # state machine
         self.state_machine = SupervisorStateMachine(self, self.control_cfg)
@@ -108,6 +121,28 @@ class Supervisor:
         self.v_l = 0.0
         self.v_r = 0.0
 
+    def _create_slam(self, algorithm, controller_interface, cfg):
+        """
+        Creates a SLAM algorithm that is executed according to the configured execution mode
+        :param algorithm: The class of the SLAM algorithm
+        :param controller_interface: The interface through which the algorithm interacts with this supervisor
+        :param cfg: The configuration of the simulator
+        :return: The SLAM algorithm
+        """
+        mode = cfg["slam"]["execution"]["mode"]
+        if mode == "process" and algorithm is GridFastSlam:
+            # The occupancy grid does not fit into the shared memory of a process, so a worker thread is used instead
+            mode = "thread"
+        if mode == "process":
+            # The algorithm lives in a separate process, which cannot access this supervisor
+            interface = SlamProcessInterface(self.proximity_sensor_max_range, self.proximity_sensor_placements)
+            return SlamProcess(algorithm, interface, cfg["slam"], cfg["period"], len(self.proximity_sensor_placements))
+        slam = algorithm(controller_interface, cfg["slam"], step_time=cfg["period"])
+        if mode == "thread":
+            # Update the algorithm asynchronously to the control loop
+            slam = SlamWorker(slam, cfg["slam"]["execution"])
+        return slam
+
     def step(self, dt):
         """
         Simulate this supervisor running for one time increment
@@ -207,10 +242,41 @@ class Supervisor:
         motion_command = np.array([[v], [yaw]])
         measured_distances = self.proximity_sensor_distances_from_robot_center
         sensor_angles = [pose.theta for pose in self.proximity_sensor_placements]
+        positive_detections = self.controller_interface.proximity_sensor_positive_detections()
+        # Only the measurements of sensors that actually observed a landmark are passed to the SLAM algorithms
+        measurements = [measurement for (measurement, detected) in
+                        zip(zip(measured_distances, sensor_angles), positive_detections) if detected]
+        if self.ekfslam is not None:
+            self.ekfslam.update(motion_command, measurements)
+        if self.fastslam is not None:
+            self.fastslam.update(motion_command, measurements)
+        if self.gridfastslam is not None:
+            self.gridfastslam.update(motion_command, measurements)
+        if self.occupancy_grid_mapper is not None:
+            self.occupancy_grid_mapper.update(self._occupancy_grid_pose(), self.proximity_sensor_distances,
+                                              positive_detections)
+
+    def _occupancy_grid_pose(self):
+        """
+        Returns the pose estimate that the occupancy grid is mapped with.
+        Falls back to the odometry if the configured SLAM algorithm is disabled.
+        """
+        if self.occupancy_grid_pose == "ekf_slam" and self.ekfslam is not None:
+            return self.ekfslam.get_estimated_pose()
+        if self.occupancy_grid_pose == "fast_slam" and self.fastslam is not None:
+            return self.fastslam.get_estimated_pose()
+        return self.estimated_pose
+
+    def stop_slam(self):
+        """
+        Stops the SLAM algorithms, releasing the workers that execute them asynchronously to the control loop
+        """
         if self.ekfslam is not None:
-            self.ekfslam.update(motion_command, zip(measured_distances, sensor_angles))
+            self.ekfslam.stop()
         if self.fastslam is not None:
-            self.fastslam.update(motion_command, zip(measured_distances, sensor_angles))
+            self.fastslam.stop()
+        if self.gridfastslam is not None:
+            self.gridfastslam.stop()
 
     def _send_robot_commands(self):
         """
@@ -57,6 +57,14 @@ class SupervisorControllerInterface:
         else:
             None
 
+    def occupancy_grid(self):
+        """
+        :return: The occupancy grid that is mapped by the supervisor, None if occupancy grid mapping is disabled
+        """
+        if self.supervisor.occupancy_grid_mapper is not None:
+            return self.supervisor.occupancy_grid_mapper.get_occupancy_grid()
+        return None
+
     def proximity_sensor_placements(self):
         """
         :return: The placement poses of the robot's sensors
@@ -0,0 +1,232 @@
+"""
+Storage of the covariance matrix of the EKF SLAM.
+The EKF SLAM only accesses the covariance matrix through the operations of these classes, so that it can either be held
+in memory or, for very large maps, in a memory-mapped file whose size is not bounded by the memory of the process.
+"""
+
+import tempfile
+
+import numpy as np
+
+# Number of tiles per row and column that the tiled storage allocates in addition to the ones it needs, so that growing
+# the matrix only moves it to a new file every few landmarks without multiplying the size of the file
+TILE_MARGIN = 2
+
+
+class CovarianceStorage:
+    """
+    An abstract class for the storage of a symmetric covariance matrix.
+    Entries are returned as float64, independent of the data type that they are stored with.
+    """
+
+    def entries(self, rows, cols):
+        """
+        Returns entries of the matrix
+        :param rows: Integer array of row indices
+        :param cols: Integer array of column indices, broadcastable with the row indices
+        :return: Array of the entries
+        """
+        raise NotImplementedError()
+
+    def set_entries(self, rows, cols, values):
+        """
+        Sets entries of the matrix
+        :param rows: Integer array of row indices
+        :param cols: Integer array of column indices, broadcastable with the row indices
+        :param values: Array of the values
+        """
+        raise NotImplementedError()
+
+    def subtract_outer(self, A, B):
+        """
+        Subtracts the product of two matrices from the matrix
+        :param A: Matrix of shape (n, k)
+        :param B: Matrix of shape (k, n)
+        """
+        raise NotImplementedError()
+
+    def grow(self, k):
+        """
+        Appends rows and columns of zeros to the matrix
+        :param k: Number of appended rows and columns
+        """
+        raise NotImplementedError()
+
+    def compact(self, ids):
+        """
+        Removes rows and columns from the matrix
+        :param ids: Increasing array of the indices of the rows and columns that are kept
+        """
+        raise NotImplementedError()
+
+    def block(self, ids):
+        """
+        Returns the sub-matrix of the specified rows and columns
+        :param ids: Integer array of indices
+        :return: Sub-matrix of shape (len(ids), len(ids))
+        """
+        ids = np.asarray(ids)
+        return self.entries(ids[:, np.newaxis], ids[np.newaxis, :])
+
+    def set_block(self, ids, values):
+        """
+        Sets the sub-matrix of the specified rows and columns
+        :param ids: Integer array of indices
+        :param values: Sub-matrix of shape (len(ids), len(ids))
+        """
+        ids = np.asarray(ids)
+        self.set_entries(ids[:, np.newaxis], ids[np.newaxis, :], values)
+
+    def columns(self, ids):
+        """
+        Returns the specified columns of the matrix
+        :param ids: Integer array of column indices
+        :return: Matrix of shape (size, len(ids))
+        """
+        return self.entries(np.arange(self.size)[:, np.newaxis], np.asarray(ids)[np.newaxis, :])
+
+    def to_array(self):
+        """
+        Returns a copy of the whole matrix as a NumPy array
+        """
+        return self.block(np.arange(self.size))
+
+
+class DenseCovariance(CovarianceStorage):
+
+    def __init__(self, size, dtype):
+        """
+        Initializes a DenseCovariance object, which holds the matrix in memory.
+        The allocated matrix grows by doubling, so that appending rows and columns does not copy it every time.
+        :param size: Initial number of rows and columns, initialized with zeros
+        :param dtype: Data type of the entries
+        """
+        self.size = size
+        self.matrix = np.zeros((max(size, 16), max(size, 16)), dtype=dtype)
+
+    def entries(self, rows, cols):
+        return np.asarray(self.matrix[rows, cols], dtype=np.float64)
+
+    def set_entries(self, rows, cols, values):
+        self.matrix[rows, cols] = values
+
+    def columns(self, ids):
+        return np.asarray(self.matrix[:self.size, ids], dtype=np.float64)
+
+    def subtract_outer(self, A, B):
+        self.matrix[:self.size, :self.size] -= A @ B
+
+    def grow(self, k):
+        n = self.size + k
+        if n > len(self.matrix):
+            matrix = np.zeros((2 * n, 2 * n), dtype=self.matrix.dtype)
+            matrix[:self.size, :self.size] = self.matrix[:self.size, :self.size]
+            self.matrix = matrix
+        self.matrix[self.size:n, :n] = 0
+        self.matrix[:n, self.size:n] = 0
+        self.size = n
+
+    def compact(self, ids):
+        # The kept entries are gathered before they are written, so they can be moved within the same matrix
+        self.matrix[:len(ids), :len(ids)] = self.matrix[np.ix_(ids, ids)]
+        self.size = len(ids)
+
+    def to_array(self):
+        return np.array(self.matrix[:self.size, :self.size], dtype=np.float64)
+
+
+class TiledCovariance(CovarianceStorage):
+
+    def __init__(self, size, dtype, tile_size, directory=None):
+        """
+        Initializes a TiledCovariance object, which stores the matrix in square tiles in a memory-mapped file.
+        Every tile is contiguous in the file, so that operations on a block of the matrix only touch the pages
+        of the tiles covering it. The file is deleted once the object is garbage collected.
+        :param size: Initial number of rows and columns, initialized with zeros
+        :param dtype: Data type of the entries
+        :param tile_size: Number of rows and columns of a tile
+        :param directory: Directory of the memory-mapped file, None for the default temporary directory
+        """
+        self.size = size
+        self.dtype = dtype
+        self.tile_size = tile_size
+        self.directory = directory
+        self.tiles = self.__allocate(max(-(-size // tile_size), 1))
+
+    def entries(self, rows, cols):
+        T = self.tile_size
+        return np.asarray(self.tiles[rows // T, cols // T, rows % T, cols % T], dtype=np.float64)
+
+    def set_entries(self, rows, cols, values):
+        T = self.tile_size
+        self.tiles[rows // T, cols // T, rows % T, cols % T] = values
+
+    def subtract_outer(self, A, B):
+        T = self.tile_size
+        n_tiles = -(-self.size // T)
+        for i in range(n_tiles):
+            A_i = A[i * T:(i + 1) * T]
+            for j in range(n_tiles):
+                B_j = B[:, j * T:(j + 1) * T]
+                self.tiles[i, j, :len(A_i), :B_j.shape[1]] -= A_i @ B_j
+
+    def grow(self, k):
+        T = self.tile_size
+        n = self.size + k
+        n_tiles = -(-n // T)
+        if n_tiles > len(self.tiles):
+            self.__reallocate(n_tiles + TILE_MARGIN)
+        new_ids = np.arange(self.size, n)
+        all_ids = np.arange(n)
+        self.set_entries(new_ids[:, np.newaxis], all_ids[np.newaxis, :], 0)
+        self.set_entries(all_ids[:, np.newaxis], new_ids[np.newaxis, :], 0)
+        self.size = n
+
+    def compact(self, ids):
+        # The kept entries are gathered tile by tile within the same file. Since the ids are ascending, every tile is
+        # only gathered from itself and from tiles further right or down, which are written after it.
+        T = self.tile_size
+        n_tiles = max(-(-len(ids) // T), 1)
+        for i in range(n_tiles):
+            rows = ids[i * T:(i + 1) * T]
+            for j in range(n_tiles):
+                cols = ids[j * T:(j + 1) * T]
+                self.tiles[i, j, :len(rows), :len(cols)] = self.entries(rows[:, np.newaxis], cols[np.newaxis, :])
+        self.size = len(ids)
+        # The file is only shrunk once it holds considerably more tiles than needed
+        if len(self.tiles) > n_tiles + 2 * TILE_MARGIN:
+            self.__reallocate(n_tiles + TILE_MARGIN)
+
+    def __reallocate(self, n_tiles):
+        """
+        Moves the tiles to a new file with the specified number of tiles per row and column, one row of tiles at a time
+        :param n_tiles: Number of tiles per row and column, at least the number of tiles covering the matrix
+        """
+        tiles = self.__allocate(n_tiles)
+        n_copied = min(n_tiles, len(self.tiles))
+        for i in range(n_copied):
+            tiles[i, :n_copied] = self.tiles[i, :n_copied]
+        self.tiles = tiles
+
+    def __allocate(self, n_tiles):
+        """
+        Allocates a new memory-mapped file of tiles, initialized with zeros
+        :param n_tiles: Number of tiles per row and column
+        :return: Memory-mapped array of shape (n_tiles, n_tiles, tile_size, tile_size)
+        """
+        file = tempfile.TemporaryFile(dir=self.directory)
+        return np.memmap(file, dtype=self.dtype, mode='w+',
+                         shape=(n_tiles, n_tiles, self.tile_size, self.tile_size))
+
+
+def create_covariance_storage(size, storage_cfg):
+    """
+    Creates the storage of a covariance matrix as configured
+    :param size: Initial number of rows and columns, initialized with zeros
+    :param storage_cfg: The configuration of the covariance storage
+    :return: The covariance storage
+    """
+    dtype = np.dtype(storage_cfg["dtype"])
+    if storage_cfg["type"] == "tiled":
+        return TiledCovariance(size, dtype, storage_cfg["tile_size"], storage_cfg["directory"])
+    return DenseCovariance(size, dtype)
@@ -8,6 +8,10 @@ import numpy as np
 from math import *
 from models.Pose import Pose
 
+from supervisor.slam.CovarianceStorage import create_covariance_storage
+from supervisor.slam.JCBBAssociation import JCBBAssociation
+from supervisor.slam.LandmarkExistence import LandmarkExistence
+from supervisor.slam.OdometryPreintegration import OdometryPreintegration
 from supervisor.slam.Slam import Slam
 from utils.math_util import normalize_angle
 
@@ -26,6 +30,9 @@ class EKFSlam(Slam):
         # Extract relevant configurations
         self.dt = step_time
         self.distance_threshold = slam_cfg["ekf_slam"]["distance_threshold"]
+        # Maps the angle of a sensor to the index of the landmark that the sensor observed most recently,
+        # None if the associations are not cached
+        self.association_cache = {} if slam_cfg["association_cache"] else None
         self.robot_state_size = slam_cfg["robot_state_size"]
         self.landmark_state_size = slam_cfg["landmark_state_size"]
         self.sensor_noise = np.diag([slam_cfg["sensor_noise"]["detected_distance"],
@@ -33,16 +40,41 @@ class EKFSlam(Slam):
         self.motion_noise = np.diag([slam_cfg["ekf_slam"]["motion_noise"]["x"],
                                      slam_cfg["ekf_slam"]["motion_noise"]["y"],
                                      np.deg2rad(slam_cfg["ekf_slam"]["motion_noise"]["theta"])]) ** 2
+        # The joint compatibility data association, None if every measurement is associated on its own
+        self.jcbb = None
+        if slam_cfg["ekf_slam"]["association"] == "jcbb":
+            self.jcbb = JCBBAssociation(self.distance_threshold, self.sensor_noise,
+                                        2 * self.supervisor.proximity_sensor_max_range(),
+                                        self.robot_state_size, self.landmark_state_size)
         # The estimated combined state vector, initially containing the robot pose at the origin and no landmarks
         self.mu = np.zeros((self.robot_state_size, 1))
-        # The state covariance, initially set to absolute certainty of the initial robot pose
-        self.Sigma = np.zeros((self.robot_state_size, self.robot_state_size))
+        # The state covariance, initially set to absolute certainty of the initial robot pose.
+        # It is only accessed through the operations of its storage, which may hold it in memory or in a file.
+        self.Sigma = create_covariance_storage(self.robot_state_size, slam_cfg["ekf_slam"]["covariance_storage"])
+        # The motion preintegrated since the last keyframe, None if every simulation cycle is a keyframe
+        self.odometry = None
+        if slam_cfg["keyframes"]["enabled"]:
+            self.odometry = OdometryPreintegration(slam_cfg["keyframes"])
+        # Number of times every landmark was observed and number of times it was missed
+        self.lm_obs = np.zeros(0, dtype=np.int64)
+        self.lm_miss = np.zeros(0, dtype=np.int64)
+        # Ids of the landmarks, which in contrast to their indices do not change when other landmarks are removed
+        self.landmark_ids = np.zeros(0, dtype=np.int64)
+        self.next_landmark_id = 0
+        # The tracking of the existence of landmarks, None if landmarks are never removed
+        self.existence = None
+        if slam_cfg["landmark_existence"]["enabled"]:
+            self.existence = LandmarkExistence(slam_cfg["landmark_existence"], self.supervisor)
 
     def get_estimated_pose(self):
         """
         Returns the estimated robot pose by retrieving the first three elements of the combined state vector
         :return: Estimated robot pose consisting of position and angle
         """
+        if self.odometry is not None:
+            # Include the motion that has not been applied since the last keyframe
+            x, y, theta = self.odometry.apply(self.mu[0:self.robot_state_size])[:, 0]
+            return Pose(x, y, theta)
         return Pose(self.mu[0, 0], self.mu[1, 0], self.mu[2, 0])
 
     def get_landmarks(self):
@@ -52,21 +84,55 @@ class EKFSlam(Slam):
         """
         return [(x, y) for (x, y) in zip(self.mu[self.robot_state_size::2], self.mu[self.robot_state_size + 1::2])]
 
+    def get_landmark_ids(self):
+        """
+        Returns the ids of the estimated landmarks
+        :return: List of landmark ids, in the same order as the landmark positions
+        """
+        return list(self.landmark_ids)
+
     def get_covariances(self):
         """
-        Returns the covariance matrix
+        Returns a copy of the whole covariance matrix. Copying it takes quadratic time and memory in the number of
+        landmarks, so it is only meant for inspecting the matrix, not for every simulation cycle.
         :return: Covariance matrix as a NumPy matrix
         """
-        return self.Sigma
+        return self.Sigma.to_array()
+
+    def get_pose_covariance(self):
+        """
+        Returns the covariance of the estimated robot pose, which is the diagonal block of the covariance matrix
+        belonging to the robot state
+        :return: Array of shape (3, 3)
+        """
+        return self.Sigma.block(np.arange(self.robot_state_size))
+
+    def get_landmark_covariances(self):
+        """
+        Returns the covariances of the estimated landmark positions, which are the diagonal blocks of the covariance
+        matrix belonging to the landmarks
+        :return: Array of shape (n, 2, 2) holding the covariance of every landmark position
+        """
+        n = self.get_n_lm(self.mu)
+        ids = self.robot_state_size + self.landmark_state_size * np.arange(n)[:, np.newaxis] + np.arange(2)
+        return self.Sigma.entries(ids[:, :, np.newaxis], ids[:, np.newaxis, :])
 
     def update(self, u, z):
         """
         Performs a full update cycle consisting of prediction and correction step
         :param u: Motion command
-        :param z: List of sensor measurements. A single measurement is a tuple of measured distance and measured angle.
-        """
-        self.prediction_step(u)
-        self.correction_step(z)
+        :param z: List of sensor measurements of the sensors that observed a landmark.
+                  A single measurement is a tuple of measured distance and measured angle.
+        """
+        if self.odometry is None:
+            self.prediction_step(u)
+            self.correction_step(z)
+            return
+        # Only perform the full update on keyframes, otherwise just preintegrate the motion command
+        self.preintegrate(u)
+        if self.odometry.keyframe_reached(z):
+            self.preintegrated_prediction_step()
+            self.correction_step(z)
 
     def prediction_step(self, u):
         """
@@ -76,35 +142,142 @@ class EKFSlam(Slam):
         :param u: Motion command
         """
         S = self.robot_state_size
+        robot = np.arange(S)
         # Compute the Jacobian matrix G
         G = self.jacob_motion(self.mu[0:S], u, self.dt)
         # Predict the robots pose by executing noise-free motion
         self.mu[0:S] = self.motion_model(self.mu[0:S], u, self.dt)
-        # Update the uncertainty of the robots pose using Jacobian G
-        self.Sigma[0:S, 0:S] = G.T @ self.Sigma[0:S, 0:S] @ G + self.motion_noise
+        # Update the uncertainty of the robots pose using Jacobian G, propagated as G * Sigma * G^T
+        self.Sigma.set_block(robot, G @ self.Sigma.block(robot) @ G.T + self.motion_noise)
+
+    def preintegrate(self, u):
+        """
+        Composes the motion resulting from a motion command with the motion preintegrated since the last keyframe.
+        The motion noise is specified in world coordinates and therefore rotated into the frame of the robot.
+        :param u: Motion command
+        """
+        S = self.robot_state_size
+        rotation = OdometryPreintegration.rotation_matrix(self.mu[2, 0] + self.odometry.delta[2, 0])
+        step = self.motion_model(np.zeros((S, 1)), u, self.dt)
+        self.odometry.integrate(step, rotation.T @ self.motion_noise @ rotation)
+
+    def preintegrated_prediction_step(self):
+        """
+        Predicts the robots location and location uncertainty after executing the motion preintegrated since the last
+        keyframe. Equivalent to the prediction step, but covering all simulation cycles since the last keyframe.
+        """
+        S = self.robot_state_size
+        G = self.odometry.jacobian(self.mu[0:S])
+        rotation = OdometryPreintegration.rotation_matrix(self.mu[2, 0])
+        self.mu[0:S] = self.odometry.apply(self.mu[0:S])
+        self.mu[2] = normalize_angle(self.mu[2])
+        # Propagate the uncertainty of the robots pose as G * Sigma * G^T, like the prediction step, and add the
+        # preintegrated motion noise in world coordinates
+        robot = np.arange(S)
+        self.Sigma.set_block(robot, G @ self.Sigma.block(robot) @ G.T +
+                             rotation @ self.odometry.covariance @ rotation.T)
+        self.odometry.reset()
 
     def correction_step(self, z):
         """
         Update the predicted state and uncertainty using the sensor measurements.
         :param z: List of sensor measurements. A single measurement is a tuple of measured distance and measured angle.
         """
+        associations = None
+        if self.jcbb is not None:
+            associations = self.jcbb.associate(self.mu, self.Sigma, z)
         # Iterate through all sensor readings
         for i, measurement in enumerate(z):
-            # Only execute if sensor observed landmark
-            if not self.supervisor.proximity_sensor_positive_detections()[i]:
-                continue
-            lm_id = self.data_association(self.mu, self.Sigma, measurement)
             nLM = self.get_n_lm(self.mu)
+            if associations is None:
+                lm_id = self.associate(measurement)
+            elif associations[i] is None:  # The measurement is not jointly compatible with the other associations
+                continue
+            else:
+                lm_id = nLM if associations[i] == -1 else associations[i]
             if lm_id == nLM:  # If the landmark is new
                 self.add_new_landmark(measurement)
+            self.lm_obs[lm_id] += 1
             lm = self.get_landmark_position(self.mu, lm_id)
             innovation, Psi, H = self.calc_innovation(lm, self.mu, self.Sigma, measurement, lm_id)
 
-            K = (self.Sigma @ H.T) @ np.linalg.inv(Psi)
+            # H is only non-zero for the robot pose and the observed landmark,
+            # so only their columns of the covariance matrix are needed to compute Sigma @ H.T
+            Sigma_H = self.Sigma.columns(self.get_state_ids(lm_id)) @ H.T
+            K = Sigma_H @ np.linalg.inv(Psi)
             self.mu += K @ innovation
             # Normalize robot angle so it is between -pi and pi
             self.mu[2] = normalize_angle(self.mu[2])
-            self.Sigma = (np.identity(len(self.mu)) - (K @ H)) @ self.Sigma
+            # (I - K @ H) @ Sigma, where H @ Sigma equals Sigma_H.T since Sigma is symmetric
+            self.Sigma.subtract_outer(K, Sigma_H.T)
+        if self.existence is not None:
+            self.prune_landmarks(z)
+
+    def prune_landmarks(self, z):
+        """
+        Counts the landmarks that were missed by the sensors and removes the landmarks that are not supported,
+        either because they were missed too often compared to how often they were observed
+        or because their position is too uncertain.
+        :param z: List of sensor measurements. A single measurement is a tuple of measured distance and measured angle.
+        """
+        nLM = self.get_n_lm(self.mu)
+        if nLM == 0:
+            return
+        R = self.robot_state_size
+        L = self.landmark_state_size
+        landmarks = self.mu[R:, 0].reshape(nLM, L)
+        idle_angles = self.existence.idle_sensor_angles(z)
+        self.lm_miss += self.existence.missed_landmarks(self.mu[0, 0], self.mu[1, 0], self.mu[2, 0],
+                                                        landmarks, idle_angles)
+        keep = self.existence.supported(self.lm_obs, self.lm_miss)
+        # Largest eigenvalue of every landmark's position covariance, which is the variance along its major axis
+        ids = R + L * np.arange(nLM)
+        var_x = self.Sigma.entries(ids, ids)
+        var_y = self.Sigma.entries(ids + 1, ids + 1)
+        cov_xy = self.Sigma.entries(ids, ids + 1)
+        max_variances = (var_x + var_y) / 2 + np.sqrt(((var_x - var_y) / 2) ** 2 + cov_xy ** 2)
+        keep &= max_variances <= self.existence.max_position_std ** 2
+        if not np.all(keep):
+            self.compact_state(keep)
+
+    def compact_state(self, keep):
+        """
+        Removes landmarks from the state vector and the covariance matrix.
+        The rows and columns of all kept landmarks are gathered at once, so the matrix is only moved a single time.
+        :param keep: Boolean array specifying which landmarks are kept
+        """
+        keep_state = np.concatenate((np.ones(self.robot_state_size, dtype=bool),
+                                     np.repeat(keep, self.landmark_state_size)))
+        self.mu = self.mu[keep_state]
+        self.Sigma.compact(np.flatnonzero(keep_state))
+        self.lm_obs = self.lm_obs[keep]
+        self.lm_miss = self.lm_miss[keep]
+        self.landmark_ids = self.landmark_ids[keep]
+        if self.association_cache is not None:
+            # Map the indices of the kept landmarks to their indices after the compaction
+            remap = np.cumsum(keep) - 1
+            self.association_cache = {angle: int(remap[lm_id])
+                                      for (angle, lm_id) in self.association_cache.items() if keep[lm_id]}
+
+    def associate(self, measurement):
+        """
+        Associates the measurement to a landmark. If the association cache is enabled, the landmark that the sensor
+        observed most recently is validated first using the Mahalanobis distance,
+        and all landmarks are only searched if the validation fails.
+        :param measurement: Tuple of measured distance and measured angle
+        :return: The id of the landmark that is associated to the measurement
+        """
+        if self.association_cache is None:
+            return self.data_association(self.mu, self.Sigma, measurement)
+        lm_id = self.association_cache.get(measurement[1])
+        if lm_id is not None:
+            lm = self.get_landmark_position(self.mu, lm_id)
+            innovation, Psi, H = self.calc_innovation(lm, self.mu, self.Sigma, measurement, lm_id)
+            if innovation.T @ np.linalg.inv(Psi) @ innovation < self.distance_threshold:
+                return lm_id
+        lm_id = self.data_association(self.mu, self.Sigma, measurement)
+        self.association_cache[measurement[1]] = lm_id
+        return lm_id
 
     def data_association(self, mu, Sigma, measurement):
         """
@@ -112,7 +285,7 @@ class EKFSlam(Slam):
         The innovation, uncertainty and Jacobian are however not returned
         and need to be recalculated when performing the EKF update.
         :param mu: Combined state vector
-        :param Sigma: Covariance matrix
+        :param Sigma: Storage of the covariance matrix
         :param measurement: Tuple of measured distance and measured angle
         :return: The id of the landmark that is associated to the measurement
         """
@@ -144,11 +317,14 @@ class EKFSlam(Slam):
         """
         landmark_position = self.calc_landmark_position(self.mu, measurement)
         # Extend state and covariance matrix
-        xEstTemp = np.vstack((self.mu, landmark_position))
         L = self.landmark_state_size
-        self.Sigma = np.vstack((np.hstack((self.Sigma, np.zeros((len(self.mu), L)))),
-                                np.hstack((np.zeros((L, len(self.mu))), np.identity(L)))))
-        self.mu = xEstTemp
+        self.Sigma.grow(L)
+        self.Sigma.set_block(np.arange(len(self.mu), len(self.mu) + L), np.identity(L))
+        self.mu = np.vstack((self.mu, landmark_position))
+        self.lm_obs = np.append(self.lm_obs, 0)
+        self.lm_miss = np.append(self.lm_miss, 0)
+        self.landmark_ids = np.append(self.landmark_ids, self.next_landmark_id)
+        self.next_landmark_id += 1
 
     @staticmethod
     def motion_model(x, u, dt):
@@ -175,7 +351,8 @@ class EKFSlam(Slam):
 
     def jacob_motion(self, x, u, dt):
         """
-        Returns the Jacobian matrix of the motion model
+        Returns the Jacobian matrix of the motion model, whose rows correspond to the components of the predicted pose
+        and whose columns correspond to the components of the previous pose
         :param x: The robot's pose
         :param u: Motion command as a tuple of translational and angular velocities
         :param dt: (Discrete) Time for which the motion command is executed
@@ -194,23 +371,22 @@ class EKFSlam(Slam):
         return G
 
     @staticmethod
-    def jacob_sensor(q, delta, nLM, i):
+    def jacob_sensor(q, delta):
         """
-        Computes the Jacobian of the sensor model
+        Computes the Jacobian of the sensor model.
+        Only the columns of the robot pose and the observed landmark are returned, since all others are zero.
         :param q: squared distance of the expected measurement
         :param delta: vector of the expected measurement (estimated landmark position - robot position)
-        :param nLM: Number of observed landmarks
-        :param i: Index of the observed landmark
-        :return: Jacobian of measurement
+        :return: Jacobian of measurement with respect to the state variables returned by get_state_ids
         """
         sq = sqrt(q)
-        H = np.zeros((2, 3 + nLM * 2))
+        H = np.zeros((2, 5))
         # Setting the values dependent on the robots pose
         H[:, :3] = np.array([[-sq * delta[0, 0], - sq * delta[1, 0], 0],
                              [delta[1, 0], - delta[0, 0], -q]])
         # Setting the values dependent on the landmark location
-        H[:, 3 + i * 2: 3 + (i+1) * 2] = np.array([[sq * delta[0, 0], sq * delta[1, 0]],
-                                                   [- delta[1, 0], delta[0, 0]]])
+        H[:, 3:5] = np.array([[sq * delta[0, 0], sq * delta[1, 0]],
+                              [- delta[1, 0], delta[0, 0]]])
         H = H / q
         return H
 
@@ -241,10 +417,11 @@ class EKFSlam(Slam):
         Calculates the innovation, uncertainty and Jacobian
         :param lm: Position of observed landmark
         :param mu: Combined state vector
-        :param Sigma: Covariance matrix
+        :param Sigma: Storage of the covariance matrix
         :param z: Measurement, consisting of tuple of measured distance and measured angle
         :param LMid: Id of the observed landmark
-        :return: The innovation, the uncertainty of the measurement and the Jacobian
+        :return: The innovation, the uncertainty of the measurement and the Jacobian with respect to the state
+                 variables returned by get_state_ids
         """
         delta = lm - mu[0:2]
         q = (delta.T @ delta)[0, 0]
@@ -252,8 +429,8 @@ class EKFSlam(Slam):
         expected_measurement = np.array([[sqrt(q), normalize_angle(zangle)]])
         innovation = (z - expected_measurement).T
         innovation[1] = normalize_angle(innovation[1])
-        H = self.jacob_sensor(q, delta, self.get_n_lm(mu), LMid)
-        Psi = H @ Sigma @ H.T + self.sensor_noise
+        H = self.jacob_sensor(q, delta)
+        Psi = H @ Sigma.block(self.get_state_ids(LMid)) @ H.T + self.sensor_noise
 
         return innovation, Psi, H
 
@@ -269,3 +446,12 @@ class EKFSlam(Slam):
         lm = mu[R + L * i: R + L * (i + 1), :]
         return lm
 
+    def get_state_ids(self, i):
+        """
+        Returns the indices of the state variables of the robot pose and the landmark with specified index
+        :param i: Index of landmark
+        :return: Array of the indices of the state variables
+        """
+        R = self.robot_state_size
+        L = self.landmark_state_size
+        return np.concatenate((np.arange(R), np.arange(R + L * i, R + L * (i + 1))))
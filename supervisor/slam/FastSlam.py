@@ -1,5 +1,5 @@
 """
-FastSLAM 1.0
+FastSLAM 1.0, optionally using the proposal distribution of FastSLAM 2.0
 Based on implementation of Atsushi Sakai (https://github.com/AtsushiSakai/PythonRobotics)
 Most significant changes made:
 - Add support for a flexible number of landmarks
@@ -8,12 +8,16 @@ Most significant changes made:
 - Change resampling algorithm
 """
 
+import time
 from math import cos, sin, sqrt, atan2, exp, pi
+from statistics import NormalDist
 
 import numpy as np
 
 # Fast SLAM covariance
 from models.Pose import Pose
+from supervisor.slam.LandmarkExistence import LandmarkExistence
+from supervisor.slam.OdometryPreintegration import OdometryPreintegration
 from supervisor.slam.Slam import Slam
 from utils.math_util import normalize_angle
 
@@ -37,6 +41,14 @@ class Particle:
         self.lm = np.zeros((0, lm_state_size))
         # List of landmark position covariances
         self.lmP = np.zeros((0, lm_state_size))
+        # Number of times every landmark was observed
+        self.lm_obs = np.zeros(0, dtype=np.int64)
+        # Number of times every landmark was expected to be observed, but was not detected
+        self.lm_miss = np.zeros(0, dtype=np.int64)
+        # Maps the angle of a sensor to the id of the landmark that the sensor observed most recently
+        self.lm_cache = {}
+        # Covariance of the predicted robot pose, only used by the proposal distribution of FastSLAM 2.0
+        self.pose_cov = np.zeros((3, 3))
 
 
 class FastSlam(Slam):
@@ -53,6 +65,8 @@ class FastSlam(Slam):
         # Extract relevant configurations
         self.dt = step_time
         self.distance_threshold = slam_cfg["fast_slam"]["distance_threshold"]
+        # Determines whether the associated landmarks are cached per sensor
+        self.association_cache = slam_cfg["association_cache"]
         self.n_particles = slam_cfg["fast_slam"]["n_particles"]
         self.robot_state_size = slam_cfg["robot_state_size"]
         self.landmark_state_size = slam_cfg["landmark_state_size"]
@@ -60,9 +74,48 @@ class FastSlam(Slam):
                                      np.deg2rad(slam_cfg["sensor_noise"]["detected_angle"])]) ** 2
         self.motion_noise = np.diag([slam_cfg["fast_slam"]["motion_noise"]["translational_velocity"],
                                      slam_cfg["fast_slam"]["motion_noise"]["rotational_velocity"]]) ** 2
+        # Standard deviations of the translational and angular velocities
+        self.motion_noise_std = np.sqrt(np.diag(self.motion_noise))
+        # Random number generator of the algorithm, seeded to make a run reproducible
+        self.rng = np.random.default_rng(slam_cfg["fast_slam"]["seed"])
+        # Pre-generated standard normal noise for the motion commands of the particles
+        self.noise_buffer_size = slam_cfg["fast_slam"]["noise_buffer_size"]
+        self.noise_buffer = np.zeros((0, 2))
+        self.noise_index = 0
+        # Time in seconds that a single update may take, None if the update is not bounded
+        self.time_budget = slam_cfg["fast_slam"]["time_budget"]
+        self.deadline = None
+        # The fraction of the particles that the last update updated, and the number of full updates as well as the
+        # sums and the maximum of the fractions of the time budget that they used and of the particles they updated
+        self.updated_fraction = 1.0
+        self.num_budgeted_updates = 0
+        self.total_budget_usage = 0.0
+        self.max_budget_usage = 0.0
+        self.total_updated_fraction = 0.0
+        # Determines whether the poses are sampled from a proposal distribution incorporating the measurements
+        self.measurement_proposal = slam_cfg["fast_slam"]["proposal"] == "measurement"
+        # Configuration of the KLD-sampling, which adapts the number of particles during resampling
+        adaptive_cfg = slam_cfg["fast_slam"]["adaptive_particles"]
+        self.adaptive_particles = adaptive_cfg["enabled"]
+        if self.adaptive_particles:
+            self.min_particles = adaptive_cfg["min_particles"]
+            self.max_particles = adaptive_cfg["max_particles"]
+            self.kld_epsilon = adaptive_cfg["epsilon"]
+            # Upper quantile of the standard normal distribution for the probability 1 - delta
+            self.kld_z = NormalDist().inv_cdf(1 - adaptive_cfg["delta"])
+            self.bin_size = np.array([adaptive_cfg["bin_position"], adaptive_cfg["bin_position"],
+                                      np.deg2rad(adaptive_cfg["bin_angle"])])
 
     # Create initial list of particles
         self.particles = [Particle(self.landmark_state_size) for _ in range(self.n_particles)]
+        # The motion preintegrated since the last keyframe, None if every simulation cycle is a keyframe
+        self.odometry = None
+        if slam_cfg["keyframes"]["enabled"]:
+            self.odometry = OdometryPreintegration(slam_cfg["keyframes"])
+        # The tracking of the existence of landmarks, None if landmarks are never removed
+        self.existence = None
+        if slam_cfg["landmark_existence"]["enabled"]:
+            self.existence = LandmarkExistence(slam_cfg["landmark_existence"], self.supervisor)
 
     def get_estimated_pose(self):
         """
@@ -70,6 +123,10 @@ class FastSlam(Slam):
         :return: Estimated robot pose consisting of position and angle
         """
         particle = self.get_best_particle()
+        if self.odometry is not None:
+            # Include the motion that has not been applied since the last keyframe
+            x, y, theta = self.odometry.apply(np.array([[particle.x], [particle.y], [particle.theta]]))[:, 0]
+            return Pose(x, y, theta)
         return Pose(particle.x, particle.y, particle.theta)
 
     def get_landmarks(self):
@@ -80,77 +137,301 @@ class FastSlam(Slam):
         particle = self.get_best_particle()
         return [(x, y) for (x, y) in zip(particle.lm[:, 0], particle.lm[:, 1])]
 
+    def get_landmark_covariances(self):
+        """
+        Returns the covariances of the estimated landmark positions by only considering the particle with the highest
+        importance factor
+        :return: Array of shape (n, 2, 2) holding the covariance of every landmark position
+        """
+        particle = self.get_best_particle()
+        return particle.lmP.reshape(-1, 2, self.landmark_state_size).copy()
+
+    def get_particles(self):
+        """
+        Returns the poses and the normalized importance factors of all particles
+        :return: Tuple of an array of shape (n, 3) holding the pose of every particle as x, y and angle, and an array
+                 of the importance factors, which sum up to 1
+        """
+        poses = np.array([[particle.x, particle.y, particle.theta] for particle in self.particles])
+        weights = np.array([particle.w for particle in self.particles])
+        if self.odometry is not None:
+            # Include the motion that has not been applied since the last keyframe
+            poses = self.odometry.apply_all(poses)
+        total = weights.sum()
+        weights = weights / total if total > 0 else np.full(len(weights), 1.0 / len(weights))
+        return poses, weights
+
     def update(self, u, z):
         """
         Performs a full update step of the FastSLAM algorithm
         :param u: Motion command
-        :param z: Sensor measurements
+        :param z: Measurements of the sensors that observed a landmark
         :return: Updated list of particles
         """
-        # prediction step
-        self.particles = self.predict_particles(self.particles, u)
+        if self.odometry is not None:
+            # Only perform the full update on keyframes, otherwise just preintegrate the motion command
+            self.preintegrate(u)
+            if not self.odometry.keyframe_reached(z):
+                return self.particles
+        start = time.perf_counter()
+        if self.time_budget is not None:
+            self.deadline = start + self.time_budget
+        if self.odometry is not None:
+            if self.measurement_proposal:
+                self.particles = self.predict_pose_distributions(self.particles, self.odometry.delta,
+                                                                 self.odometry.covariance)
+                self.odometry.reset()
+            else:
+                self.particles = self.predict_particles_preintegrated(self.particles)
+        elif self.measurement_proposal:
+            # prediction step of FastSLAM 2.0, the motion noise is propagated into the pose space
+            V = OdometryPreintegration.motion_jacobian(u, self.dt)
+            step = self.motion_model(np.zeros((self.robot_state_size, 1)), u, self.dt)
+            self.particles = self.predict_pose_distributions(self.particles, step, V @ self.motion_noise @ V.T)
+        else:
+            # prediction step
+            self.particles = self.predict_particles(self.particles, u)
         # correction step
         self.correction_step(z)
+        if self.time_budget is not None:
+            budget_usage = (time.perf_counter() - start) / self.time_budget
+            self.num_budgeted_updates += 1
+            self.total_budget_usage += budget_usage
+            self.max_budget_usage = max(self.max_budget_usage, budget_usage)
+            self.total_updated_fraction += self.updated_fraction
         return self.particles
 
+    def get_statistics(self):
+        """
+        Returns how much of the time budget the full updates used and which fraction of the particles they updated,
+        if a time budget is configured
+        :return: Dictionary of the statistics
+        """
+        if self.time_budget is None:
+            return {}
+        num_updates = max(self.num_budgeted_updates, 1)
+        return {"mean_budget_usage": self.total_budget_usage / num_updates,
+                "max_budget_usage": self.max_budget_usage,
+                "mean_updated_fraction": self.total_updated_fraction / num_updates}
+
     def correction_step(self, z):
         """
         Performs the correction step
         :param z: Measurement
         """
         self.particles = self.measurement_update(self.particles, z)
+        if self.existence is not None:
+            self.particles = self.update_landmark_existence(self.particles, z)
         self.particles = self.resampling(self.particles)
 
     def predict_particles(self, particles, u):
         """
-        Performs the prediction step of the algorithm
+        Performs the prediction step of the algorithm.
+        Every particle applies the motion command with its own noise, all particles are predicted at once.
         :param particles: List of particles
         :param u: Motion command
         :return: List of predicted particles after applying motion command
         """
+        poses = np.array([[particle.x, particle.y, particle.theta] for particle in particles])
+        # Apply noise to the motion command
+        noisy_u = u[:, 0] + self.standard_normal_noise(len(particles)) * self.motion_noise_std
+        # Apply noise-free motion with noisy motion commands
+        poses = self.motion_model_vectorized(poses, noisy_u[:, 0], noisy_u[:, 1], self.dt)
+        # Update particles
+        for particle, (x, y, theta) in zip(particles, poses):
+            particle.x = x
+            particle.y = y
+            particle.theta = theta
+        return particles
+
+    def standard_normal_noise(self, n):
+        """
+        Returns standard normal noise for the motion commands of n particles.
+        The noise is taken from a pre-generated buffer, which is refilled once it is exhausted.
+        :param n: Number of particles
+        :return: Array of shape (n, 2)
+        """
+        if self.noise_index + n > len(self.noise_buffer):
+            self.noise_buffer = self.rng.standard_normal((max(self.noise_buffer_size, n), 2))
+            self.noise_index = 0
+        noise = self.noise_buffer[self.noise_index:self.noise_index + n]
+        self.noise_index += n
+        return noise
+
+    def preintegrate(self, u):
+        """
+        Composes the motion resulting from a motion command with the motion preintegrated since the last keyframe.
+        The noise of the motion command is propagated into the pose space using the Jacobian of the motion model.
+        :param u: Motion command
+        """
+        V = OdometryPreintegration.motion_jacobian(u, self.dt)
+        step = self.motion_model(np.zeros((self.robot_state_size, 1)), u, self.dt)
+        self.odometry.integrate(step, V @ self.motion_noise @ V.T)
+
+    def predict_particles_preintegrated(self, particles):
+        """
+        Performs the prediction step for the motion preintegrated since the last keyframe.
+        Every particle applies a motion that is sampled from the distribution of the preintegrated motion.
+        :param particles: List of particles
+        :return: List of predicted particles after applying the preintegrated motion
+        """
+        # Sample all motions at once. The covariance may be singular, which is supported by this sampling method
+        deltas = self.rng.multivariate_normal(self.odometry.delta[:, 0], self.odometry.covariance, len(particles))
+        poses = np.array([[particle.x, particle.y, particle.theta] for particle in particles])
+        c, s = np.cos(poses[:, 2]), np.sin(poses[:, 2])
+        poses[:, 0] += c * deltas[:, 0] - s * deltas[:, 1]
+        poses[:, 1] += s * deltas[:, 0] + c * deltas[:, 1]
+        poses[:, 2] = normalize_angle(poses[:, 2] + deltas[:, 2])
+        for particle, (x, y, theta) in zip(particles, poses):
+            particle.x = x
+            particle.y = y
+            particle.theta = theta
+        self.odometry.reset()
+        return particles
+
+    def predict_pose_distributions(self, particles, step, step_covariance):
+        """
+        Performs the prediction step of FastSLAM 2.0. Every particle applies the noise-free motion and stores the
+        covariance of its predicted pose. The poses are sampled once the measurements are known.
+        :param particles: List of particles
+        :param step: The noise-free motion relative to the pose of a particle
+        :param step_covariance: The covariance of the motion, expressed in the frame of the robot
+        :return: List of particles with predicted pose distributions
+        """
         for particle in particles:
-            px = np.zeros((self.robot_state_size, 1))
-            # Copy the current particle
-            px[0, 0] = particle.x
-            px[1, 0] = particle.y
-            px[2, 0] = particle.theta
-            # Apply noise to the motion command
-            u += (np.random.randn(1, 2) @ self.motion_noise ** 0.5).T
-            # Apply noise-free motion with noisy motion command
-            px = self.motion_model(px, u, self.dt)
-            # Update particle
-            particle.x = px[0, 0]
-            particle.y = px[1, 0]
-            particle.theta = px[2, 0]
+            rotation = OdometryPreintegration.rotation_matrix(particle.theta)
+            delta = rotation @ step
+            particle.x += delta[0, 0]
+            particle.y += delta[1, 0]
+            particle.theta = normalize_angle(particle.theta + delta[2, 0])
+            particle.pose_cov = rotation @ step_covariance @ rotation.T
         return particles
 
+    def sample_pose_from_proposal(self, particle, measurements):
+        """
+        Samples the pose of a particle from the proposal distribution of FastSLAM 2.0.
+        Starting with the predicted pose distribution, every measurement of an already encountered landmark is
+        incorporated by an EKF update of the pose. The importance factor is the likelihood of the measurements
+        given the predicted pose distribution.
+        :param particle: Particle with a predicted pose distribution
+        :param measurements: List of measurements
+        """
+        mean = np.array([[particle.x], [particle.y], [particle.theta]])
+        cov = particle.pose_cov
+        for measurement in measurements:
+            lm_id = self.associate(particle, measurement)
+            if lm_id == self.get_n_lms(particle.lm):  # New landmarks do not provide information about the pose
+                continue
+            landmark = particle.lm[lm_id, :]
+            landmark_cov = particle.lmP[2 * lm_id:2 * lm_id + 2, :]
+            delta_x = landmark[0] - mean[0, 0]
+            delta_y = landmark[1] - mean[1, 0]
+            q = delta_x ** 2 + delta_y ** 2
+            sq = sqrt(q)
+            expected_measurement = np.array(
+                [sq, normalize_angle(atan2(delta_y, delta_x) - mean[2, 0])]).reshape(2, 1)
+            # Jacobians of the measurement with respect to the landmark position and the robot pose
+            H_m = np.array([[delta_x / sq, delta_y / sq],
+                            [-delta_y / q, delta_x / q]])
+            H_x = np.hstack((-H_m, np.array([[0], [-1]])))
+            innovation = measurement.reshape(2, 1) - expected_measurement
+            innovation[1, 0] = normalize_angle(innovation[1, 0])
+            # Covariance of the measurement given the predicted pose distribution
+            Psi = H_x @ cov @ H_x.T + H_m @ landmark_cov @ H_m.T + self.sensor_noise
+            particle.w *= self.compute_importance_factor(innovation, Psi)
+            K = cov @ H_x.T @ np.linalg.inv(Psi)
+            mean = mean + K @ innovation
+            mean[2, 0] = normalize_angle(mean[2, 0])
+            cov = (np.identity(self.robot_state_size) - K @ H_x) @ cov
+            # The following measurements are associated using the updated pose
+            particle.x, particle.y, particle.theta = mean[:, 0]
+        # The covariance may be singular, which is supported by this sampling method
+        x, y, theta = self.rng.multivariate_normal(mean[:, 0], cov)
+        particle.x, particle.y, particle.theta = x, y, normalize_angle(theta)
+
     def measurement_update(self, particles, z):
         """
         Performs the measurement update of the algorithm, which consists of
         1. data association
         2. adding a new landmark or
            computing importance factor and performing an EKF update for an already encountered landmark
-        :param particles:
-        :param z: Measurement
+        If a time budget is configured, the particles are updated in the order of their importance factors until the
+        deadline of the update is reached. The remaining particles are deferred: They keep their previous normalized
+        importance factor, and the updated particles share the remaining probability mass according to their
+        measurement likelihoods.
+        :param particles: List of particles
+        :param z: Measurements of the sensors that observed a landmark
         :return: Updated list of particles
         """
+        measurements = [np.asarray([distance, theta]) for (distance, theta) in z]
+        order = list(range(len(particles)))
+        particles = self.normalize_weight(particles)
+        previous_weights = [particle.w for particle in particles]
+        if self.time_budget is not None:
+            # The particles with the highest importance factors of the previous cycle are updated first
+            order.sort(key=lambda i: previous_weights[i], reverse=True)
         # Removing the importance factors of the previous cycle
         particles = self.clear_importance_factors(particles)
-        for i, (distance, theta) in enumerate(z):
-            measurement = np.asarray([distance, theta])
-            # Skip the measurement if no landmark was detected
-            if not self.supervisor.proximity_sensor_positive_detections()[i]:
-                continue
-            for particle in particles:
-                lm_id = self.data_association(particle, measurement)
-                nLM = self.get_n_lms(particle.lm)
-                if lm_id == nLM:  # If the landmark is new
-                    self.add_new_lm(particle, measurement)
-                else:
-                    self.update_landmark(particle, measurement, lm_id)
-
+        n_updated = 0
+        for i in order:
+            # At least a single particle is updated, even if the deadline has already passed
+            if self.time_budget is not None and n_updated > 0 and time.perf_counter() > self.deadline:
+                break
+            if self.measurement_proposal:
+                self.sample_pose_from_proposal(particles[i], measurements)
+            self.update_particle_landmarks(particles[i], measurements)
+            n_updated += 1
+        if n_updated < len(particles):
+            # Scale the importance factors of the updated particles to the probability mass they had before
+            updated_mass = sum(previous_weights[i] for i in order[:n_updated])
+            likelihood_sum = sum(particles[i].w for i in order[:n_updated])
+            for i in order[:n_updated]:
+                particles[i].w *= updated_mass / likelihood_sum if likelihood_sum > 0 else 0.0
+            for i in order[n_updated:]:
+                particles[i].w = previous_weights[i]
+        self.updated_fraction = n_updated / len(particles)
         return particles
 
+    def update_particle_landmarks(self, particle, measurements):
+        """
+        Updates the landmarks of a single particle using all measurements
+        :param particle: Particle that will be updated
+        :param measurements: List of measurements
+        """
+        for measurement in measurements:
+            lm_id = self.associate(particle, measurement)
+            nLM = self.get_n_lms(particle.lm)
+            if lm_id == nLM:  # If the landmark is new
+                self.add_new_lm(particle, measurement)
+                if self.association_cache:
+                    particle.lm_cache[measurement[1]] = lm_id
+            else:
+                # Using the proposal distribution, the importance factor was already computed while sampling the pose
+                self.update_landmark(particle, measurement, lm_id, update_weight=not self.measurement_proposal)
+                if self.existence is not None:
+                    self.merge_landmark(particle, lm_id)
+
+    def associate(self, particle, z):
+        """
+        Associates the measurement to a landmark. If the association cache is enabled, the landmark that the sensor
+        observed most recently is validated first, and all landmarks are only searched if it is too far away.
+        :param particle: Particle that will be updated
+        :param z: Measurement
+        :return: The id of the landmark that is associated to the measurement
+        """
+        if not self.association_cache:
+            return self.data_association(particle, z)
+        lm_id = particle.lm_cache.get(z[1])
+        if lm_id is not None:
+            delta = particle.lm[lm_id] - self.calc_landmark_position(particle, z)[0]
+            if delta[0] ** 2 + delta[1] ** 2 < self.distance_threshold ** 2:
+                return lm_id
+        lm_id = self.data_association(particle, z)
+        # New landmarks are cached once they are added
+        if lm_id < self.get_n_lms(particle.lm):
+            particle.lm_cache[z[1]] = lm_id
+        return lm_id
+
     def data_association(self, particle, z):
         """
         Associates the measurement to a landmark.
@@ -188,7 +469,7 @@ class FastSlam(Slam):
                 particle.w /= sumw
         except ZeroDivisionError:
             for particle in particles:
-                particle.w = 1.0 / self.n_particles
+                particle.w = 1.0 / len(particles)
         return particles
 
     def clear_importance_factors(self, particles):
@@ -198,7 +479,7 @@ class FastSlam(Slam):
         :return: List of particles with same importance factors
         """
         for particle in particles:
-            particle.w = 1.0 / self.n_particles
+            particle.w = 1.0 / len(particles)
         return particles
 
     def get_best_particle(self):
@@ -229,15 +510,18 @@ class FastSlam(Slam):
         Gz = np.array([[measured_x, -r * measured_y],
                        [measured_y, r * measured_x]])
         particle.lmP = np.vstack((particle.lmP, Gz @ self.sensor_noise @ Gz.T))
+        particle.lm_obs = np.append(particle.lm_obs, 1)
+        particle.lm_miss = np.append(particle.lm_miss, 0)
 
         return particle
 
-    def update_landmark(self, particle, z, lm_id):
+    def update_landmark(self, particle, z, lm_id, update_weight=True):
         """
         Updates the estimated landmark position and uncertainties as well as the particles importance factor
         :param particle: Particle that is being updated
         :param z: Measurement
         :param lm_id: Id of the landmark that is associated to the measurement
+        :param update_weight: Boolean value specifying if the importance factor is updated
         :return: Updated particle
         """
         landmark = np.array(particle.lm[lm_id, :]).reshape(2, 1)
@@ -264,11 +548,73 @@ class FastSlam(Slam):
         landmark, landmark_cov = self.ekf_update(landmark, landmark_cov, innovation, H, Psi)
         particle.lm[lm_id, :] = landmark.T
         particle.lmP[2 * lm_id:2 * lm_id + 2, :] = landmark_cov
+        particle.lm_obs[lm_id] += 1
         # Multiplying importance factors, since this is just the weight for a single sensor measurement
-        particle.w *= self.compute_importance_factor(innovation, Psi)
+        if update_weight:
+            particle.w *= self.compute_importance_factor(innovation, Psi)
 
         return particle
 
+    def update_landmark_existence(self, particles, z):
+        """
+        Tracks the existence of the landmarks using negative evidence. A landmark that lies within the range of a sensor
+        close to its detection line is counted as missed if this sensor did not detect anything.
+        Landmarks that were missed too often compared to how often they were observed are removed.
+        :param particles: List of particles
+        :param z: Measurements of the sensors that observed a landmark
+        :return: List of particles without the removed landmarks
+        """
+        idle_angles = self.existence.idle_sensor_angles(z)
+        for particle in particles:
+            if self.get_n_lms(particle.lm) == 0:
+                continue
+            missed = self.existence.missed_landmarks(particle.x, particle.y, particle.theta, particle.lm, idle_angles)
+            particle.lm_miss = particle.lm_miss + missed
+            keep = self.existence.supported(particle.lm_obs, particle.lm_miss)
+            if not np.all(keep):
+                self.remove_landmarks(particle, keep)
+        return particles
+
+    def merge_landmark(self, particle, lm_id):
+        """
+        Merges a landmark with its closest landmark, if both are closer than the merge distance.
+        Their position estimates are fused and the merged landmark replaces the first one.
+        :param particle: Particle that will be updated
+        :param lm_id: Id of the landmark that was updated
+        """
+        delta = particle.lm - particle.lm[lm_id]
+        distances = delta[:, 0] ** 2 + delta[:, 1] ** 2
+        distances[lm_id] = np.inf
+        other_id = int(np.argmin(distances))
+        if distances[other_id] >= self.existence.merge_distance ** 2:
+            return
+        first, second = min(lm_id, other_id), max(lm_id, other_id)
+        information_first = np.linalg.inv(particle.lmP[2 * first:2 * first + 2, :])
+        information_second = np.linalg.inv(particle.lmP[2 * second:2 * second + 2, :])
+        landmark_cov = np.linalg.inv(information_first + information_second)
+        landmark = landmark_cov @ (information_first @ particle.lm[first] + information_second @ particle.lm[second])
+        particle.lm[first, :] = landmark
+        particle.lmP[2 * first:2 * first + 2, :] = landmark_cov
+        particle.lm_obs[first] += particle.lm_obs[second]
+        particle.lm_miss[first] += particle.lm_miss[second]
+        keep = np.ones(self.get_n_lms(particle.lm), dtype=bool)
+        keep[second] = False
+        self.remove_landmarks(particle, keep)
+
+    def remove_landmarks(self, particle, keep):
+        """
+        Removes landmarks from a particle
+        :param particle: Particle that will be updated
+        :param keep: Boolean array specifying which landmarks are kept
+        """
+        particle.lm = particle.lm[keep]
+        particle.lmP = particle.lmP.reshape(-1, 2, self.landmark_state_size)[keep].reshape(-1, self.landmark_state_size)
+        particle.lm_obs = particle.lm_obs[keep]
+        particle.lm_miss = particle.lm_miss[keep]
+        # Shift the cached landmark ids and discard the ones of removed landmarks
+        remap = np.cumsum(keep) - 1
+        particle.lm_cache = {angle: int(remap[lm_id]) for (angle, lm_id) in particle.lm_cache.items() if keep[lm_id]}
+
     @staticmethod
     def compute_importance_factor(innovation, Psi):
         """
@@ -301,6 +647,7 @@ class FastSlam(Slam):
     def resampling(self, particles):
         """
         Resamples the particles based on their importance factors.
+        If the number of particles is adaptive, it is determined by KLD-sampling.
         :param particles: list Particles with importance factors
         :return: List of particles resampled based on their importance factors
         """
@@ -308,25 +655,54 @@ class FastSlam(Slam):
         weights = np.array([particle.w for particle in particles])
         wcum = np.cumsum(weights)
         # Generate a random number for each successor particle uniformly between 0 and 1
-        unif = np.random.rand(self.n_particles)
-        inds = []
+        n_samples = self.max_particles if self.adaptive_particles else self.n_particles
+        unif = self.rng.random(n_samples)
         # Determine which index i was sampled by each random number
-        for random in unif:
-            i = 0
-            while random > wcum[i]:
-                i += 1
-            inds.append(i)
+        inds = np.minimum(np.searchsorted(wcum, unif), len(particles) - 1)
+        if self.adaptive_particles:
+            inds = inds[:self.kld_sample_count(particles, inds)]
+        # Assign successor particles by copying the sampled particles.
+        # The landmark arrays are copied, since they are updated in place and must not be shared between particles.
         tparticles = particles
-        # Assign successor particles by copying the sampled particles
-        for i in range(len(inds)):
-            particles[i].x = tparticles[inds[i]].x
-            particles[i].y = tparticles[inds[i]].y
-            particles[i].theta = tparticles[inds[i]].theta
-            particles[i].lm = tparticles[inds[i]].lm[:, :]
-            particles[i].lmP = tparticles[inds[i]].lmP[:, :]
-            particles[i].w = tparticles[inds[i]].w
+        particles = []
+        for i in inds:
+            particle = Particle(self.landmark_state_size)
+            particle.x = tparticles[i].x
+            particle.y = tparticles[i].y
+            particle.theta = tparticles[i].theta
+            particle.lm = tparticles[i].lm.copy()
+            particle.lmP = tparticles[i].lmP.copy()
+            particle.lm_obs = tparticles[i].lm_obs.copy()
+            particle.lm_miss = tparticles[i].lm_miss.copy()
+            particle.lm_cache = tparticles[i].lm_cache.copy()
+            particle.w = tparticles[i].w
+            particles.append(particle)
         return particles
 
+    def kld_sample_count(self, particles, inds):
+        """
+        Determines the number of particles using KLD-sampling. The sampled poses are sorted into bins and the particles
+        are sampled until their number bounds the Kullback-Leibler divergence between the particle approximation and
+        the true distribution, which is the larger the more bins are occupied.
+        :param particles: List of particles that are resampled
+        :param inds: Indices of the sampled particles in the order they were sampled
+        :return: Number of particles to be used
+        """
+        poses = np.array([[particle.x, particle.y, particle.theta] for particle in particles])[inds]
+        bins = np.floor(poses / self.bin_size).astype(np.int64)
+        # Number of occupied bins after every sample
+        _, first_samples = np.unique(bins, axis=0, return_index=True)
+        new_bin = np.zeros(len(inds), dtype=bool)
+        new_bin[first_samples] = True
+        k = np.cumsum(new_bin)
+        # Wilson-Hilferty approximation of the chi-square quantile with k - 1 degrees of freedom
+        a = 2 / (9 * np.maximum(k - 1, 1))
+        required = (k - 1) / (2 * self.kld_epsilon) * (1 - a + np.sqrt(a) * self.kld_z) ** 3
+        sufficient = np.arange(1, len(inds) + 1) >= np.maximum(required, self.min_particles)
+        if not np.any(sufficient):
+            return len(inds)
+        return int(np.argmax(sufficient)) + 1
+
     @staticmethod
     def motion_model(x, u, dt):
         """
@@ -348,6 +724,28 @@ class FastSlam(Slam):
         res[2] = normalize_angle(res[2])
         return res
 
+    @staticmethod
+    def motion_model_vectorized(poses, v, w, dt):
+        """
+        Noise-free motion model applied to multiple poses with individual motion commands
+        :param poses: Array of shape (n, 3) holding the robot poses
+        :param v: Array of the translational velocities
+        :param w: Array of the angular velocities
+        :param dt: (Discrete) Time for which the motion commands are executed
+        :return: Array of shape (n, 3) holding the resulting robot poses
+        """
+        theta = poses[:, 2]
+        # Robots without angular velocity follow a straight line, all others a circular arc
+        straight = np.abs(w) < 1e-9
+        safe_w = np.where(straight, 1.0, w)
+        result = np.empty_like(poses)
+        result[:, 0] = poses[:, 0] + np.where(straight, dt * v * np.cos(theta),
+                                              v / safe_w * (np.sin(theta + dt * w) - np.sin(theta)))
+        result[:, 1] = poses[:, 1] + np.where(straight, dt * v * np.sin(theta),
+                                              v / safe_w * (-np.cos(theta + dt * w) + np.cos(theta)))
+        result[:, 2] = normalize_angle(theta + dt * w)
+        return result
+
     @staticmethod
     def get_n_lms(lms):
         """
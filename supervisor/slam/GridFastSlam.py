@@ -0,0 +1,211 @@
+"""
+Grid-based FastSLAM, a Rao-Blackwellized particle filter in which every particle owns an occupancy grid.
+Based on Grisetti et al., "Improved Techniques for Grid Mapping With Rao-Blackwellized Particle Filters", 2007,
+without the scan matching of the proposal distribution.
+The grids of the particles share their tiles copy-on-write, so resampling does not copy any grid,
+and the memory is proportional to the distinct map content instead of the number of particles.
+"""
+
+import numpy as np
+
+from models.Pose import Pose
+from supervisor.slam.FastSlam import FastSlam
+from supervisor.slam.OccupancyGrid import OccupancyGrid
+from supervisor.slam.Slam import Slam
+
+
+class GridParticle:
+
+    def __init__(self, grid):
+        """
+        A particle is initialized at the origin position with an importance factor of 1
+        :param grid: The occupancy grid of the particle
+        """
+        # Importance factor
+        self.w = 1.0
+        # Robots x coordinate
+        self.x = 0.0
+        # Robots y coordinate
+        self.y = 0.0
+        # Robots angle
+        self.theta = 0.0
+        # Occupancy grid mapped along the trajectory of the particle
+        self.grid = grid
+
+
+class GridFastSlam(Slam):
+
+    def __init__(self, supervisor_interface, slam_cfg, step_time):
+        """
+        Creates a GridFastSlam object
+        :param supervisor_interface: The interface to interact with the robot supervisor
+        :param slam_cfg: The configuration for the SLAM algorithm
+        :param step_time: The discrete time that a single simulation cycle increments
+        """
+        self.supervisor = supervisor_interface
+        self.dt = step_time
+        grid_slam_cfg = slam_cfg["grid_fast_slam"]
+        self.n_particles = grid_slam_cfg["n_particles"]
+        # Standard deviations of the translational and angular velocities
+        self.motion_noise_std = np.array([grid_slam_cfg["motion_noise"]["translational_velocity"],
+                                          grid_slam_cfg["motion_noise"]["rotational_velocity"]])
+        self.random_measurement = grid_slam_cfg["random_measurement"]
+        self.resampling_threshold = grid_slam_cfg["resampling_threshold"]
+        # Random number generator of the algorithm, seeded to make a run reproducible
+        self.rng = np.random.default_rng(grid_slam_cfg["seed"])
+        # The measurements are relative to the robot center. The rays of the sensors that do not detect anything
+        # end at their maximum range.
+        placements = supervisor_interface.proximity_sensor_placements()
+        self.sensor_angles = np.array([pose.theta for pose in placements])
+        self.idle_distances = np.array([np.hypot(pose.x, pose.y) for pose in placements]) + \
+            supervisor_interface.proximity_sensor_max_range()
+        # All particles start with copies of the same empty grid, so that they share their tiles
+        grid = OccupancyGrid(slam_cfg["occupancy_grid"])
+        self.particles = [GridParticle(grid.copy()) for _ in range(self.n_particles)]
+
+    def get_estimated_pose(self):
+        """
+        Returns the estimated robot pose by only considering the particle with the highest importance factor
+        :return: Estimated robot pose consisting of position and angle
+        """
+        particle = self.get_best_particle()
+        return Pose(particle.x, particle.y, particle.theta)
+
+    def get_landmarks(self):
+        """
+        Returns the estimated landmark positions. The map of this algorithm is a grid, so there are no landmarks.
+        :return: Empty list
+        """
+        return []
+
+    def get_occupancy_grid(self):
+        """
+        Returns the occupancy grid of the particle with the highest importance factor
+        :return: The occupancy grid
+        """
+        return self.get_best_particle().grid
+
+    def update(self, u, z):
+        """
+        Performs a full update step of the algorithm
+        :param u: Motion command
+        :param z: Measurements of the sensors that observed a landmark
+        """
+        self.predict_particles(u)
+        distances, detected = self.sensor_readings(z)
+        rays = [self.sensor_rays(particle, distances) for particle in self.particles]
+        self.weight_particles(rays, detected)
+        self.integrate_scans(rays, detected)
+        self.particles = self.resampling(self.particles)
+
+    def predict_particles(self, u):
+        """
+        Performs the prediction step of the algorithm.
+        Every particle applies the motion command with its own noise, all particles are predicted at once.
+        :param u: Motion command
+        """
+        poses = np.array([[particle.x, particle.y, particle.theta] for particle in self.particles])
+        noisy_u = u[:, 0] + self.rng.standard_normal((len(self.particles), 2)) * self.motion_noise_std
+        poses = FastSlam.motion_model_vectorized(poses, noisy_u[:, 0], noisy_u[:, 1], self.dt)
+        for particle, (x, y, theta) in zip(self.particles, poses):
+            particle.x = x
+            particle.y = y
+            particle.theta = theta
+
+    def sensor_readings(self, z):
+        """
+        Completes the measurements with the readings of the sensors that did not detect anything
+        :param z: Measurements of the sensors that observed a landmark
+        :return: Array of the distances of the rays of all sensors relative to the robot center and
+                 boolean array specifying which sensors detected an obstacle
+        """
+        distances = self.idle_distances.copy()
+        detected = np.zeros(len(self.sensor_angles), dtype=bool)
+        for (distance, angle) in z:
+            sensor = np.argmin(np.abs(self.sensor_angles - angle))
+            distances[sensor] = distance
+            detected[sensor] = True
+        return distances, detected
+
+    def sensor_rays(self, particle, distances):
+        """
+        Computes the rays of the sensors in world coordinates, assuming the pose of a particle
+        :param particle: The particle
+        :param distances: Array of the distances of the rays relative to the robot center
+        :return: Arrays of shape (n, 2) holding the start and end points of the rays
+        """
+        angles = particle.theta + self.sensor_angles
+        origins = np.tile([particle.x, particle.y], (len(angles), 1))
+        ends = origins + np.column_stack((np.cos(angles), np.sin(angles))) * distances[:, np.newaxis]
+        return origins, ends
+
+    def weight_particles(self, rays, detected):
+        """
+        Computes the importance factors of the particles as the likelihood of the detections given their grids.
+        A detection is likely if an occupied cell lies in the neighbourhood of the end cell of its ray,
+        a random measurement explains detections that are not supported by the grid.
+        :param rays: List holding the start and end points of the rays of every particle
+        :param detected: Boolean array specifying which sensors detected an obstacle
+        """
+        if not np.any(detected):
+            return
+        offsets = np.array([(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)])
+        for particle, (_, ends) in zip(self.particles, rays):
+            end_cells = particle.grid.cell_indices(ends[detected])
+            neighbourhood = (end_cells[:, np.newaxis, :] + offsets[np.newaxis, :, :]).reshape(-1, 2)
+            log_odds = particle.grid.log_odds(neighbourhood).reshape(len(end_cells), len(offsets)).max(axis=1)
+            occupancy = 1 - 1 / (1 + np.exp(log_odds))
+            particle.w *= np.prod(self.random_measurement + (1 - self.random_measurement) * occupancy)
+
+    def integrate_scans(self, rays, detected):
+        """
+        Integrates the scan into the grid of every particle. The rays of all particles are traversed at once.
+        :param rays: List holding the start and end points of the rays of every particle
+        :param detected: Boolean array specifying which sensors detected an obstacle
+        """
+        origins = np.vstack([origins for (origins, _) in rays])
+        ends = np.vstack([ends for (_, ends) in rays])
+        cells, ray_ids = self.particles[0].grid.traverse(origins, ends)
+        # The cells are ordered by their rays, which are ordered by their particles
+        bounds = np.searchsorted(ray_ids, np.arange(len(self.particles) + 1) * len(detected))
+        for i, (particle, (_, particle_ends)) in enumerate(zip(self.particles, rays)):
+            particle.grid.integrate_cells(cells[bounds[i]:bounds[i + 1]],
+                                          particle.grid.cell_indices(particle_ends[detected]))
+
+    def get_best_particle(self):
+        """
+        Returns the particle with the highest importance factor
+        :return: Particle with highest importance factor
+        """
+        return max(self.particles, key=lambda particle: particle.w)
+
+    def resampling(self, particles):
+        """
+        Resamples the particles based on their importance factors, once the effective number of particles drops below
+        the resampling threshold. The successor particles share the grids of the sampled particles copy-on-write
+        and the grids of the previous particles are released.
+        :param particles: List of particles with importance factors
+        :return: List of particles
+        """
+        weights = np.array([particle.w for particle in particles])
+        if np.sum(weights) == 0:
+            weights = np.ones(len(particles))
+        weights /= np.sum(weights)
+        for particle, w in zip(particles, weights):
+            particle.w = w
+        if 1 / np.sum(weights ** 2) >= self.resampling_threshold * len(particles):
+            return particles
+        # Low variance resampling
+        positions = (self.rng.random() + np.arange(self.n_particles)) / self.n_particles
+        inds = np.minimum(np.searchsorted(np.cumsum(weights), positions), len(particles) - 1)
+        resampled = []
+        for i in inds:
+            particle = GridParticle(particles[i].grid.copy())
+            particle.x = particles[i].x
+            particle.y = particles[i].y
+            particle.theta = particles[i].theta
+            particle.w = 1.0 / self.n_particles
+            resampled.append(particle)
+        for particle in particles:
+            particle.grid.release()
+        return resampled
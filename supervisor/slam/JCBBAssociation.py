@@ -0,0 +1,176 @@
+"""
+Joint compatibility branch and bound (JCBB) data association for EKF SLAM.
+Based on Neira and Tardós, "Data Association in Stochastic Mapping Using the Joint Compatibility Test", 2001.
+In contrast to associating every measurement on its own with the closest landmark, all measurements of a cycle are
+associated jointly, which rejects associations that are individually plausible but inconsistent with each other.
+"""
+
+from math import sqrt, exp
+from statistics import NormalDist
+
+import numpy as np
+
+from utils.math_util import normalize_angle
+
+
+class JCBBAssociation:
+
+    def __init__(self, distance_threshold, sensor_noise, cutoff_distance, robot_state_size, landmark_state_size):
+        """
+        Initializes a JCBBAssociation object
+        :param distance_threshold: The Mahalanobis distance threshold that a single association has to satisfy
+        :param sensor_noise: The covariance matrix of a single measurement
+        :param cutoff_distance: Landmarks that are further away from the robot are not considered
+        :param robot_state_size: The number of state variables of the robot pose
+        :param landmark_state_size: The number of state variables of a landmark
+        """
+        self.distance_threshold = distance_threshold
+        self.sensor_noise = sensor_noise
+        self.cutoff_distance = cutoff_distance
+        self.robot_state_size = robot_state_size
+        self.landmark_state_size = landmark_state_size
+        # The threshold of a single association corresponds to the quantile of the chi-square distribution with
+        # 2 degrees of freedom for this probability. The joint thresholds use the same probability.
+        self.z = NormalDist().inv_cdf(1 - exp(-distance_threshold / 2))
+        self.joint_thresholds = {}
+
+    def associate(self, mu, Sigma, z):
+        """
+        Jointly associates all measurements of a cycle.
+        The association maximizing the number of associated measurements is chosen, ties are broken by the smaller joint
+        Mahalanobis distance. Measurements that are not compatible with any landmark on their own are new landmarks.
+        Measurements that are only excluded by the joint compatibility are discarded,
+        since adding them as new landmarks would duplicate existing ones.
+        :param mu: Combined state vector
+        :param Sigma: Storage of the covariance matrix
+        :param z: List of measurements, each a tuple of measured distance and measured angle
+        :return: List holding for every measurement the id of the associated landmark,
+                 -1 for a new landmark or None for a discarded measurement
+        """
+        self.mu = mu
+        self.Sigma = Sigma
+        n_lm = (len(mu) - self.robot_state_size) // self.landmark_state_size
+        landmarks = mu[self.robot_state_size:, 0].reshape(n_lm, self.landmark_state_size)
+        # Spatial pruning: only the landmarks close to the robot are candidates
+        deltas = landmarks - mu[0:2, 0]
+        nearby = np.flatnonzero(deltas[:, 0] ** 2 + deltas[:, 1] ** 2 < self.cutoff_distance ** 2)
+        # Individual gating: the candidates of every measurement, sorted by their Mahalanobis distance
+        self.candidates = []
+        self.innovations = {}
+        self.jacobians = {}
+        for i, measurement in enumerate(z):
+            self.candidates.append(self.__individually_compatible(i, measurement, nearby))
+        self.best = [None] * len(z)
+        self.best_score = (0, 0.0)
+        self.__search(0, [], 0)
+        return [best if best is not None else (-1 if len(candidates) == 0 else None)
+                for (best, candidates) in zip(self.best, self.candidates)]
+
+    def __individually_compatible(self, i, measurement, nearby):
+        """
+        Determines the landmarks that are compatible with a measurement on their own.
+        Stores the innovations and Jacobians of these associations for the joint compatibility test.
+        :param i: Index of the measurement
+        :param measurement: Tuple of measured distance and measured angle
+        :param nearby: Indices of the landmarks close to the robot
+        :return: Indices of the compatible landmarks, sorted by increasing Mahalanobis distance
+        """
+        if len(nearby) == 0:
+            return []
+        R = self.robot_state_size
+        L = self.landmark_state_size
+        ids = R + L * nearby
+        delta_x = self.mu[ids, 0] - self.mu[0, 0]
+        delta_y = self.mu[ids + 1, 0] - self.mu[1, 0]
+        q = delta_x ** 2 + delta_y ** 2
+        sq = np.sqrt(q)
+        innovations = np.empty((len(nearby), 2))
+        innovations[:, 0] = measurement[0] - sq
+        expected_angles = normalize_angle(np.arctan2(delta_y, delta_x) - self.mu[2, 0])
+        innovations[:, 1] = normalize_angle(measurement[1] - expected_angles)
+        # Jacobians of the measurements with respect to the robot pose and the landmark positions
+        H_r = np.zeros((len(nearby), 2, R))
+        H_r[:, 0, 0], H_r[:, 0, 1] = -delta_x / sq, -delta_y / sq
+        H_r[:, 1, 0], H_r[:, 1, 1], H_r[:, 1, 2] = delta_y / q, -delta_x / q, -1
+        H_l = -H_r[:, :, :L]
+        # Covariance of the innovation, only the blocks of the robot pose and the landmark are involved
+        Sigma_rr = self.Sigma.block(np.arange(R))
+        Sigma_rl = self.Sigma.entries(np.arange(R)[np.newaxis, :, np.newaxis],
+                                      ids[:, np.newaxis, np.newaxis] + np.arange(L)[np.newaxis, np.newaxis, :])
+        Sigma_ll = self.Sigma.entries(ids[:, np.newaxis, np.newaxis] + np.arange(L)[:, np.newaxis],
+                                      ids[:, np.newaxis, np.newaxis] + np.arange(L)[np.newaxis, :])
+        H_r_T, H_l_T = H_r.transpose(0, 2, 1), H_l.transpose(0, 2, 1)
+        Psi = H_r @ Sigma_rr @ H_r_T + H_r @ Sigma_rl @ H_l_T + H_l @ Sigma_rl.transpose(0, 2, 1) @ H_r_T + \
+            H_l @ Sigma_ll @ H_l_T + self.sensor_noise
+        distances = np.einsum('ki,ki->k', innovations, np.linalg.solve(Psi, innovations[:, :, np.newaxis])[:, :, 0])
+        compatible = np.flatnonzero(distances < self.distance_threshold)
+        compatible = compatible[np.argsort(distances[compatible])]
+        for k in compatible:
+            self.innovations[i, nearby[k]] = innovations[k]
+            self.jacobians[i, nearby[k]] = (H_r[k], H_l[k])
+        return [int(nearby[k]) for k in compatible]
+
+    def __search(self, i, hypothesis, n_pairs):
+        """
+        Recursively extends a hypothesis by an association of the next measurement
+        :param i: Index of the next measurement
+        :param hypothesis: List holding for every previous measurement the id of the associated landmark or None
+        :param n_pairs: Number of associated measurements of the hypothesis
+        """
+        if i == len(self.candidates):
+            score = (n_pairs, -self.__joint_distance(hypothesis))
+            if score > self.best_score:
+                self.best = list(hypothesis)
+                self.best_score = score
+            return
+        # Multiple sensors may detect the same obstacle, so a landmark can be associated with multiple measurements
+        for lm_id in self.candidates[i]:
+            hypothesis.append(lm_id)
+            if self.__joint_distance(hypothesis) < self.__joint_threshold(n_pairs + 1):
+                self.__search(i + 1, hypothesis, n_pairs + 1)
+            hypothesis.pop()
+        # Bound: Leaving the measurement unassociated is only explored if it may still lead to a better hypothesis
+        if n_pairs + len(self.candidates) - i - 1 > self.best_score[0]:
+            hypothesis.append(None)
+            self.__search(i + 1, hypothesis, n_pairs)
+            hypothesis.pop()
+
+    def __joint_distance(self, hypothesis):
+        """
+        Computes the joint Mahalanobis distance of all associations of a hypothesis
+        :param hypothesis: List holding for every measurement the id of the associated landmark or None
+        :return: The joint Mahalanobis distance
+        """
+        pairs = [(i, lm_id) for (i, lm_id) in enumerate(hypothesis) if lm_id is not None]
+        if len(pairs) == 0:
+            return 0.0
+        R = self.robot_state_size
+        L = self.landmark_state_size
+        landmark_ids = sorted(set(lm_id for (_, lm_id) in pairs))
+        # The state variables involved in the hypothesis are the robot pose and the associated landmarks
+        states = list(range(R)) + [R + L * lm_id + k for lm_id in landmark_ids for k in range(L)]
+        H = np.zeros((2 * len(pairs), len(states)))
+        innovation = np.zeros(2 * len(pairs))
+        for row, (i, lm_id) in enumerate(pairs):
+            H_r, H_l = self.jacobians[i, lm_id]
+            column = R + L * landmark_ids.index(lm_id)
+            H[2 * row:2 * row + 2, 0:R] = H_r
+            H[2 * row:2 * row + 2, column:column + L] = H_l
+            innovation[2 * row:2 * row + 2] = self.innovations[i, lm_id]
+        Psi = H @ self.Sigma.block(states) @ H.T + np.kron(np.identity(len(pairs)), self.sensor_noise)
+        return innovation @ np.linalg.solve(Psi, innovation)
+
+    def __joint_threshold(self, n_pairs):
+        """
+        Returns the threshold of the joint Mahalanobis distance, which is the quantile of the chi-square distribution
+        with 2 degrees of freedom per association. For multiple associations, it is computed by the Wilson-Hilferty
+        approximation.
+        :param n_pairs: Number of associated measurements
+        :return: The threshold
+        """
+        if n_pairs == 1:
+            return self.distance_threshold
+        if n_pairs not in self.joint_thresholds:
+            k = 2 * n_pairs
+            self.joint_thresholds[n_pairs] = k * (1 - 2 / (9 * k) + self.z * sqrt(2 / (9 * k))) ** 3
+        return self.joint_thresholds[n_pairs]
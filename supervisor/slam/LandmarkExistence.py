@@ -0,0 +1,62 @@
+"""
+Tracking of the existence of landmarks using negative evidence.
+The proximity sensors only have a single detection line. A landmark that lies within the range of a sensor and close
+to its detection line is expected to be detected. If this sensor does not detect anything, the landmark is missed.
+"""
+
+from math import pi
+
+import numpy as np
+
+
+class LandmarkExistence:
+
+    def __init__(self, existence_cfg, supervisor_interface):
+        """
+        Initializes a LandmarkExistence object
+        :param existence_cfg: The configuration of the landmark existence tracking
+        :param supervisor_interface: The interface to interact with the robot supervisor
+        """
+        self.sensor_angles = np.array([pose.theta for pose in supervisor_interface.proximity_sensor_placements()])
+        self.max_range = supervisor_interface.proximity_sensor_max_range()
+        self.sensor_cone_angle = np.deg2rad(existence_cfg["sensor_cone_angle"])
+        self.prune_threshold = existence_cfg["prune_threshold"]
+        self.merge_distance = existence_cfg["merge_distance"]
+        self.max_position_std = existence_cfg["max_position_std"]
+
+    def idle_sensor_angles(self, z):
+        """
+        Returns the angles of the sensors that did not detect anything
+        :param z: List of measurements of the sensors that observed a landmark
+        :return: Array of sensor angles
+        """
+        detected_angles = np.array([theta for (_, theta) in z])
+        detecting = np.any(np.abs(self.sensor_angles[:, np.newaxis] - detected_angles[np.newaxis, :]) < 1e-6, axis=1)
+        return self.sensor_angles[~detecting]
+
+    def missed_landmarks(self, x, y, theta, landmarks, idle_angles):
+        """
+        Determines which landmarks were expected to be detected by a sensor that did not detect anything
+        :param x: The robot's x coordinate
+        :param y: The robot's y coordinate
+        :param theta: The robot's angle
+        :param landmarks: Array of shape (n, 2) holding the landmark positions
+        :param idle_angles: The angles of the sensors that did not detect anything
+        :return: Boolean array specifying which landmarks were missed
+        """
+        delta_x = landmarks[:, 0] - x
+        delta_y = landmarks[:, 1] - y
+        bearings = np.arctan2(delta_y, delta_x) - theta
+        # Angles between the landmarks and the detection lines of the idle sensors, normalized to [-pi, pi)
+        offsets = (bearings[:, np.newaxis] - idle_angles[np.newaxis, :] + pi) % (2 * pi) - pi
+        return (delta_x ** 2 + delta_y ** 2 < self.max_range ** 2) & \
+            np.any(np.abs(offsets) < self.sensor_cone_angle, axis=1)
+
+    def supported(self, observations, misses):
+        """
+        Determines which landmarks are supported by the sensor readings
+        :param observations: Array holding the number of times every landmark was observed
+        :param misses: Array holding the number of times every landmark was missed
+        :return: Boolean array specifying which landmarks are kept
+        """
+        return misses - observations < self.prune_threshold
@@ -0,0 +1,251 @@
+"""
+Occupancy grid storing the log-odds of every cell being occupied.
+The grid is sparse: it is split into square tiles, which are only allocated once a ray traverses them,
+so the grid grows on demand with the explored area instead of requiring the bounds of the map in advance.
+Copies of a grid share their tiles, which are only copied once they are written (copy-on-write). The number of grids
+referencing a tile is counted, so that a tile that is no longer shared is written in place.
+"""
+
+import copy
+
+import numpy as np
+
+
+class OccupancyGrid:
+
+    def __init__(self, grid_cfg):
+        """
+        Initializes an OccupancyGrid object
+        :param grid_cfg: The configuration of the occupancy grid
+        """
+        self.resolution = grid_cfg["resolution"]
+        self.tile_size = grid_cfg["tile_size"]
+        self.log_odds_occupied = grid_cfg["log_odds"]["occupied"]
+        self.log_odds_free = grid_cfg["log_odds"]["free"]
+        self.log_odds_min = grid_cfg["log_odds"]["min"]
+        self.log_odds_max = grid_cfg["log_odds"]["max"]
+        # Maps the index (x, y) of a tile to an array of shape (tile_size, tile_size) holding the log-odds of its cells
+        self.tiles = {}
+        # Maps the id of a tile array to the number of grids referencing it, shared by a grid and all of its copies
+        self.reference_counts = {}
+
+    def copy(self):
+        """
+        Returns a copy of the grid, which shares all tiles with this grid until either grid writes them
+        :return: The copy of the grid
+        """
+        grid = copy.copy(self)
+        grid.tiles = dict(self.tiles)
+        for tile in self.tiles.values():
+            self.reference_counts[id(tile)] += 1
+        return grid
+
+    def detached_copy(self):
+        """
+        Returns a copy of the grid that does not share any tile with this grid, so that it can be read by another
+        thread while this grid is modified
+        :return: The copy of the grid
+        """
+        grid = copy.copy(self)
+        grid.tiles = {key: tile.copy() for key, tile in self.tiles.items()}
+        grid.reference_counts = {id(tile): 1 for tile in grid.tiles.values()}
+        return grid
+
+    def release(self):
+        """
+        Releases the tiles of a grid that is no longer used, so that tiles shared with other grids are no longer copied
+        when they are written. The grid is empty afterwards.
+        """
+        for tile in self.tiles.values():
+            self.__release_tile(tile)
+        self.tiles = {}
+
+    def n_distinct_tiles(self):
+        """
+        Returns the number of distinct tiles held by this grid and all grids sharing tiles with it
+        :return: Number of tiles
+        """
+        return len(self.reference_counts)
+
+    def cell_indices(self, points):
+        """
+        Returns the indices of the cells containing the specified points
+        :param points: Array of shape (n, 2) holding the x and y coordinates of the points in meters
+        :return: Integer array of shape (n, 2) holding the x and y indices of the cells
+        """
+        return np.floor(points / self.resolution).astype(np.int64)
+
+    def log_odds(self, cells):
+        """
+        Returns the log-odds of cells. Cells of tiles that were never allocated are unknown, i.e. have log-odds 0.
+        :param cells: Integer array of shape (n, 2) holding the x and y indices of the cells
+        :return: Array of the log-odds of the cells
+        """
+        values = np.zeros(len(cells), dtype=np.float32)
+        for key, tile_cells, local in self.__split_by_tile(cells):
+            tile = self.tiles.get(key)
+            if tile is not None:
+                values[tile_cells] = tile[local[:, 0], local[:, 1]]
+        return values
+
+    def update_cells(self, cells, delta):
+        """
+        Adds a value to the log-odds of cells and clamps them, so that the cells can still change their state quickly
+        :param cells: Integer array of shape (n, 2) holding the x and y indices of distinct cells
+        :param delta: The value that is added to the log-odds
+        """
+        for key, _, local in self.__split_by_tile(cells):
+            tile = self.writable_tile(key)
+            tile[local[:, 0], local[:, 1]] = np.clip(tile[local[:, 0], local[:, 1]] + delta,
+                                                     self.log_odds_min, self.log_odds_max)
+
+    def writable_tile(self, key):
+        """
+        Returns a tile that may be modified, allocating it if it does not exist yet
+        and copying it if it is shared with another grid
+        :param key: The index (x, y) of the tile
+        :return: Array of shape (tile_size, tile_size) holding the log-odds of the cells of the tile
+        """
+        tile = self.tiles.get(key)
+        if tile is not None and self.reference_counts[id(tile)] == 1:
+            return tile
+        if tile is None:
+            tile = np.zeros((self.tile_size, self.tile_size), dtype=np.float32)
+        else:
+            self.__release_tile(tile)
+            tile = tile.copy()
+        self.reference_counts[id(tile)] = 1
+        self.tiles[key] = tile
+        return tile
+
+    def integrate_rays(self, origins, ends, detected):
+        """
+        Integrates a scan of rays. The cells traversed by the rays are updated as free and the end cells of the rays
+        that detected an obstacle as occupied. Every cell is updated at most once per scan, and occupied takes
+        precedence over free, since the end cells of neighbouring rays are often traversed by each other.
+        :param origins: Array of shape (n, 2) holding the start points of the rays in meters
+        :param ends: Array of shape (n, 2) holding the end points of the rays in meters
+        :param detected: Boolean array specifying which rays ended at a detected obstacle
+        """
+        traversed, _ = self.traverse(origins, ends)
+        self.integrate_cells(traversed, self.cell_indices(ends[detected]))
+
+    def integrate_cells(self, traversed, occupied):
+        """
+        Integrates the cells of a scan. Every cell is updated at most once, occupied takes precedence over free.
+        :param traversed: Integer array of shape (n, 2) holding the indices of the cells traversed by the rays
+        :param occupied: Integer array of shape (m, 2) holding the indices of the end cells of rays that detected an
+                         obstacle
+        """
+        free_keys = self.__keys(traversed)
+        occupied_keys = self.__keys(occupied)
+        _, free_ids = np.unique(free_keys, return_index=True)
+        free_ids = free_ids[~np.isin(free_keys[free_ids], occupied_keys)]
+        _, occupied_ids = np.unique(occupied_keys, return_index=True)
+        self.update_cells(traversed[free_ids], self.log_odds_free)
+        self.update_cells(occupied[occupied_ids], self.log_odds_occupied)
+
+    def traverse(self, origins, ends):
+        """
+        Determines the cells traversed by rays using a digital differential analyzer (DDA), vectorized over all rays.
+        Instead of stepping from cell to cell, the ray parameters at which every ray crosses the vertical and the
+        horizontal cell boundaries are computed at once and sorted. Every segment between two consecutive crossings
+        lies within a single cell, which is the cell containing the midpoint of the segment.
+        :param origins: Array of shape (n, 2) holding the start points of the rays in meters
+        :param ends: Array of shape (n, 2) holding the end points of the rays in meters
+        :return: Integer array of shape (m, 2) holding the x and y indices of the traversed cells, which may contain
+                 duplicates, and array holding for every cell the index of the ray traversing it, in increasing order
+        """
+        if len(origins) == 0:
+            return np.zeros((0, 2), dtype=np.int64), np.zeros(0, dtype=np.int64)
+        start = origins / self.resolution
+        direction = ends / self.resolution - start
+        # The maximum number of boundaries that any ray crosses along a single axis
+        n_boundaries = int(np.ceil(np.max(np.abs(direction)))) + 1
+        steps = np.arange(n_boundaries)
+        crossings = [np.zeros((len(start), 1))]
+        for axis in range(2):
+            d = direction[:, axis:axis + 1]
+            # The first boundary in the direction of the ray, followed by the next ones
+            first = np.where(d > 0, np.floor(start[:, axis:axis + 1]) + 1, np.ceil(start[:, axis:axis + 1]) - 1)
+            boundaries = first + np.sign(d) * steps
+            with np.errstate(divide='ignore', invalid='ignore'):
+                t = (boundaries - start[:, axis:axis + 1]) / d
+            crossings.append(np.where(d != 0, t, np.inf))
+        crossings.append(np.ones((len(start), 1)))
+        t = np.minimum(np.sort(np.hstack(crossings), axis=1), 1)
+        valid = t[:, 1:] > t[:, :-1]
+        midpoints = (t[:, 1:] + t[:, :-1]) / 2
+        points = start[:, np.newaxis, :] + midpoints[:, :, np.newaxis] * direction[:, np.newaxis, :]
+        return np.floor(points[valid]).astype(np.int64), np.nonzero(valid)[0]
+
+    def to_array(self):
+        """
+        Returns the occupancy probabilities of the bounding box of all allocated tiles
+        :return: Array indexed by the x and y indices of the cells relative to the bounding box, holding the
+                 probabilities of the cells being occupied, and the coordinates of the lower left corner of the bounding
+                 box in meters. The array is empty if no tile is allocated.
+        """
+        if len(self.tiles) == 0:
+            return np.zeros((0, 0)), (0.0, 0.0)
+        T = self.tile_size
+        keys = np.array(list(self.tiles.keys()))
+        lower = keys.min(axis=0)
+        shape = (keys.max(axis=0) - lower + 1) * T
+        log_odds = np.zeros(shape, dtype=np.float32)
+        for (tx, ty), tile in self.tiles.items():
+            x, y = (tx - lower[0]) * T, (ty - lower[1]) * T
+            log_odds[x:x + T, y:y + T] = tile
+        return 1 - 1 / (1 + np.exp(log_odds)), tuple(lower * T * self.resolution)
+
+    def occupied_cells(self):
+        """
+        Returns the cells that are more likely occupied than free
+        :return: Integer array of shape (n, 2) holding the x and y indices of the cells and array of their probabilities
+                 of being occupied
+        """
+        T = self.tile_size
+        cells, log_odds = [np.zeros((0, 2), dtype=np.int64)], [np.zeros(0, dtype=np.float32)]
+        for (tx, ty), tile in list(self.tiles.items()):
+            local = np.argwhere(tile > 0)
+            cells.append(local + (tx * T, ty * T))
+            log_odds.append(tile[local[:, 0], local[:, 1]])
+        return np.concatenate(cells), 1 - 1 / (1 + np.exp(np.concatenate(log_odds)))
+
+    def __split_by_tile(self, cells):
+        """
+        Groups cells by the tiles containing them
+        :param cells: Integer array of shape (n, 2) holding the x and y indices of the cells
+        :return: Generator of tuples of the index (x, y) of a tile, the indices or slice into the cells array of the
+                 cells within the tile and their indices relative to the tile
+        """
+        if len(cells) == 0:
+            return
+        tile_indices = cells // self.tile_size
+        local = cells - tile_indices * self.tile_size
+        # A scan usually lies within a single tile, which does not need to be grouped
+        if np.all(tile_indices == tile_indices[0]):
+            yield (int(tile_indices[0, 0]), int(tile_indices[0, 1])), slice(None), local
+            return
+        _, first, inverse = np.unique(self.__keys(tile_indices), return_index=True, return_inverse=True)
+        for i, (tx, ty) in enumerate(tile_indices[first]):
+            tile_cells = np.flatnonzero(inverse == i)
+            yield (int(tx), int(ty)), tile_cells, local[tile_cells]
+
+    def __release_tile(self, tile):
+        """
+        Decrements the number of grids referencing a tile
+        :param tile: The tile that is no longer referenced by a grid
+        """
+        self.reference_counts[id(tile)] -= 1
+        if self.reference_counts[id(tile)] == 0:
+            del self.reference_counts[id(tile)]
+
+    @staticmethod
+    def __keys(cells):
+        """
+        Encodes the indices of cells as single integers
+        :param cells: Integer array of shape (n, 2) holding the x and y indices of the cells
+        :return: Integer array of the keys of the cells
+        """
+        return cells[:, 0] * (1 << 32) + cells[:, 1]
@@ -0,0 +1,56 @@
+"""
+Occupancy grid mapping with known poses.
+In contrast to the landmark-based SLAM algorithms, the whole scan is integrated, including the free space along the
+rays of the sensors that do not detect anything, so that the resulting dense map can be used for planning.
+"""
+
+import numpy as np
+
+from supervisor.slam.OccupancyGrid import OccupancyGrid
+
+
+class OccupancyGridMapper:
+
+    def __init__(self, supervisor_interface, grid_cfg):
+        """
+        Initializes an OccupancyGridMapper object
+        :param supervisor_interface: The interface to interact with the robot supervisor
+        :param grid_cfg: The configuration of the occupancy grid
+        """
+        # The sensor placements as an array of shape (n, 3) holding x, y and angle relative to the robot
+        self.sensor_poses = np.array([pose.sunpack() for pose in supervisor_interface.proximity_sensor_placements()])
+        self.max_range = supervisor_interface.proximity_sensor_max_range()
+        self.grid = OccupancyGrid(grid_cfg)
+
+    def update(self, pose, distances, detected):
+        """
+        Integrates the readings of all proximity sensors into the occupancy grid
+        :param pose: The pose of the robot that the readings were taken at
+        :param distances: List of the distances measured by the sensors, relative to the sensors
+        :param detected: List of boolean values indicating which sensors detected an obstacle
+        """
+        origins, ends = self.sensor_rays(*pose.sunpack(), np.minimum(distances, self.max_range))
+        self.grid.integrate_rays(origins, ends, np.array(detected, dtype=bool))
+
+    def sensor_rays(self, x, y, theta, distances):
+        """
+        Computes the rays of the proximity sensors in world coordinates
+        :param x: The robot's x coordinate
+        :param y: The robot's y coordinate
+        :param theta: The robot's angle
+        :param distances: Array of the distances measured by the sensors, relative to the sensors
+        :return: Arrays of shape (n, 2) holding the start and end points of the rays
+        """
+        cos_theta, sin_theta = np.cos(theta), np.sin(theta)
+        origins = np.column_stack((x + cos_theta * self.sensor_poses[:, 0] - sin_theta * self.sensor_poses[:, 1],
+                                   y + sin_theta * self.sensor_poses[:, 0] + cos_theta * self.sensor_poses[:, 1]))
+        angles = theta + self.sensor_poses[:, 2]
+        ends = origins + np.column_stack((np.cos(angles), np.sin(angles))) * np.asarray(distances)[:, np.newaxis]
+        return origins, ends
+
+    def get_occupancy_grid(self):
+        """
+        Returns the occupancy grid
+        :return: The occupancy grid
+        """
+        return self.grid
@@ -0,0 +1,126 @@
+"""
+Preintegration of motion commands in between SLAM keyframes.
+The noise-free motions of consecutive simulation cycles are composed into a single relative motion,
+while their uncertainties are propagated into the covariance of this relative motion.
+"""
+
+from math import cos, sin, sqrt, radians
+
+import numpy as np
+
+
+class OdometryPreintegration:
+
+    def __init__(self, keyframe_cfg):
+        """
+        Initializes an OdometryPreintegration object
+        :param keyframe_cfg: The configuration of the keyframes
+        """
+        self.max_distance = keyframe_cfg["max_distance"]
+        self.max_rotation = radians(keyframe_cfg["max_rotation"])
+        self.reset()
+
+    def reset(self):
+        """
+        Discards the preintegrated motion, which is done once it has been applied in a keyframe
+        """
+        # The motion relative to the pose of the last keyframe, consisting of x and y offset and rotation
+        self.delta = np.zeros((3, 1))
+        # The covariance of the motion, expressed in the frame of the robot at the last keyframe
+        self.covariance = np.zeros((3, 3))
+        # The distance travelled and the absolute rotation performed since the last keyframe
+        self.distance = 0.0
+        self.rotation = 0.0
+        self.n_steps = 0
+
+    def integrate(self, step, step_covariance):
+        """
+        Composes the motion of a single simulation cycle with the preintegrated motion
+        :param step: The noise-free motion of the cycle relative to the pose at the beginning of the cycle
+        :param step_covariance: The covariance of the motion of the cycle, expressed in the frame of the robot
+                                at the beginning of the cycle
+        """
+        step_x, step_y, step_theta = step[:, 0]
+        theta = self.delta[2, 0]
+        c, s = cos(theta), sin(theta)
+        # Jacobian of the composition with respect to the preintegrated motion
+        F = np.array([[1, 0, -s * step_x - c * step_y],
+                      [0, 1, c * step_x - s * step_y],
+                      [0, 0, 1]])
+        # Jacobian of the composition with respect to the motion of the cycle
+        W = self.rotation_matrix(theta)
+        self.delta = self.delta + W @ step
+        self.covariance = F @ self.covariance @ F.T + W @ step_covariance @ W.T
+        self.distance += sqrt(step_x ** 2 + step_y ** 2)
+        self.rotation += abs(step_theta)
+        self.n_steps += 1
+
+    def keyframe_reached(self, z):
+        """
+        Determines whether the current simulation cycle is a keyframe,
+        which is the case if a landmark is observed or the robot moved too far since the last keyframe
+        :param z: List of measurements of the sensors that observed a landmark
+        :return: Boolean value specifying if the full SLAM update has to be performed
+        """
+        return len(z) > 0 or self.distance >= self.max_distance or self.rotation >= self.max_rotation
+
+    def apply(self, pose):
+        """
+        Applies the noise-free preintegrated motion to a pose
+        :param pose: The pose at the last keyframe as a vector of x, y and angle
+        :return: The resulting pose
+        """
+        return pose + self.rotation_matrix(pose[2, 0]) @ self.delta
+
+    def apply_all(self, poses):
+        """
+        Applies the noise-free preintegrated motion to multiple poses at once
+        :param poses: Array of shape (n, 3) holding the poses at the last keyframe as rows of x, y and angle
+        :return: Array of shape (n, 3) holding the resulting poses
+        """
+        c, s = np.cos(poses[:, 2]), np.sin(poses[:, 2])
+        dx, dy, dtheta = self.delta[0, 0], self.delta[1, 0], self.delta[2, 0]
+        return poses + np.stack([c * dx - s * dy, s * dx + c * dy, np.full(len(poses), dtheta)], axis=1)
+
+    def jacobian(self, pose):
+        """
+        Returns the Jacobian of the application of the preintegrated motion with respect to the pose
+        :param pose: The pose at the last keyframe as a vector of x, y and angle
+        :return: The Jacobian matrix
+        """
+        c, s = cos(pose[2, 0]), sin(pose[2, 0])
+        dx, dy = self.delta[0, 0], self.delta[1, 0]
+        return np.array([[1, 0, -s * dx - c * dy],
+                         [0, 1, c * dx - s * dy],
+                         [0, 0, 1]])
+
+    @staticmethod
+    def rotation_matrix(theta):
+        """
+        Returns a matrix rotating the position of a pose by the specified angle
+        :param theta: The rotation angle
+        :return: The rotation matrix
+        """
+        c, s = cos(theta), sin(theta)
+        return np.array([[c, -s, 0],
+                         [s, c, 0],
+                         [0, 0, 1]])
+
+    @staticmethod
+    def motion_jacobian(u, dt):
+        """
+        Returns the Jacobian of the noise-free motion of a single cycle with respect to the motion command
+        :param u: Motion command as a tuple of translational and angular velocities
+        :param dt: (Discrete) Time for which the motion command is executed
+        :return: Jacobian matrix of the relative motion with respect to translational and angular velocities
+        """
+        v, w = u[0, 0], u[1, 0]
+        # Use the limit of the circular arc for very small angular velocities to avoid numerical problems
+        if abs(w) < 1e-6:
+            return np.array([[dt, 0],
+                             [0, v * dt ** 2 / 2],
+                             [0, dt]])
+        s, c = sin(w * dt), cos(w * dt)
+        return np.array([[s / w, v * (dt * c / w - s / w ** 2)],
+                         [(1 - c) / w, v * (dt * s / w - (1 - c) / w ** 2)],
+                         [0, dt]])
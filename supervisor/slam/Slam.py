@@ -16,13 +16,66 @@ class Slam:
         """
         raise NotImplementedError()
 
+    def get_landmark_ids(self):
+        """
+        Returns ids of the estimated landmarks, in the same order as the landmark positions.
+        In contrast to the index of a landmark, its id does not change when other landmarks are removed.
+        By default, the ids are the indices of the landmarks.
+        """
+        return list(range(len(self.get_landmarks())))
+
+    def get_pose_covariance(self):
+        """
+        Returns the covariance of the estimated robot pose.
+        By default, the algorithm does not provide it.
+        """
+        return None
+
+    def get_landmark_covariances(self):
+        """
+        Returns the covariances of the estimated landmark positions, in the same order as the landmark positions.
+        By default, the algorithm does not provide them.
+        """
+        return None
+
+    def get_particles(self):
+        """
+        Returns the poses and the normalized importance factors of the particles of a particle filter.
+        By default, the algorithm does not provide them.
+        """
+        return None
+
+    def get_occupancy_grid(self):
+        """
+        Returns the occupancy grid mapped by the algorithm. By default, the algorithm does not map one.
+        """
+        return None
+
+    def get_statistics(self):
+        """
+        Returns statistics about the execution of the algorithm, which are exported together with its evaluation.
+        The statistics are numbers whose names do not change after the algorithm was created. By default, there are
+        none.
+        """
+        return {}
+
     def update(self, u, z):
         """
         Executes an update cycle of the SLAM algorithm
         :param u: motion command
-        :param z: List of measurements
+        :param z: List of measurements of the sensors that observed a landmark
         """
         raise NotImplementedError()
 
+    def get_algorithm_class(self):
+        """
+        Returns the class of the underlying SLAM algorithm.
+        Classes that only change how an algorithm is executed return the class of the algorithm they execute.
+        """
+        return type(self)
 
-
+    def stop(self):
+        """
+        Releases resources that are held to execute the algorithm, such as worker threads
+        """
+        pass
@@ -1,7 +1,17 @@
 from math import sqrt
+
+import numpy as np
+import yaml
 from matplotlib import pyplot as plt
 
+from models.Pose import Pose
 from supervisor.slam.EKFSlam import EKFSlam
+from utils.grid_index_util import GridIndex
+from utils.math_util import normalize_angle
+from utils.streaming_statistics_util import RunningStatistics, P2Quantile, DecimatedSeries
+
+# The quantiles of the trajectory errors that are estimated
+QUANTILES = [0.5, 0.95]
 
 
 class SlamEvaluation:
@@ -10,62 +20,124 @@ class SlamEvaluation:
         Initializes an object of the SlamEvaluation class
         :param slam: The slam algorithm that will be evaluated
         :param evaluation_cfg: The configurations for the class.
-                               Currently only used to calculate number of simulation cycles
         """
         self.slam = slam
         self.cfg = evaluation_cfg
-        self.average_distances = []
+        # The history of the average distances is decimated, so that its memory is bounded for long simulations
+        self.average_distances = DecimatedSeries(evaluation_cfg["max_plot_points"])
+        if issubclass(self.slam.get_algorithm_class(), EKFSlam):
+            self.name = "EKF SLAM"
+            self.filename = "ekf_slam_evaluation"
+        else:
+            self.name = "FastSLAM"
+            self.filename = "fast_slam_evaluation"
+        # Streaming estimators of the absolute trajectory error (ATE) and the relative pose error (RPE),
+        # each for the translational and the rotational part of the error
+        self.trajectory_errors = {
+            metric: (RunningStatistics(), [P2Quantile(p) for p in QUANTILES])
+            for metric in ["ate_translation", "ate_rotation", "rpe_translation", "rpe_rotation"]
+        }
+        # The actual and estimated poses of the previous evaluation, used to compute the relative pose error
+        self.previous_poses = None
+        # Spatial index over the centers of the actual obstacles, built once per map
+        self.obstacle_index = None
+        self.num_indexed_obstacles = 0
 
-    def evaluate(self, obstacles):
+    def evaluate(self, obstacles, robot_pose):
         """
         Evaluates the average distance of the estimated obstacle positions to the closest actual obstacle in the map.
-        The value is saved.
+        The value is saved. Additionally, the errors of the estimated robot pose are evaluated.
         :param obstacles: The list of actual obstacles of the map
+        :param robot_pose: The actual pose of the robot
+        """
+        self.__evaluate_trajectory(robot_pose)
+        # The obstacles are static, so the index only needs to be rebuilt if obstacles were added to the map
+        if self.obstacle_index is None or len(obstacles) != self.num_indexed_obstacles:
+            self.obstacle_index = GridIndex([obstacle.pose.vposition() for obstacle in obstacles])
+            self.num_indexed_obstacles = len(obstacles)
+        slam_obstacles = np.array(self.slam.get_landmarks(), dtype=np.float64).reshape(-1, 2)
+        if len(slam_obstacles) == 0:
+            self.average_distances.add(np.nan)
+            return
+        min_distances, _ = self.obstacle_index.nearest(slam_obstacles)
+        self.average_distances.add(np.mean(min_distances))
+
+    def export(self):
         """
-        slam_obstacles = self.slam.get_landmarks()
-        min_distances = [self.__find_min_distance(slam_obstacle, obstacles) for slam_obstacle in slam_obstacles]
-        self.average_distances.append(sum(min_distances) / len(min_distances))
+        Exports a summary of the trajectory errors and the execution statistics of the current simulation run
+        to a yaml file
+        """
+        summary = {}
+        for metric, (statistics, quantiles) in self.trajectory_errors.items():
+            summary[metric] = {
+                "count": statistics.count,
+                "mean": float(statistics.mean),
+                "std": float(statistics.std()),
+                "rmse": float(statistics.rmse()),
+                "min": float(statistics.min),
+                "max": float(statistics.max),
+            }
+            for p, quantile in zip(QUANTILES, quantiles):
+                summary[metric]["p" + str(int(p * 100))] = float(quantile.value())
+        with open(self.filename + ".yaml", 'w') as file:
+            yaml.safe_dump({"algorithm": self.name, "trajectory_errors": summary,
+                            "execution": self.slam.get_statistics()}, file, sort_keys=False)
 
-    def plot(self):
+    def get_plot_data(self):
+        """
+        Copies the history of the average distances, so that it can be plotted while the evaluation continues
+        :return: Tuple of the list of the simulation cycles and the list of the average distances
+        """
+        # Calculates number of simulation cycles that every stored value covers
+        cycles_per_value = self.average_distances.stride * self.cfg["interval"]
+        values = list(self.average_distances.values)
+        return list(range(0, len(values) * cycles_per_value, cycles_per_value)), values
+
+    def plot(self, plot_data=None):
         """
         Produces a plot of how the average distance changed over the course of the simulation.
         Saves the plot in a png file.
+        :param plot_data: The data returned by get_plot_data, None to plot the current data
         """
+        cycles, values = self.get_plot_data() if plot_data is None else plot_data
         fig, ax = plt.subplots()
-        # Calculates number of elapsed simulation cycles
-        sim_cycles = len(self.average_distances) * self.cfg["interval"]
-        ax.plot(range(0, sim_cycles, self.cfg["interval"]), self.average_distances)
+        ax.plot(cycles, values)
         ax.grid()
-        if isinstance(self.slam, EKFSlam):
-            ax.set(xlabel='Simulation cycles', ylabel='Average distance to true landmark in meters',
-                   title='Evaluation of EKF SLAM')
-            plt.savefig('ekf_slam_evaluation.png')
-        else:
-            ax.set(xlabel='Simulation cycles', ylabel='Average distance to true landmark in meters',
-                   title='Evaluation of FastSLAM')
-            plt.savefig('fast_slam_evaluation.png')
+        ax.set(xlabel='Simulation cycles', ylabel='Average distance to true landmark in meters',
+               title='Evaluation of ' + self.name)
+        plt.savefig(self.filename + '.png')
         ax.grid()
 
         plt.show()
 
-    def __find_min_distance(self, slam_obstacle, obstacles):
+    def __evaluate_trajectory(self, robot_pose):
         """
-        Finds the distance of the estimated obstacle to the the closest actual obstacle
-        :param slam_obstacle: An estimated obstacle position of a SLAM algorithm
-        :param obstacles: The list of actual obstacles in the map
-        :return: Distance of estimated obstacle to closest actual obstacle
+        Adds the absolute trajectory error and the relative pose error since the previous evaluation
+        to the streaming estimators
+        :param robot_pose: The actual pose of the robot
         """
-        squared_distances = [self.__calc_squared_distance(slam_obstacle, obstacle.pose.sunpack()) for obstacle in obstacles]
-        return sqrt(min(squared_distances))
+        estimated_pose = self.slam.get_estimated_pose()
+        self.__add_error("ate_translation", sqrt((estimated_pose.x - robot_pose.x) ** 2 +
+                                                 (estimated_pose.y - robot_pose.y) ** 2))
+        self.__add_error("ate_rotation", abs(normalize_angle(estimated_pose.theta - robot_pose.theta)))
+        if self.previous_poses is not None:
+            previous_robot_pose, previous_estimated_pose = self.previous_poses
+            # The motions since the previous evaluation, relative to the respective previous pose
+            actual_motion = robot_pose.transform_to(previous_robot_pose.inverse())
+            estimated_motion = estimated_pose.transform_to(previous_estimated_pose.inverse())
+            # The error between both motions, expressed relative to the actual motion
+            error = estimated_motion.transform_to(actual_motion.inverse())
+            self.__add_error("rpe_translation", sqrt(error.x ** 2 + error.y ** 2))
+            self.__add_error("rpe_rotation", abs(error.theta))
+        self.previous_poses = (Pose(*robot_pose.sunpack()), Pose(*estimated_pose.sunpack()))
 
-    @staticmethod
-    def __calc_squared_distance(x, y):
+    def __add_error(self, metric, error):
         """
-        Calculates squared distance between two positions.
-        The squared distance is sufficient for finding the minimum distance.
-        :param x: First position
-        :param y: Second position
-        :return: squared distance between the two positions
+        Adds an error to the streaming estimators of a metric
+        :param metric: The name of the metric
+        :param error: The error to be added
         """
-        diff = (x[0] - y[0], x[1] - y[1])
-        return diff[0] ** 2 + diff[1] ** 2
+        statistics, quantiles = self.trajectory_errors[metric]
+        statistics.add(error)
+        for quantile in quantiles:
+            quantile.add(error)
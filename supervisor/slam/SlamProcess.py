@@ -0,0 +1,327 @@
+"""
+Execution of a SLAM algorithm in a separate process.
+Motion commands and sensor readings are passed to the process through a shared memory ring buffer,
+while the process publishes its estimates to a shared memory output buffer. This allows multiple SLAM algorithms
+to be updated on separate cores without blocking the control loop.
+"""
+
+import multiprocessing
+import time
+
+import numpy as np
+
+from models.Pose import Pose
+from supervisor.slam.Slam import Slam
+
+# Maximum number of statistics of the algorithm that a process can publish to the simulator
+MAX_STATISTICS = 8
+
+
+class SlamProcessInterface:
+
+    def __init__(self, proximity_sensor_max_range, proximity_sensor_placements):
+        """
+        Initializes a SlamProcessInterface object.
+        It replaces the supervisor interface inside a SLAM process, where the supervisor is not available.
+        :param proximity_sensor_max_range: The maximum sensor range of the robots proximity sensors
+        :param proximity_sensor_placements: The placement poses of the robot's sensors
+        """
+        self.max_range = proximity_sensor_max_range
+        self.placements = proximity_sensor_placements
+
+    def proximity_sensor_placements(self):
+        """
+        :return: The placement poses of the robot's sensors
+        """
+        return self.placements
+
+    def proximity_sensor_max_range(self):
+        """
+        :return: The maximum sensor range of the robots proximity sensors
+        """
+        return self.max_range
+
+
+class SlamSharedMemory:
+
+    def __init__(self, context, queue_size, n_sensors, max_landmarks, pose_size):
+        """
+        Allocates the shared memory used to communicate with a SLAM process
+        :param context: The multiprocessing context
+        :param queue_size: Number of updates that the input ring buffer can hold
+        :param n_sensors: Maximum number of measurements of a single update
+        :param max_landmarks: Maximum number of landmarks that can be published
+        :param pose_size: Number of rows of the covariance of the robot pose, 0 if the algorithm does not provide it
+        """
+        self.queue_size = queue_size
+        self.n_sensors = n_sensors
+        self.max_landmarks = max_landmarks
+        self.pose_size = pose_size
+        # Input ring buffer, every slot holds a motion command and the measurements of a single update
+        self.input_data = context.RawArray('d', queue_size * (2 + 2 * n_sensors))
+        self.input_counts = context.RawArray('i', queue_size)
+        # Index of the oldest pending update, number of pending updates and running flag
+        self.input_state = context.RawArray('i', 3)
+        self.input_condition = context.Condition()
+        # Output buffer holding the robot pose, the landmark positions, the landmark ids, the covariance of the robot
+        # pose and the covariances of the landmark positions. The whole covariance matrix is not published, since
+        # copying it would take quadratic time and memory in the number of landmarks in every update.
+        self.output_data = context.RawArray('d', 3 + 7 * max_landmarks + pose_size ** 2)
+        # Number of published updates, number of published landmarks and whether landmark covariances are published
+        self.output_state = context.RawArray('i', 3)
+        # Values of the statistics of the algorithm. Their names are sent once through the pipe, when the process
+        # publishes its initial estimates.
+        self.output_statistics = context.RawArray('d', MAX_STATISTICS)
+        self.statistics_receiver, self.statistics_sender = context.Pipe(duplex=False)
+        self.output_lock = context.Lock()
+
+    def map(self):
+        """
+        Creates the NumPy views of the shared memory. Must be called in every process that accesses the memory.
+        """
+        input_data = np.frombuffer(self.input_data, dtype=np.float64)
+        self.input_u = input_data[:2 * self.queue_size].reshape(self.queue_size, 2)
+        self.input_z = input_data[2 * self.queue_size:].reshape(self.queue_size, self.n_sensors, 2)
+        output_data = np.frombuffer(self.output_data, dtype=np.float64)
+        self.output_pose = output_data[:3]
+        self.output_landmarks = output_data[3:3 + 2 * self.max_landmarks].reshape(self.max_landmarks, 2)
+        self.output_landmark_ids = output_data[3 + 2 * self.max_landmarks:3 + 3 * self.max_landmarks]
+        self.output_landmark_covariances = output_data[3 + 3 * self.max_landmarks:3 + 7 * self.max_landmarks]\
+            .reshape(self.max_landmarks, 2, 2)
+        self.output_pose_covariance = output_data[3 + 7 * self.max_landmarks:].reshape(self.pose_size,
+                                                                                      self.pose_size)
+        self.output_statistics_values = np.frombuffer(self.output_statistics, dtype=np.float64)
+
+    def __getstate__(self):
+        """
+        Excludes the NumPy views when passing the shared memory to another process
+        """
+        state = self.__dict__.copy()
+        for view in ["input_u", "input_z", "output_pose", "output_landmarks", "output_landmark_ids",
+                     "output_landmark_covariances", "output_pose_covariance", "output_statistics_values"]:
+            state.pop(view, None)
+        return state
+
+
+class SlamProcess(Slam):
+
+    def __init__(self, algorithm, interface, slam_cfg, step_time, n_sensors):
+        """
+        Creates a SlamProcess object and starts the process executing the SLAM algorithm
+        :param algorithm: The class of the SLAM algorithm, which is instantiated inside the process
+        :param interface: The interface that the algorithm uses instead of the supervisor interface
+        :param slam_cfg: The configuration for the SLAM algorithm
+        :param step_time: The discrete time that a single simulation cycle increments
+        :param n_sensors: The number of proximity sensors of the robot
+        """
+        self.algorithm = algorithm
+        execution_cfg = slam_cfg["execution"]
+        self.coalesce_odometry = execution_cfg["coalesce_odometry"]
+        pose_size = 0
+        if hasattr(algorithm, "get_covariances"):
+            pose_size = slam_cfg["robot_state_size"]
+        # Counts the updates that were merged or dropped because the process fell behind
+        self.num_coalesced = 0
+        self.num_dropped = 0
+
+        # The processes are spawned, so that they do not inherit the state of the GUI
+        context = multiprocessing.get_context("spawn")
+        self.memory = SlamSharedMemory(context, execution_cfg["queue_size"], n_sensors,
+                                       execution_cfg["max_landmarks"], pose_size)
+        self.memory.input_state[2] = 1  # running
+        self.process = context.Process(target=run_slam_process,
+                                       args=(algorithm, interface, slam_cfg, step_time, self.memory),
+                                       daemon=True)
+        self.process.start()
+        self.memory.map()
+        # Wait for the initial estimates, so that the getters never return the empty output buffer. This matches the
+        # SlamWorker, which publishes its initial estimates before it starts.
+        while self.memory.output_state[0] == 0:
+            if not self.process.is_alive():
+                raise Exception("SLAM process terminated before publishing its initial estimates")
+            time.sleep(0.001)
+        self.statistics_names = self.memory.statistics_receiver.recv()
+
+    def get_estimated_pose(self):
+        """
+        Returns the robot pose that was most recently published by the process
+        :return: Estimated robot pose consisting of position and angle
+        """
+        with self.memory.output_lock:
+            x, y, theta = self.memory.output_pose
+        return Pose(x, y, theta)
+
+    def get_landmarks(self):
+        """
+        Returns the landmark positions that were most recently published by the process
+        :return: List of estimated landmark positions
+        """
+        with self.memory.output_lock:
+            landmarks = self.memory.output_landmarks[:self.memory.output_state[1]].copy()
+        return [(x, y) for (x, y) in landmarks]
+
+    def get_landmark_ids(self):
+        """
+        Returns the ids of the landmarks that were most recently published by the process
+        :return: List of landmark ids
+        """
+        with self.memory.output_lock:
+            landmark_ids = self.memory.output_landmark_ids[:self.memory.output_state[1]].astype(np.int64)
+        return list(landmark_ids)
+
+    def get_covariances(self):
+        """
+        The whole covariance matrix is not published by the process
+        :return: None
+        """
+        return None
+
+    def get_pose_covariance(self):
+        """
+        Returns the covariance of the robot pose that was most recently published by the process
+        :return: Array of shape (3, 3) or None, if the algorithm does not provide it
+        """
+        if self.memory.pose_size == 0:
+            return None
+        with self.memory.output_lock:
+            return self.memory.output_pose_covariance.copy()
+
+    def get_landmark_covariances(self):
+        """
+        Returns the covariances of the landmark positions that were most recently published by the process
+        :return: Array of shape (n, 2, 2) or None, if the algorithm does not provide them
+        """
+        with self.memory.output_lock:
+            if not self.memory.output_state[2]:
+                return None
+            return self.memory.output_landmark_covariances[:self.memory.output_state[1]].copy()
+
+    def get_statistics(self):
+        """
+        Returns the statistics that the algorithm most recently published, together with the numbers of updates that
+        were merged or dropped because the process fell behind
+        :return: Dictionary of the statistics
+        """
+        with self.memory.output_lock:
+            values = self.memory.output_statistics_values[:len(self.statistics_names)].tolist()
+        statistics = dict(zip(self.statistics_names, values))
+        statistics.update(coalesced_updates=self.num_coalesced, dropped_updates=self.num_dropped)
+        return statistics
+
+    def get_algorithm_class(self):
+        """
+        Returns the class of the SLAM algorithm that is executed by the process
+        """
+        return self.algorithm
+
+    def update(self, u, z):
+        """
+        Writes an update of the SLAM algorithm into the input ring buffer without waiting for it to be executed.
+        A full buffer is handled as by the SlamWorker: Either the motion command of the newest pending update is
+        merged into the incoming one or the oldest pending update is dropped.
+        :param u: Motion command
+        :param z: List of measurements of the sensors that observed a landmark
+        """
+        z = list(z)
+        memory = self.memory
+        with memory.input_condition:
+            head, count = memory.input_state[0], memory.input_state[1]
+            if count >= memory.queue_size:
+                if self.coalesce_odometry:
+                    count -= 1
+                    u = memory.input_u[(head + count) % memory.queue_size].reshape(2, 1) + u
+                    self.num_coalesced += 1
+                else:
+                    head = (head + 1) % memory.queue_size
+                    count -= 1
+                    self.num_dropped += 1
+            slot = (head + count) % memory.queue_size
+            memory.input_u[slot] = u[:, 0]
+            memory.input_counts[slot] = len(z)
+            if len(z) > 0:
+                memory.input_z[slot, :len(z)] = z
+            memory.input_state[0] = head
+            memory.input_state[1] = count + 1
+            memory.input_condition.notify()
+
+    def stop(self):
+        """
+        Stops the process. Pending updates are discarded.
+        """
+        with self.memory.input_condition:
+            self.memory.input_state[2] = 0
+            self.memory.input_condition.notify()
+        self.process.join(timeout=1.0)
+        if self.process.is_alive():
+            self.process.terminate()
+        if self.num_coalesced > 0 or self.num_dropped > 0:
+            print("SLAM process fell behind: %d updates merged, %d updates dropped" %
+                  (self.num_coalesced, self.num_dropped))
+
+
+def run_slam_process(algorithm, interface, slam_cfg, step_time, memory):
+    """
+    Entry point of a SLAM process. Executes the updates written to the shared memory until the process is stopped.
+    :param algorithm: The class of the SLAM algorithm
+    :param interface: The interface that the algorithm uses instead of the supervisor interface
+    :param slam_cfg: The configuration for the SLAM algorithm
+    :param step_time: The discrete time that a single simulation cycle increments
+    :param memory: The shared memory used to communicate with the simulator
+    """
+    memory.map()
+    slam = algorithm(interface, slam_cfg, step_time=step_time)
+    # The names of the statistics do not change, so only their values are published with every update
+    statistics_names = list(slam.get_statistics())[:MAX_STATISTICS]
+    memory.statistics_sender.send(statistics_names)
+    publish_slam_estimates(slam, memory)
+    truncation_reported = False
+    while True:
+        with memory.input_condition:
+            while memory.input_state[2] and memory.input_state[1] == 0:
+                memory.input_condition.wait()
+            if not memory.input_state[2]:
+                break
+            slot = memory.input_state[0]
+            u = memory.input_u[slot].reshape(2, 1).copy()
+            z = [(distance, angle) for (distance, angle) in memory.input_z[slot, :memory.input_counts[slot]]]
+            memory.input_state[0] = (slot + 1) % memory.queue_size
+            memory.input_state[1] -= 1
+        slam.update(u, z)
+        num_landmarks = publish_slam_estimates(slam, memory)
+        if num_landmarks > memory.max_landmarks and not truncation_reported:
+            print("%s estimated %d landmarks, but only max_landmarks = %d are published to the simulator" %
+                  (algorithm.__name__, num_landmarks, memory.max_landmarks))
+            truncation_reported = True
+    slam.stop()
+
+
+def publish_slam_estimates(slam, memory):
+    """
+    Writes the current estimates of a SLAM algorithm to the shared memory.
+    Landmarks exceeding the capacity of the shared memory are not published.
+    :param slam: The SLAM algorithm
+    :param memory: The shared memory used to communicate with the simulator
+    :return: The number of estimated landmarks, including those that were not published
+    """
+    pose = slam.get_estimated_pose()
+    landmarks = np.array(slam.get_landmarks(), dtype=np.float64).reshape(-1, 2)
+    num_landmarks = len(landmarks)
+    landmarks = landmarks[:memory.max_landmarks]
+    n_lm = len(landmarks)
+    landmark_ids = slam.get_landmark_ids()[:n_lm]
+    pose_covariance = slam.get_pose_covariance() if memory.pose_size > 0 else None
+    landmark_covariances = slam.get_landmark_covariances()
+    statistics = list(slam.get_statistics().values())[:MAX_STATISTICS]
+    with memory.output_lock:
+        memory.output_pose[:] = pose.sunpack()
+        memory.output_landmarks[:n_lm] = landmarks
+        memory.output_landmark_ids[:n_lm] = landmark_ids
+        if pose_covariance is not None:
+            memory.output_pose_covariance[:] = pose_covariance
+        if landmark_covariances is not None:
+            memory.output_landmark_covariances[:n_lm] = landmark_covariances[:n_lm]
+        memory.output_statistics_values[:len(statistics)] = statistics
+        memory.output_state[0] += 1
+        memory.output_state[1] = n_lm
+        memory.output_state[2] = landmark_covariances is not None
+    return num_landmarks
@@ -0,0 +1,213 @@
+"""
+Asynchronous execution of a SLAM algorithm.
+The algorithm is updated in a dedicated worker thread, so that a slow update does not block the control loop.
+"""
+
+import threading
+from collections import deque
+
+from supervisor.slam.Slam import Slam
+
+
+class SlamWorker(Slam):
+
+    def __init__(self, slam, execution_cfg):
+        """
+        Creates a SlamWorker object and starts its worker thread
+        :param slam: The SLAM algorithm that is updated by the worker
+        :param execution_cfg: The configuration of the SLAM execution
+        """
+        self.slam = slam
+        self.queue_size = execution_cfg["queue_size"]
+        self.coalesce_odometry = execution_cfg["coalesce_odometry"]
+        # Pending updates, each consisting of a motion command and a list of measurements
+        self.pending = deque()
+        self.condition = threading.Condition()
+        # Held while the algorithm is updated, so that the whole covariance matrix can be copied on demand
+        self.update_lock = threading.Lock()
+        self.running = True
+        # Counts the updates that were merged or dropped because the worker fell behind
+        self.num_coalesced = 0
+        self.num_dropped = 0
+        # The latest estimates published by the worker
+        self.lock = threading.Lock()
+        self.estimated_pose = None
+        self.landmarks = None
+        self.landmark_ids = None
+        self.pose_covariance = None
+        self.landmark_covariances = None
+        self.particles = None
+        self.statistics = None
+        self.occupancy_grid = None
+        self.__publish()
+
+        self.thread = threading.Thread(target=self.__run, daemon=True)
+        self.thread.start()
+
+    def get_estimated_pose(self):
+        """
+        Returns the robot pose that was most recently estimated by the worker
+        :return: Estimated robot pose consisting of position and angle
+        """
+        with self.lock:
+            return self.estimated_pose
+
+    def get_landmarks(self):
+        """
+        Returns the landmark positions that were most recently estimated by the worker
+        :return: List of estimated landmark positions
+        """
+        with self.lock:
+            return self.landmarks
+
+    def get_landmark_ids(self):
+        """
+        Returns the ids of the landmarks that were most recently estimated by the worker
+        :return: List of landmark ids
+        """
+        with self.lock:
+            return self.landmark_ids
+
+    def get_covariances(self):
+        """
+        Copies the whole covariance matrix, waiting for the update that the worker is currently executing
+        :return: Covariance matrix as a NumPy matrix or None, if the algorithm does not provide one
+        """
+        if not hasattr(self.slam, "get_covariances"):
+            return None
+        with self.update_lock:
+            return self.slam.get_covariances()
+
+    def get_pose_covariance(self):
+        """
+        Returns the covariance of the robot pose that was most recently estimated by the worker
+        :return: Array of shape (3, 3) or None, if the algorithm does not provide it
+        """
+        with self.lock:
+            return self.pose_covariance
+
+    def get_landmark_covariances(self):
+        """
+        Returns the covariances of the landmark positions that were most recently estimated by the worker
+        :return: Array of shape (n, 2, 2) or None, if the algorithm does not provide them
+        """
+        with self.lock:
+            return self.landmark_covariances
+
+    def get_particles(self):
+        """
+        Returns the particles that were most recently estimated by the worker
+        :return: Tuple of the poses and the normalized importance factors of the particles or None, if the algorithm
+                 does not provide them
+        """
+        with self.lock:
+            return self.particles
+
+    def get_occupancy_grid(self):
+        """
+        Returns the occupancy grid that was most recently mapped by the worker
+        :return: The occupancy grid or None, if the algorithm does not map one
+        """
+        with self.lock:
+            return self.occupancy_grid
+
+    def get_statistics(self):
+        """
+        Returns the statistics that the algorithm most recently published, together with the numbers of updates that
+        were merged or dropped because the worker fell behind
+        :return: Dictionary of the statistics
+        """
+        with self.lock:
+            statistics = dict(self.statistics)
+        statistics.update(coalesced_updates=self.num_coalesced, dropped_updates=self.num_dropped)
+        return statistics
+
+    def get_algorithm_class(self):
+        """
+        Returns the class of the SLAM algorithm that is updated by the worker
+        """
+        return self.slam.get_algorithm_class()
+
+    def update(self, u, z):
+        """
+        Queues an update of the SLAM algorithm without waiting for it to be executed.
+        If the queue is full, the worker has fallen behind. Then either the newest pending update is merged into
+        the incoming one or, if coalescing is disabled, the oldest pending update is dropped.
+        Merging sums up both motion commands, executed during a single step time. This is only exact for the noise-free
+        motion model if both commands are equal, since the arc then only depends on the products of the velocities with
+        the step time. For different commands, it is a first-order approximation of the two consecutive arcs.
+        The measurements of the pending update were taken at an outdated pose and are discarded.
+        :param u: Motion command
+        :param z: List of measurements of the sensors that observed a landmark
+        """
+        z = list(z)
+        with self.condition:
+            if len(self.pending) >= self.queue_size:
+                if self.coalesce_odometry:
+                    pending_u, _ = self.pending.pop()
+                    u = pending_u + u
+                    self.num_coalesced += 1
+                else:
+                    self.pending.popleft()
+                    self.num_dropped += 1
+            self.pending.append((u, z))
+            self.condition.notify()
+
+    def stop(self):
+        """
+        Stops the worker thread. Pending updates are discarded.
+        """
+        with self.condition:
+            self.running = False
+            self.pending.clear()
+            self.condition.notify()
+        self.thread.join()
+        self.slam.stop()
+        if self.num_coalesced > 0 or self.num_dropped > 0:
+            print("SLAM worker fell behind: %d updates merged, %d updates dropped" %
+                  (self.num_coalesced, self.num_dropped))
+
+    def __run(self):
+        """
+        Executes the queued updates until the worker is stopped
+        """
+        while True:
+            with self.condition:
+                while self.running and len(self.pending) == 0:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                u, z = self.pending.popleft()
+            with self.update_lock:
+                self.slam.update(u, z)
+                self.__publish()
+
+    def __publish(self):
+        """
+        Publishes the current estimates of the SLAM algorithm
+        """
+        estimated_pose = self.slam.get_estimated_pose()
+        # Copy the landmark positions, since they may be views of the algorithm's state
+        landmarks = [(float(x), float(y)) for (x, y) in self.slam.get_landmarks()]
+        landmark_ids = list(self.slam.get_landmark_ids())
+        # Only the blocks that are drawn every frame are published, not the whole covariance matrix
+        pose_covariance = self.slam.get_pose_covariance()
+        landmark_covariances = self.slam.get_landmark_covariances()
+        if landmark_covariances is not None:
+            landmark_covariances = landmark_covariances.copy()
+        # The particle arrays are created anew by every call, so they do not need to be copied
+        particles = self.slam.get_particles()
+        statistics = self.slam.get_statistics()
+        # The tiles of the grid are modified in place by the following updates, so none of them is shared
+        occupancy_grid = self.slam.get_occupancy_grid()
+        if occupancy_grid is not None:
+            occupancy_grid = occupancy_grid.detached_copy()
+        with self.lock:
+            self.estimated_pose = estimated_pose
+            self.landmarks = landmarks
+            self.landmark_ids = landmark_ids
+            self.pose_covariance = pose_covariance
+            self.landmark_covariances = landmark_covariances
+            self.particles = particles
+            self.statistics = statistics
+            self.occupancy_grid = occupancy_grid
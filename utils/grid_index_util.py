@@ -0,0 +1,100 @@
+import numpy as np
+
+
+class GridIndex:
+
+    def __init__(self, points, cell_size=None):
+        """
+        Initializes a GridIndex object, a uniform grid over a static set of points supporting vectorized queries.
+        Every grid cell holds the indices of the points lying inside of it.
+        :param points: Array of shape (n, 2) holding the positions of the indexed points
+        :param cell_size: Side length of a grid cell in meters.
+                          By default, it is chosen so that a cell contains a single point on average.
+        """
+        self.points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        n = len(self.points)
+        if n == 0:
+            self.origin = np.zeros(2)
+            self.cell_size = 1.0 if cell_size is None else cell_size
+            self.cells = -np.ones((1, 1, 1), dtype=np.int64)
+            return
+        self.origin = self.points.min(axis=0)
+        extent = self.points.max(axis=0) - self.origin
+        if cell_size is None:
+            cell_size = max(np.sqrt(max(extent[0], 1e-3) * max(extent[1], 1e-3) / n), 1e-3)
+        self.cell_size = cell_size
+        shape = (extent // cell_size).astype(np.int64) + 1
+        cell_ids = self.__cell_coordinates(self.points, shape)
+        flat_ids = cell_ids[:, 0] * shape[1] + cell_ids[:, 1]
+        # Sort the points by cell to determine the rank of every point inside its cell
+        order = np.argsort(flat_ids, kind='stable')
+        sorted_ids = flat_ids[order]
+        first = np.searchsorted(sorted_ids, sorted_ids, side='left')
+        rank = np.arange(n) - first
+        # Dense table of cells, padded with -1 up to the maximum number of points inside a single cell
+        self.cells = -np.ones((shape[0], shape[1], rank.max() + 1), dtype=np.int64)
+        self.cells[cell_ids[order, 0], cell_ids[order, 1], rank] = order
+
+    def nearest(self, queries):
+        """
+        Finds the nearest indexed point of every query position.
+        Only the 3x3 cells surrounding a query are searched. If no point is found within the distance of one cell,
+        which guarantees that no closer point lies outside of these cells, all points are searched instead.
+        :param queries: Array of shape (m, 2) holding the query positions
+        :return: Distances to the nearest points and indices of the nearest points, as arrays of length m
+        """
+        queries = np.asarray(queries, dtype=np.float64).reshape(-1, 2)
+        m = len(queries)
+        if m == 0 or len(self.points) == 0:
+            return np.full(m, np.inf), -np.ones(m, dtype=np.int64)
+        # Gather the candidates of the 3x3 cells surrounding every query
+        cell_ids = self.__cell_coordinates(queries, self.cells.shape[:2])
+        offsets = np.array([[dx, dy] for dx in (-1, 0, 1) for dy in (-1, 0, 1)])
+        neighbour_ids = cell_ids[:, np.newaxis, :] + offsets[np.newaxis, :, :]
+        shape = np.array(self.cells.shape[:2])
+        valid = np.all((neighbour_ids >= 0) & (neighbour_ids < shape), axis=2)
+        neighbour_ids = np.clip(neighbour_ids, 0, shape - 1)
+        candidates = self.cells[neighbour_ids[:, :, 0], neighbour_ids[:, :, 1]]
+        candidates[~valid] = -1
+        candidates = candidates.reshape(m, -1)
+        deltas = self.points[candidates] - queries[:, np.newaxis, :]
+        squared_distances = np.where(candidates >= 0, np.sum(deltas ** 2, axis=2), np.inf)
+        best = np.argmin(squared_distances, axis=1)
+        distances = np.sqrt(squared_distances[np.arange(m), best])
+        indices = candidates[np.arange(m), best]
+        # Fall back to a search of all points for queries that are far away from all points
+        uncertain = distances > self.cell_size
+        if np.any(uncertain):
+            all_distances = np.sum((queries[uncertain, np.newaxis, :] - self.points[np.newaxis, :, :]) ** 2, axis=2)
+            indices[uncertain] = np.argmin(all_distances, axis=1)
+            distances[uncertain] = np.sqrt(np.min(all_distances, axis=1))
+        return distances, indices
+
+    def within(self, lower, upper):
+        """
+        Finds the indexed points inside of an axis-aligned rectangle. Only the cells overlapping the rectangle are
+        searched.
+        :param lower: The lower left corner of the rectangle
+        :param upper: The upper right corner of the rectangle
+        :return: Increasing array of the indices of the points inside of the rectangle
+        """
+        if len(self.points) == 0:
+            return np.zeros(0, dtype=np.int64)
+        lower = np.asarray(lower, dtype=np.float64)
+        upper = np.asarray(upper, dtype=np.float64)
+        corners = self.__cell_coordinates(np.vstack((lower, upper)), self.cells.shape[:2])
+        candidates = self.cells[corners[0, 0]:corners[1, 0] + 1, corners[0, 1]:corners[1, 1] + 1].ravel()
+        candidates = candidates[candidates >= 0]
+        points = self.points[candidates]
+        inside = np.all((points >= lower) & (points <= upper), axis=1)
+        return np.sort(candidates[inside])
+
+    def __cell_coordinates(self, positions, shape):
+        """
+        Returns the grid cell coordinates of positions, clipped to the cells of the grid
+        :param positions: Array of shape (n, 2)
+        :param shape: Number of grid cells along both axes
+        :return: Integer array of shape (n, 2)
+        """
+        cell_ids = np.floor((positions - self.origin) / self.cell_size).astype(np.int64)
+        return np.clip(cell_ids, 0, np.array(shape) - 1)
@@ -0,0 +1,179 @@
+from math import sqrt, nan, isnan
+
+
+class RunningStatistics:
+
+    def __init__(self):
+        """
+        Initializes a RunningStatistics object, which summarizes a stream of values using constant memory
+        """
+        self.count = 0
+        self.mean = 0.0
+        # Sum of squared differences from the mean, see Welford's algorithm
+        self.m2 = 0.0
+        self.sum_of_squares = 0.0
+        self.min = nan
+        self.max = nan
+
+    def add(self, value):
+        """
+        Adds a value to the summary
+        :param value: The value to be added
+        """
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.sum_of_squares += value ** 2
+        self.min = value if self.count == 1 else min(self.min, value)
+        self.max = value if self.count == 1 else max(self.max, value)
+
+    def std(self):
+        """
+        :return: The standard deviation of the added values
+        """
+        return sqrt(self.m2 / self.count) if self.count > 0 else nan
+
+    def rmse(self):
+        """
+        :return: The root of the mean of the squared values, which is the RMSE if the values are errors
+        """
+        return sqrt(self.sum_of_squares / self.count) if self.count > 0 else nan
+
+
+class P2Quantile:
+
+    def __init__(self, p):
+        """
+        Initializes a P2Quantile object, which estimates a quantile of a stream of values using constant memory.
+        Implements the P-square algorithm of Jain and Chlamtac, which tracks five markers whose heights approximate
+        the minimum, the p/2-, p- and (1+p)/2-quantiles and the maximum.
+        :param p: The quantile to be estimated, between 0 and 1
+        """
+        self.p = p
+        self.count = 0
+        self.heights = []
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired_positions = [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]
+        self.increments = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def add(self, value):
+        """
+        Adds a value to the stream
+        :param value: The value to be added
+        """
+        self.count += 1
+        if self.count <= 5:
+            self.heights.append(value)
+            self.heights.sort()
+            return
+        q, n = self.heights, self.positions
+        # Find the cell k containing the value and adjust the extreme markers
+        if value < q[0]:
+            q[0] = value
+            k = 0
+        elif value >= q[4]:
+            q[4] = value
+            k = 3
+        else:
+            k = 0
+            while value >= q[k + 1]:
+                k += 1
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired_positions[i] += self.increments[i]
+        # Adjust the heights of the middle markers if they are off their desired positions
+        for i in range(1, 4):
+            d = self.desired_positions[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                height = self.__parabolic(i, d)
+                if not q[i - 1] < height < q[i + 1]:
+                    height = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = height
+                n[i] += d
+
+    def value(self):
+        """
+        :return: The current estimate of the quantile
+        """
+        if self.count == 0:
+            return nan
+        if self.count <= 5:
+            return self.heights[min(int(self.p * self.count), self.count - 1)]
+        return self.heights[2]
+
+    def __parabolic(self, i, d):
+        """
+        Computes the piecewise-parabolic prediction of the height of a marker moved by one position
+        :param i: Index of the marker
+        :param d: Direction of the movement, either 1 or -1
+        :return: Predicted height of the marker
+        """
+        q, n = self.heights, self.positions
+        return q[i] + d / (n[i + 1] - n[i - 1]) * ((n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i]) +
+                                                   (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+
+
+class DecimatedSeries:
+
+    def __init__(self, capacity):
+        """
+        Initializes a DecimatedSeries object, which stores a time series using bounded memory.
+        Once the capacity is reached, pairs of neighbouring values are averaged, halving the time resolution.
+        Missing values, given as NaN, are left out of the averages, so a stored value is only NaN if all the values
+        that it summarizes are missing.
+        :param capacity: The maximum number of stored values, must be even
+        """
+        self.capacity = capacity
+        self.values = []
+        # Number of values that are not missing among those that every stored value summarizes
+        self.counts = []
+        # Number of original values that every stored value summarizes
+        self.stride = 1
+        # Values that are averaged into the next stored value
+        self.pending_sum = 0.0
+        self.pending_valid = 0
+        self.pending_count = 0
+
+    def add(self, value):
+        """
+        Adds a value to the series
+        :param value: The value to be added, NaN if it is missing
+        """
+        if not isnan(value):
+            self.pending_sum += value
+            self.pending_valid += 1
+        self.pending_count += 1
+        if self.pending_count < self.stride:
+            return
+        self.values.append(self.pending_sum / self.pending_valid if self.pending_valid > 0 else nan)
+        self.counts.append(self.pending_valid)
+        self.pending_sum = 0.0
+        self.pending_valid = 0
+        self.pending_count = 0
+        if len(self.values) >= self.capacity:
+            merged = [self.__merge(a, count_a, b, count_b) for (a, count_a, b, count_b) in
+                      zip(self.values[::2], self.counts[::2], self.values[1::2], self.counts[1::2])]
+            self.values = [value for (value, _) in merged]
+            self.counts = [count for (_, count) in merged]
+            self.stride *= 2
+
+    def __len__(self):
+        return len(self.values)
+
+    @staticmethod
+    def __merge(a, count_a, b, count_b):
+        """
+        Averages two neighbouring stored values, weighted by the number of values that are not missing
+        :param a: The first stored value
+        :param count_a: The number of values that are not missing in the first stored value
+        :param b: The second stored value
+        :param count_b: The number of values that are not missing in the second stored value
+        :return: Tuple of the average and the number of values that are not missing in it
+        """
+        count = count_a + count_b
+        if count == 0:
+            return nan, 0
+        return ((a * count_a if count_a > 0 else 0.0) + (b * count_b if count_b > 0 else 0.0)) / count, count